@@ -1,33 +1,56 @@
 import os
-import sys
 import tempfile
 import uuid
 import json
 import time
 import re
+import math
+import asyncio
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Callable, Optional, List, Dict, Any
 import shutil
+import threading
+import zipfile
+import glob
+from contextlib import asynccontextmanager
 
 import numpy as np
 import torch
 import torchaudio
-from fastapi import FastAPI, HTTPException, Form, Response, File, UploadFile, Body, Request, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Form, Response, File, UploadFile, Body, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 import ffmpeg  # 用于音频格式转换
 from enum import Enum
 
-# 添加CosyVoice路径
-COSYVOICE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "moshengAI_tts/CosyVoice")
-sys.path.append(COSYVOICE_PATH)
-sys.path.append(os.path.join(COSYVOICE_PATH, "third_party/Matcha-TTS"))
+from tts_service.autotune import SegmentTuner
+from tts_service.engine import load_model, load_wav, supports_speaker_cache
+from tts_service.events import FINAL_STATES, TaskEventBus, format_sse
+from tts_service.longform import IncrementalWavWriter
+from tts_service.metrics import CANCELLED_SEGMENTS, EVENT_STREAMS, TASKS_TOTAL, ServiceCollector, StageTimer
+from tts_service.monitoring import EventLoopLagMonitor
+from tts_service.profiler import PROFILER, create_profiler_router
+from tts_service.prompts import PromptCache
+from tts_service.ratelimit import RateLimiter
+from tts_service.renditions import AUDIO_FORMATS, AudioFormat, RenditionCache, negotiate_format, parse_byte_range
+from tts_service.voice_samples import build_voice_samples, load_manifest
+from tts_service.scheduler import (
+    PRIORITY_RANK, FairShareQueue, Job, JobCancelled, current_job, raise_if_cancelled, start_workers
+)
+from tts_service.singleflight import Flight, SingleFlight
 
-# 导入CosyVoice
-from cosyvoice.cli.cosyvoice import CosyVoice2
-from cosyvoice.utils.file_utils import load_wav
+try:
+    import jwt  # 用于从认证令牌中识别用户（可选）
+except ImportError:
+    jwt = None
+
+# CosyVoice源码路径
+COSYVOICE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "moshengAI_tts/CosyVoice")
+# 模型后端: cosyvoice（默认）或 stub（无GPU压测用的桩模型）
+TTS_MODEL_BACKEND = os.environ.get("TTS_MODEL_BACKEND", "cosyvoice")
 
 # 创建输出目录
 OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "output")
@@ -44,8 +67,36 @@ os.makedirs(STATIC_DIR, exist_ok=True)
 # 定义声音类型目录
 VOICE_TYPES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompt_voice")
 
+# 音色试听样本目录（由 tts_service.voice_samples 构建）
+VOICE_SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "voice_samples")
+os.makedirs(VOICE_SAMPLES_DIR, exist_ok=True)
+
+# 服务启动状态: 模型和音色库在后台加载，/ready 据此判断是否可以接收合成流量
+SERVICE_STATE: Dict[str, Dict[str, Any]] = {
+    "model": {"status": "pending", "stage": None, "error": None, "load_seconds": None},
+    "voice_catalog": {"status": "pending", "voices": 0, "error": None},
+    "warm_up": {"status": "pending", "seconds": None, "inference_seconds": {}, "voices": [], "error": None},
+    "voice_samples": {"status": "pending", "error": None},
+}
+MODEL_READY = threading.Event()
+
+# 语音合成模型，由启动任务加载
+cosyvoice = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """启动时在后台加载模型和音色库，端口立即开始监听"""
+    LOOP_LAG_MONITOR.start()
+    loader = asyncio.create_task(_load_service_resources())
+    yield
+    loader.cancel()
+    SYNTHESIS_QUEUE.close()
+    LOOP_LAG_MONITOR.stop()
+
+
 # 创建FastAPI应用
-app = FastAPI(title="魔声AI语音合成API", description="基于CosyVoice2的语音合成API")
+app = FastAPI(title="魔声AI语音合成API", description="基于CosyVoice2的语音合成API", lifespan=lifespan)
 
 # 添加CORS中间件
 app.add_middleware(
@@ -56,35 +107,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 按需采样分析接口（需配置 TTS_ADMIN_TOKEN）
+app.include_router(create_profiler_router("TTS_ADMIN_TOKEN"))
+
+
+@app.middleware("http")
+async def notify_profiler(request: Request, call_next):
+    """分析会话按路由统计请求数时，在请求结束后通知分析器"""
+    response = await call_next(request)
+    PROFILER.request_finished(request.url.path)
+    return response
+
 # 挂载静态文件
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
-# 挂载输出目录为静态资源
-app.mount("/output", StaticFiles(directory=OUTPUT_DIR), name="output")
-app.mount("/client_output", StaticFiles(directory=CLIENT_OUTPUT_DIR), name="client_output")
+# 输出目录由 /output 和 /client_output 接口提供下载（支持格式转换）
 app.mount("/prompt_voice", StaticFiles(directory=VOICE_TYPES_DIR), name="prompt_voice")
 
-# 加载模型
-print("正在加载CosyVoice2模型...")
-model_path = os.path.join(COSYVOICE_PATH, "pretrained_models/CosyVoice2-0.5B")
-cosyvoice = CosyVoice2(model_path, load_jit=False, load_trt=False, fp16=False)
-print("模型加载成功！")
-
-# 加载示例音频作为提示
-# PROMPT_PATH = os.path.join(COSYVOICE_PATH, "asset/zero_shot_prompt.wav")
-# PROMPT_PATH = os.path.join(COSYVOICE_PATH, "asset/quanyoujiaju.wav") # 全友家居年货节，家具买一万送8999元，定制衣柜、整体橱柜，沙发，床垫，软床，成品家具，一站式购齐，地址:南屏首座二楼永辉超市楼上，全友家居。电话18859826481
-# PROMPT_PATH = os.path.join(COSYVOICE_PATH, "asset/qiaodantiyu.mp3") #乔丹体育盛大开业，全场鞋服四折起，精选款运动鞋买一送一，进店选购更有好礼相送！
-PROMPT_PATH = os.path.join(COSYVOICE_PATH, "asset/haoa.mp3") # 好啊，没想到你还真能把我造出来，欢迎加入欧比组织，谱姈，这是命令，好了，亲爱的，别伤心了，来抱一抱，好了，亲爱的，别伤心了，来抱一抱
-PROMPT_PATH = os.path.join(COSYVOICE_PATH, "asset/pijiu.mp3") # 津喜熊猫鲜酿啤酒，全粮、山泉水精酿，全程低温0一4℃保存冰爽口感，精酿中的劳斯莱斯，零添加更健康，多元化口味刚好微醺，多元化口味刚好微醺
-# PROMPT_PATH = os.path.join(COSYVOICE_PATH, "asset/toulan_26s.mp3") # Please select your corresponding gray color according to the screen color distribution, You can get points by stepping on your own color square.When the red bomb appears, you can step on your own color square first, and then activate the bomb to eliminate the opponent's color square. Note that the color square eliminated by the bomb will deduct the corresponding score.
-
-if os.path.exists(PROMPT_PATH):
-    prompt_speech_16k = load_wav(PROMPT_PATH, 16000)
-    print(f"已加载提示音频: {PROMPT_PATH}")
-else:
-    print(f"警告: 提示音频文件不存在: {PROMPT_PATH}")
-    # 创建一个空的提示音频
-    prompt_speech_16k = torch.zeros(16000)
-
 # 定义长文本阈值和分割参数
 MAX_TEXT_LENGTH = 100  # 每段最大字符数
 # 中文分割符号
@@ -291,9 +329,47 @@ def split_english_text(text: str, max_length: int) -> List[str]:
     
     return segments
 
+# 分段长度自动调优：按实测的单段推理耗时选择分段长度，未开启时固定为 MAX_TEXT_LENGTH
+SEGMENT_AUTOTUNE = os.environ.get("TTS_SEGMENT_AUTOTUNE", "0") == "1"
+# 按首段延迟优化的任务类别，其余类别按吞吐量优化
+SEGMENT_LATENCY_CLASSES = set(os.environ.get("TTS_SEGMENT_LATENCY_CLASSES", "interactive").split(","))
+SEGMENT_TUNER = SegmentTuner(
+    MAX_TEXT_LENGTH,
+    min_length=int(os.environ.get("TTS_SEGMENT_MIN_CHARS", "20")),
+    max_length=int(os.environ.get("TTS_SEGMENT_MAX_CHARS", "150")),
+    first_segment_seconds=float(os.environ.get("TTS_SEGMENT_FIRST_SECONDS", "1.5")),
+    min_samples=int(os.environ.get("TTS_SEGMENT_MIN_SAMPLES", "30")),
+    # 样本文件：启动时读入，之后追加记录，可用 python -m tts_service.autotune report 生成报告
+    samples_path=os.environ.get("TTS_SEGMENT_SAMPLES_FILE") or None,
+)
+
+
+def split_text_for(text: str, priority: str) -> List[str]:
+    """
+    按任务的优先级类别分割文本
+
+    开启分段自动调优时，首段延迟优先的类别（默认交互试听）先切出一个推理耗时不超过目标的首段，
+    其余分段按吞吐量最高的长度分割；其他类别全部按吞吐量最高的长度分割。未开启时等同 split_text
+
+    Args:
+        text: 要分割的文本
+        priority: 任务的优先级类别
+
+    Returns:
+        分割后的文本段落列表
+    """
+    if not SEGMENT_AUTOTUNE:
+        return split_text(text)
+    budgets = SEGMENT_TUNER.budgets("zh" if is_chinese_text(text) else "en")
+    if priority not in SEGMENT_LATENCY_CLASSES or budgets["first_segment"] >= budgets["throughput"]:
+        return split_text(text, budgets["throughput"])
+    first = split_text(text, budgets["first_segment"])[0]
+    rest = text[len(first):].lstrip()
+    return [first] + (split_text(rest, budgets["throughput"]) if rest else [])
+
 def concatenate_audio(audio_files: List[str], output_path: str):
     """
-    拼接多个音频文件
+    拼接多个音频文件：逐个读取分段追加写入输出文件，内存中只有一个分段，与总时长无关
     
     Args:
         audio_files: 音频文件路径列表
@@ -307,23 +383,18 @@ def concatenate_audio(audio_files: List[str], output_path: str):
         shutil.copy(audio_files[0], output_path)
         return output_path
     
-    # 加载所有音频文件
-    waveforms = []
-    sample_rate = None
-    
-    for audio_file in audio_files:
-        waveform, sr = torchaudio.load(audio_file)
-        waveforms.append(waveform)
-        if sample_rate is None:
-            sample_rate = sr
-        elif sr != sample_rate:
-            raise ValueError(f"音频采样率不一致: {sr} != {sample_rate}")
-    
-    # 拼接所有音频
-    concatenated = torch.cat(waveforms, dim=1)
-    
-    # 保存拼接后的音频
-    torchaudio.save(output_path, concatenated, sample_rate)
+    writer = None
+    try:
+        for audio_file in audio_files:
+            waveform, sr = torchaudio.load(audio_file)
+            if writer is None:
+                writer = IncrementalWavWriter(output_path, sr, channels=waveform.shape[0])
+            elif sr != writer.sample_rate:
+                raise ValueError(f"音频采样率不一致: {sr} != {writer.sample_rate}")
+            writer.write(waveform)
+    finally:
+        if writer is not None:
+            writer.close()
     
     return output_path
 
@@ -337,7 +408,8 @@ def convert_wav_to_mp3(wav_path: str, bitrate: str = "256k") -> str:
     Returns:
         MP3文件路径
     """
-    mp3_path = wav_path.replace(".wav", ".mp3")
+    # 只替换扩展名，目录名或文件名中间出现的 ".wav" 保持不变
+    mp3_path = os.path.splitext(wav_path)[0] + ".mp3"
     
     # 使用ffmpeg进行转换
     try:
@@ -353,6 +425,31 @@ def convert_wav_to_mp3(wav_path: str, bitrate: str = "256k") -> str:
         print(f"转换音频格式失败: {str(e)}")
         raise e
 
+def transcode_audio(source_path: str, target_path: str, audio_format: AudioFormat):
+    """将音频文件转码为指定格式
+
+    Args:
+        source_path: 源文件路径
+        target_path: 目标文件路径
+        audio_format: 目标格式（编码、码率、封装）
+    """
+    options: Dict[str, Any] = {"format": audio_format.container}
+    if audio_format.codec:
+        options["acodec"] = audio_format.codec
+    if audio_format.bitrate:
+        options["audio_bitrate"] = audio_format.bitrate
+    if audio_format.sample_rate:
+        options["ar"] = audio_format.sample_rate
+    if audio_format.container == "ipod":
+        # moov 放到文件开头，客户端下载到一部分就能开始播放
+        options["movflags"] = "+faststart"
+    try:
+        ffmpeg.input(source_path).output(target_path, **options).run(quiet=True, overwrite_output=True)
+        print(f"已将 {source_path} 转码为 {target_path}")
+    except Exception as e:
+        print(f"转码音频失败: {str(e)}")
+        raise e
+
 def get_voice_types() -> Dict[str, List[str]]:
     """
     获取所有可用的声音类型
@@ -425,18 +522,256 @@ def load_voice_prompt(voice_path: str, text_path: str) -> tuple[torch.Tensor, st
     
     return prompt_speech_16k, prompt_text
 
+# 音色提示缓存，按音频路径缓存加载好的提示音频和文本
+PROMPT_CACHE = PromptCache(load_voice_prompt, max_entries=int(os.environ.get("TTS_PROMPT_CACHE_SIZE", "64")))
+
+# 已在模型中注册过特征的音色（CosyVoice2 支持时，省去每段重复提取提示特征）
+REGISTERED_SPEAKERS: set = set()
+SPEAKER_LOCK = threading.Lock()
+SPEAKER_CACHE_STATS = {"hits": 0, "misses": 0}
+
+
+def get_speaker_id(voice_path: str, prompt_text: str, prompt_speech_16k: torch.Tensor) -> str:
+    """
+    返回音色在模型中注册的特征ID，首次使用时注册
+
+    Returns:
+        str: 音色特征ID；模型不支持特征缓存时返回空字符串
+    """
+    if not supports_speaker_cache(cosyvoice):
+        return ""
+    spk_id = os.path.relpath(voice_path, VOICE_TYPES_DIR)
+    with SPEAKER_LOCK:
+        if spk_id in REGISTERED_SPEAKERS:
+            SPEAKER_CACHE_STATS["hits"] += 1
+        else:
+            SPEAKER_CACHE_STATS["misses"] += 1
+            cosyvoice.add_zero_shot_spk(prompt_text, prompt_speech_16k, spk_id)
+            REGISTERED_SPEAKERS.add(spk_id)
+    return spk_id
+
+
+def synthesize_segment(segment: str, voice_path: str, prompt_text: str, prompt_speech_16k: torch.Tensor) -> torch.Tensor:
+    """
+    合成单段文本
+
+    Returns:
+        torch.Tensor: 合成的语音（只取模型的第一个结果）
+    """
+    spk_id = get_speaker_id(voice_path, prompt_text, prompt_speech_16k)
+    if spk_id:
+        results = cosyvoice.inference_zero_shot(segment, "", "", zero_shot_spk_id=spk_id, stream=False)
+    else:
+        results = cosyvoice.inference_zero_shot(segment, prompt_text, prompt_speech_16k, stream=False)
+    for result in results:
+        return result['tts_speech']
+    raise RuntimeError(f"模型未返回语音: {segment}")
+
+
+def render_segment(
+    timer: StageTimer,
+    segment: str,
+    voice_path: str,
+    prompt_text: str,
+    prompt_speech_16k: torch.Tensor,
+    output_path: str
+):
+    """合成单段文本并保存为WAV，记录推理耗时、实时率和编码耗时"""
+    started = time.perf_counter()
+    with PROFILER.torch_segment("segment"):
+        tts_speech = synthesize_segment(segment, voice_path, prompt_text, prompt_speech_16k)
+    seconds, audio_seconds = time.perf_counter() - started, tts_speech.shape[-1] / cosyvoice.sample_rate
+    timer.record_inference(seconds, audio_seconds)
+    SEGMENT_TUNER.record("zh" if is_chinese_text(segment) else "en", len(segment), seconds, audio_seconds)
+    with timer.stage("encode"):
+        torchaudio.save(output_path, tts_speech, cosyvoice.sample_rate)
+
+
+# 启动预热配置
+WARMUP_ENABLED = os.environ.get("TTS_WARMUP", "1") == "1"
+# 预热时合成的文本长度（字符数）
+WARMUP_SEGMENT_LENGTHS = [int(n) for n in os.environ.get("TTS_WARMUP_SEGMENT_LENGTHS", "10,50,100").split(",") if n]
+# 预先加载提示缓存的常用音色数量，以及统计使用频率时参考的最近记录数
+WARMUP_TOP_VOICES = int(os.environ.get("TTS_WARMUP_TOP_VOICES", "5"))
+WARMUP_HISTORY = int(os.environ.get("TTS_WARMUP_HISTORY", "1000"))
+WARMUP_TEXT = "欢迎光临魔声AI，全场商品限时优惠，好消息不容错过，"
+
+
+def get_hot_voices(limit: int) -> List[tuple[str, str]]:
+    """
+    根据最近的已确认音频记录统计最常用的音色
+
+    Returns:
+        List[tuple[str, str]]: [(性别, 声音标签)]，按使用次数从高到低
+    """
+    counts: Dict[tuple[str, str], int] = {}
+    for record in load_saved_audios()[-WARMUP_HISTORY:]:
+        if record.get("gender") and record.get("voice_label"):
+            key = (record["gender"], record["voice_label"])
+            counts[key] = counts.get(key, 0) + 1
+    return sorted(counts, key=counts.get, reverse=True)[:limit]
+
+
+def _warm_up():
+    """
+    启动预热：加载常用音色的提示缓存，并按几种分段长度跑合成推理，
+    让内核、显存分配器和模型内部的延迟初始化在接收流量前完成
+    """
+    state = SERVICE_STATE["warm_up"]
+    if not WARMUP_ENABLED:
+        state["status"] = "skipped"
+        return
+    state["status"] = "running"
+    started_at = time.time()
+    try:
+        prompts = []
+        for gender, voice_label in get_hot_voices(WARMUP_TOP_VOICES):
+            try:
+                voice_path, text_path = get_voice_path(gender, voice_label)
+            except HTTPException:
+                continue  # 音色已被删除
+            prompt_speech_16k, prompt_text = PROMPT_CACHE.get(voice_path, text_path)
+            get_speaker_id(voice_path, prompt_text, prompt_speech_16k)
+            prompts.append((voice_path, prompt_text, prompt_speech_16k))
+            state["voices"].append(voice_label)
+
+        # 没有使用记录时，用音色库里的第一个音色做推理预热
+        if not prompts and VOICE_CATALOG:
+            for gender, labels in VOICE_CATALOG.items():
+                if labels:
+                    voice_path, text_path = get_voice_path(gender, labels[0])
+                    prompt_speech_16k, prompt_text = PROMPT_CACHE.get(voice_path, text_path)
+                    prompts.append((voice_path, prompt_text, prompt_speech_16k))
+                    break
+
+        if prompts:
+            voice_path, prompt_text, prompt_speech_16k = prompts[0]
+            for length in WARMUP_SEGMENT_LENGTHS:
+                text = (WARMUP_TEXT * (length // len(WARMUP_TEXT) + 1))[:length]
+                inference_started = time.time()
+                synthesize_segment(text, voice_path, prompt_text, prompt_speech_16k)
+                state["inference_seconds"][str(length)] = round(time.time() - inference_started, 3)
+        state["status"] = "done"
+    except Exception as e:
+        # 预热失败不影响服务，首个请求会慢一些
+        state["status"] = "failed"
+        state["error"] = str(e)
+        print(f"预热失败: {str(e)}")
+    state["seconds"] = round(time.time() - started_at, 3)
+    print(f"预热完成，耗时{state['seconds']}秒，各长度推理耗时: {state['inference_seconds']}，预加载音色: {state['voices']}")
+
+
+# 启动时扫描好的音色目录
+VOICE_CATALOG: Optional[Dict[str, List[str]]] = None
+
+
+def _load_voice_catalog():
+    """扫描音色库（在启动任务中执行）"""
+    global VOICE_CATALOG
+    state = SERVICE_STATE["voice_catalog"]
+    state["status"] = "loading"
+    try:
+        VOICE_CATALOG = get_voice_types()
+        state["voices"] = sum(len(voices) for voices in VOICE_CATALOG.values())
+        state["status"] = "ready"
+        print(f"音色库加载完成，共{state['voices']}个音色")
+    except Exception as e:
+        state["status"] = "failed"
+        state["error"] = str(e)
+        print(f"音色库加载失败: {str(e)}")
+
+
+# 启动时是否增量构建音色试听样本（也可以在部署时运行 python -m tts_service.voice_samples）
+VOICE_SAMPLES_BUILD = os.environ.get("TTS_BUILD_VOICE_SAMPLES", "1") == "1"
+# 音色试听样本清单: {性别: {声音标签: {"mp3", "opus", "duration"}}}
+VOICE_SAMPLES: Optional[Dict[str, Dict[str, Dict[str, Any]]]] = None
+
+
+def _load_voice_samples():
+    """加载音色试听样本清单，需要时先增量构建（在启动任务中执行）"""
+    global VOICE_SAMPLES
+    state = SERVICE_STATE["voice_samples"]
+    state["status"] = "loading"
+    try:
+        if VOICE_SAMPLES_BUILD:
+            VOICE_SAMPLES = build_voice_samples(VOICE_TYPES_DIR, VOICE_SAMPLES_DIR)
+        else:
+            VOICE_SAMPLES = load_manifest(VOICE_SAMPLES_DIR)
+        state["status"] = "ready" if VOICE_SAMPLES is not None else "missing"
+    except Exception as e:
+        state["status"] = "failed"
+        state["error"] = str(e)
+        print(f"音色试听样本构建失败: {str(e)}")
+
+
+def _load_tts_model():
+    """加载语音合成模型（在启动任务中执行，耗时较长）"""
+    global cosyvoice
+    state = SERVICE_STATE["model"]
+    state["status"] = "loading"
+    state["stage"] = f"正在加载{TTS_MODEL_BACKEND}模型"
+    print(f"正在加载语音合成模型（{TTS_MODEL_BACKEND}）...")
+    started_at = time.time()
+    try:
+        cosyvoice = load_model(TTS_MODEL_BACKEND, COSYVOICE_PATH)
+    except Exception as e:
+        state["status"] = "failed"
+        state["error"] = str(e)
+        state["stage"] = None
+        print(f"模型加载失败: {str(e)}")
+        raise
+    state["load_seconds"] = round(time.time() - started_at, 3)
+    state["stage"] = None
+    state["status"] = "ready"
+    print(f"模型加载成功！耗时{state['load_seconds']}秒")
+
+
+async def _load_service_resources():
+    """后台启动任务：先加载音色库（很快），再加载模型并预热，完成后启动推理线程"""
+    await asyncio.to_thread(_load_voice_catalog)
+    try:
+        await asyncio.to_thread(_load_tts_model)
+    except Exception:
+        return
+    await asyncio.to_thread(_warm_up)
+    start_workers(SYNTHESIS_QUEUE, INFERENCE_WORKERS)
+    print(f"已启动{INFERENCE_WORKERS}个推理线程")
+    MODEL_READY.set()
+    # 试听样本不影响合成，放在就绪之后构建
+    await asyncio.to_thread(_load_voice_samples)
+
+
+def ensure_model_ready():
+    """模型未就绪时拒绝合成请求，返回503"""
+    if not MODEL_READY.is_set():
+        state = SERVICE_STATE["model"]
+        detail = f"模型加载失败: {state['error']}" if state["status"] == "failed" else "模型正在加载，请稍后重试"
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "5"})
+
+
 @app.get("/")
 async def root():
     return FileResponse(os.path.join(STATIC_DIR, "index.html"))
 
 @app.get("/voice_types")
 async def get_available_voice_types():
-    """获取所有可用的声音类型"""
+    """获取所有可用的声音类型，以及每个音色试听样本的URL和时长"""
     try:
-        voice_types = get_voice_types()
+        voice_types = VOICE_CATALOG if VOICE_CATALOG is not None else get_voice_types()
+        samples: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for gender, voices in (VOICE_SAMPLES or {}).items():
+            samples[gender] = {
+                voice_label: {
+                    "url": f"/voice_samples/{entry['mp3']}",
+                    "opus_url": f"/voice_samples/{entry['opus']}",
+                    "duration": entry["duration"]
+                }
+                for voice_label, entry in voices.items()
+            }
         return JSONResponse({
             "success": True,
-            "voice_types": voice_types
+            "voice_types": voice_types,
+            "samples": samples
         })
     except Exception as e:
         print(f"获取声音类型失败: {str(e)}")
@@ -448,44 +783,163 @@ class TaskState(str, Enum):
     processing = "processing"
     completed = "completed"
     failed = "failed"
+    cancelled = "cancelled"
 
 # 全局任务存储（简单内存版）
 SYNTHESIS_TASKS: Dict[str, Dict[str, Any]] = {}
+# 已完成的完整试听音频索引：(文本, 性别, 声音标签) -> 任务ID，确认脚本时可直接复用
+COMPLETED_PREVIEWS: Dict[tuple, str] = {}
+PREVIEW_PROMOTION_STATS = {"hits": 0, "misses": 0}
+# 任务状态推送（SSE 和长轮询共用）
+TASK_EVENTS = TaskEventBus()
+# 相同请求合并：(任务类型, 文本, 性别, 声音标签, ...) 相同的任务共享一次推理
+COALESCED_TASKS = SingleFlight()
+# 从合并来源同步给订阅者的字段
+COALESCED_FIELDS = ("status", "result", "error", "progress", "timings")
+
+
+def _publish_task(task_id: str, kind: str = "status"):
+    """把任务（或批量任务）的当前快照推送给订阅者，可在推理线程中调用"""
+    flight = COALESCED_TASKS.led_by(task_id)
+    if flight is not None:
+        _sync_coalesced(flight, kind)
+        if task_id not in flight.subscribers:
+            # leader 已取消，作业只为其他订阅者继续执行
+            return
+    if not TASK_EVENTS.has_subscribers(task_id):
+        return
+    task = SYNTHESIS_TASKS.get(task_id) or BATCH_TASKS.get(task_id)
+    if task is not None:
+        TASK_EVENTS.publish(task_id, kind, {"task_id": task_id, **task})
+
+
+def _sync_coalesced(flight: Flight, kind: str):
+    """把作业的当前状态同步给合并进来的任务；作业结束后注销 Flight"""
+    source = flight.source
+    for task_id in flight.followers():
+        task = SYNTHESIS_TASKS.get(task_id)
+        if task is None:
+            continue
+        task.update({field: source[field] for field in COALESCED_FIELDS if field in source})
+        if TASK_EVENTS.has_subscribers(task_id):
+            TASK_EVENTS.publish(task_id, kind, {"task_id": task_id, **task})
+    if kind == "status" and source["status"] in FINAL_STATES:
+        COALESCED_TASKS.finish(flight)
+        key = flight.key[1:4]
+        if COMPLETED_PREVIEWS.get(key) == flight.leader and flight.leader not in flight.subscribers:
+            # leader 已取消，试听复用索引改指向仍在等待的任务
+            COMPLETED_PREVIEWS[key] = flight.subscribers[0]
+
+
+def _coalesce_task(key: tuple, task_id: str, priority: str) -> Optional[Flight]:
+    """
+    把新任务挂到相同的进行中作业上，并立即同步作业的当前状态
+
+    Returns:
+        Optional[Flight]: 合并成功时返回 Flight；没有相同的作业时返回 None，调用方正常入队
+    """
+    flight = COALESCED_TASKS.join(key, task_id)
+    if flight is None:
+        return None
+    task = SYNTHESIS_TASKS[task_id]
+    task["coalesced_with"] = flight.leader
+    task.update({field: flight.source[field] for field in COALESCED_FIELDS if field in flight.source})
+    # 交互请求合并到排队中的预合成作业时，提升作业的优先级
+    SYNTHESIS_QUEUE.promote(flight.job, priority)
+    TASKS_TOTAL.labels(task["kind"], "coalesced").inc()
+    return flight
+
+
+def _enqueue_flight(key: tuple, task_id: str, job: Job) -> Flight:
+    """登记可被合并的新作业并放入调度队列"""
+    flight = COALESCED_TASKS.start(key, task_id, job, SYNTHESIS_TASKS[task_id])
+    try:
+        SYNTHESIS_QUEUE.put(job)
+    except Exception:
+        COALESCED_TASKS.finish(flight)
+        raise
+    return flight
+
+
+def _detached_task(task: Dict[str, Any]) -> Dict[str, Any]:
+    """复制任务字典（连同执行中会原地更新的进度和耗时），用于从合并作业中退出的任务"""
+    copied = dict(task)
+    if isinstance(copied.get("progress"), dict):
+        copied["progress"] = dict(copied["progress"])
+    if isinstance(copied.get("timings"), dict):
+        copied["timings"] = {key: dict(value) if isinstance(value, dict) else value
+                             for key, value in list(copied["timings"].items())}
+    return copied
+
+
+def _job_task(task_id: str) -> Optional[Dict[str, Any]]:
+    """作业要写入的任务字典：leader 取消后，作业继续写入合并来源而不是已取消的任务"""
+    flight = COALESCED_TASKS.led_by(task_id)
+    return flight.source if flight is not None else SYNTHESIS_TASKS.get(task_id)
+
+
+def _remove_files(paths: List[str]):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _record_cancelled(task: Dict[str, Any], kind: str, skipped_segments: int):
+    """把任务标记为已取消，并记录省下的分段数"""
+    task["status"] = TaskState.cancelled
+    TASKS_TOTAL.labels(kind, TaskState.cancelled.value).inc()
+    if skipped_segments > 0:
+        CANCELLED_SEGMENTS.labels(kind).inc(skipped_segments)
 
 
 def _run_synthesis_task(task_id: str, text: str, gender: str, voice_label: str):
     """后台执行真正的语音合成，并更新任务状态"""
     global SYNTHESIS_TASKS
-    task_ref = SYNTHESIS_TASKS.get(task_id)
+    task_ref = _job_task(task_id)
     if not task_ref:  # 任务可能已被删除
         return
     task_ref["status"] = TaskState.processing
+    started_at = time.time()
+    task_ref["timings"] = {"queue_seconds": round(started_at - task_ref["created_at"], 3)}
+    timer = StageTimer(task_ref["timings"])
+    timer.record("queue_wait", started_at - task_ref["created_at"])
+    _publish_task(task_id)
+    temp_audio_files = []
     try:
         # ======= 以下逻辑复用原 /synthesize 的核心部分 =======
-        # 获取声音文件路径和文本文件路径
-        voice_path, text_path = get_voice_path(gender, voice_label)
-        # 加载声音提示
-        prompt_speech_16k, prompt_text = load_voice_prompt(voice_path, text_path)
+        with timer.stage("prompt_load"):
+            # 获取声音文件路径和文本文件路径
+            voice_path, text_path = get_voice_path(gender, voice_label)
+            # 加载声音提示
+            prompt_speech_16k, prompt_text = PROMPT_CACHE.get(voice_path, text_path)
         # 生成唯一文件名
         output_id = uuid.uuid4()
         final_output_path = os.path.join(OUTPUT_DIR, f"{output_id}.wav")
         # 分割长文本
-        text_segments = split_text(text)
-        temp_audio_files = []
+        with timer.stage("text_split"):
+            text_segments = split_text_for(text, task_ref["priority"])
+        task_ref["progress"] = {"segments_done": 0, "segments_total": len(text_segments)}
+        raise_if_cancelled()
         for i, segment in enumerate(text_segments):
+            if i > 0:
+                # 分段边界：让排队中的更高优先级任务先执行
+                SYNTHESIS_QUEUE.preempt_point()
             temp_output_path = os.path.join(OUTPUT_DIR, f"{output_id}_part{i}.wav")
-            for _, result in enumerate(cosyvoice.inference_zero_shot(segment, prompt_text, prompt_speech_16k, stream=False)):
-                tts_speech = result['tts_speech']
-                torchaudio.save(temp_output_path, tts_speech, cosyvoice.sample_rate)
-                break
+            render_segment(timer, segment, voice_path, prompt_text, prompt_speech_16k, temp_output_path)
             temp_audio_files.append(temp_output_path)
+            task_ref["progress"]["segments_done"] = i + 1
+            _publish_task(task_id, "progress")
         # 拼接
         if len(temp_audio_files) > 1:
-            concatenate_audio(temp_audio_files, final_output_path)
+            with timer.stage("concatenate"):
+                concatenate_audio(temp_audio_files, final_output_path)
         else:
             final_output_path = temp_audio_files[0]
         # 转 MP3
-        mp3_path = convert_wav_to_mp3(final_output_path)
+        with timer.stage("encode"):
+            mp3_path = convert_wav_to_mp3(final_output_path)
         mp3_filename = os.path.basename(mp3_path)
         wav_filename = os.path.basename(final_output_path)
         # 删除段文件
@@ -504,60 +958,764 @@ def _run_synthesis_task(task_id: str, text: str, gender: str, voice_label: str):
             "mp3_url": f"/output/{mp3_filename}",
             "text": text
         }
+        COMPLETED_PREVIEWS[(text, gender, voice_label)] = task_id
+        TASKS_TOTAL.labels("synthesize", TaskState.completed.value).inc()
+    except JobCancelled:
+        # 在分段边界被取消：删除已合成的分段，剩余分段不再合成
+        _remove_files(temp_audio_files)
+        progress = task_ref["progress"]
+        _record_cancelled(task_ref, "synthesize", progress["segments_total"] - progress["segments_done"])
+    except Exception as e:
+        task_ref["status"] = TaskState.failed
+        task_ref["error"] = str(e)
+        TASKS_TOTAL.labels("synthesize", TaskState.failed.value).inc()
+    finally:
+        job = current_job()
+        preempted = job.preempted_seconds if job else 0.0
+        task_ref["timings"]["compute_seconds"] = round(time.time() - started_at - preempted, 3)
+        if preempted:
+            task_ref["timings"]["preempted_seconds"] = round(preempted, 3)
+        _publish_task(task_id)
+
+
+# == 渐进式试听 ==
+# 试听模式只先合成第一段，其余分段等客户端继续播放或显式请求时再合成
+PREVIEW_STATE: Dict[str, Dict[str, Any]] = {}
+
+
+def _preview_result(task_id: str) -> Dict[str, Any]:
+    """根据渐进式任务的当前进度生成任务结果"""
+    state = PREVIEW_STATE[task_id]
+    segments = state["rendered"]
+    total = len(state["segments"])
+    more_available = len(segments) < total
+    result = {
+        "success": True,
+        "message": "试听片段已生成" if more_available else "语音合成成功",
+        # 全部分段合成完之前指向第一段，完成后指向完整音频
+        "wav_url": state.get("full_wav_url") or segments[0]["wav_url"],
+        "mp3_url": state.get("full_mp3_url") or segments[0]["mp3_url"],
+        "text": state["text"],
+        "segments": list(segments),
+        "segments_total": total,
+        "segments_done": len(segments),
+        "more_available": more_available,
+    }
+    if more_available:
+        result["more_url"] = f"/synthesis_tasks/{task_id}/more"
+    return result
+
+
+def _run_preview_segments(task_id: str, count: Optional[int]):
+    """合成渐进式任务接下来的 count 段（None 表示全部剩余分段），每段完成后立即更新任务结果"""
+    task_ref = SYNTHESIS_TASKS.get(task_id)
+    state = PREVIEW_STATE.get(task_id)
+    if not task_ref or not state:
+        return
+    task_ref["status"] = TaskState.processing
+    job = current_job()
+    started_at = time.time()
+    if job and job.started_at is not None:
+        queue_seconds = job.started_at - job.enqueued_at
+    else:
+        queue_seconds = started_at - task_ref["created_at"]
+    task_ref["timings"] = {"queue_seconds": round(queue_seconds, 3)}
+    timer = StageTimer(task_ref["timings"])
+    timer.record("queue_wait", queue_seconds)
+    _publish_task(task_id)
+    try:
+        with timer.stage("prompt_load"):
+            voice_path, text_path = get_voice_path(state["gender"], state["voice_label"])
+            prompt_speech_16k, prompt_text = PROMPT_CACHE.get(voice_path, text_path)
+        segments = state["segments"]
+        start = len(state["rendered"])
+        stop = len(segments) if count is None else min(len(segments), start + count)
+        raise_if_cancelled()
+        for i in range(start, stop):
+            if i > start:
+                SYNTHESIS_QUEUE.preempt_point()
+            part_path = os.path.join(OUTPUT_DIR, f"{state['output_id']}_part{i}.wav")
+            render_segment(timer, segments[i], voice_path, prompt_text, prompt_speech_16k, part_path)
+            with timer.stage("encode"):
+                part_mp3 = convert_wav_to_mp3(part_path)
+            state["rendered"].append({
+                "index": i,
+                "text": segments[i],
+                "wav_url": f"/output/{os.path.basename(part_path)}",
+                "mp3_url": f"/output/{os.path.basename(part_mp3)}",
+            })
+            task_ref["result"] = _preview_result(task_id)
+            _publish_task(task_id, "progress")
+
+        # 全部分段完成后拼接出完整音频，分段文件保留给正在播放的客户端
+        if len(state["rendered"]) == len(segments):
+            if len(segments) > 1:
+                full_wav_path = os.path.join(OUTPUT_DIR, f"{state['output_id']}.wav")
+                part_paths = [os.path.join(OUTPUT_DIR, f"{state['output_id']}_part{i}.wav") for i in range(len(segments))]
+                with timer.stage("concatenate"):
+                    concatenate_audio(part_paths, full_wav_path)
+                with timer.stage("encode"):
+                    full_mp3_path = convert_wav_to_mp3(full_wav_path)
+                state["full_wav_url"] = f"/output/{os.path.basename(full_wav_path)}"
+                state["full_mp3_url"] = f"/output/{os.path.basename(full_mp3_path)}"
+            task_ref["result"] = _preview_result(task_id)
+            COMPLETED_PREVIEWS[(state["text"], state["gender"], state["voice_label"])] = task_id
+        task_ref["status"] = TaskState.completed
+        TASKS_TOTAL.labels("preview", TaskState.completed.value).inc()
+    except JobCancelled:
+        _discard_preview(task_id)
+        _record_cancelled(task_ref, "preview", len(state["segments"]) - len(state["rendered"]))
     except Exception as e:
         task_ref["status"] = TaskState.failed
         task_ref["error"] = str(e)
+        TASKS_TOTAL.labels("preview", TaskState.failed.value).inc()
+    finally:
+        state["pending"] = False
+        preempted = job.preempted_seconds if job else 0.0
+        task_ref["timings"]["compute_seconds"] = round(time.time() - started_at - preempted, 3)
+        if preempted:
+            task_ref["timings"]["preempted_seconds"] = round(preempted, 3)
+        _publish_task(task_id)
+
+
+def _discard_preview(task_id: str):
+    """删除试听任务已生成的分段和完整音频（包括转码缓存），不再允许继续合成"""
+    state = PREVIEW_STATE.pop(task_id, None)
+    if state is not None:
+        output_id = state["output_id"]
+        _remove_files(glob.glob(os.path.join(OUTPUT_DIR, f"{output_id}_part*"))
+                      + glob.glob(os.path.join(OUTPUT_DIR, f"{output_id}.*")))
+
+
+# == 限流与公平调度 ==
+# 与后端认证服务共用的JWT密钥，用于识别用户身份
+JWT_SECRET = os.environ.get("JWT_SECRET", "your-secret-key")
+JWT_ALGORITHM = "HS256"
+# 是否信任反向代理传入的 X-Forwarded-For 头
+TRUST_FORWARDED_FOR = os.environ.get("TTS_TRUST_FORWARDED_FOR", "0") == "1"
+
+# 令牌桶限流配置（每分钟请求数 / 突发请求数）
+RATE_LIMIT_USER_PER_MINUTE = float(os.environ.get("TTS_RATE_LIMIT_USER_PER_MINUTE", "30"))
+RATE_LIMIT_USER_BURST = float(os.environ.get("TTS_RATE_LIMIT_USER_BURST", "10"))
+RATE_LIMIT_IP_PER_MINUTE = float(os.environ.get("TTS_RATE_LIMIT_IP_PER_MINUTE", "60"))
+RATE_LIMIT_IP_BURST = float(os.environ.get("TTS_RATE_LIMIT_IP_BURST", "20"))
+
+# 推理线程数（单GPU单模型时保持为1）和公平调度每轮额度（分段数）
+INFERENCE_WORKERS = int(os.environ.get("TTS_INFERENCE_WORKERS", "1"))
+FAIR_SHARE_QUANTUM = int(os.environ.get("TTS_FAIR_SHARE_QUANTUM", "4"))
+# 低优先级任务（最终成品、批量）最长等待时间，超过后优先执行一次，防止饿死
+STARVATION_SECONDS = float(os.environ.get("TTS_STARVATION_SECONDS", "60"))
+
+USER_RATE_LIMITER = RateLimiter(RATE_LIMIT_USER_PER_MINUTE / 60.0, RATE_LIMIT_USER_BURST)
+IP_RATE_LIMITER = RateLimiter(RATE_LIMIT_IP_PER_MINUTE / 60.0, RATE_LIMIT_IP_BURST)
+SYNTHESIS_QUEUE = FairShareQueue(quantum=FAIR_SHARE_QUANTUM, starvation_seconds=STARVATION_SECONDS)
+# 事件循环延迟监控，用于发现阻塞事件循环的代码
+LOOP_LAG_MONITOR = EventLoopLagMonitor()
+
+
+def get_client_identity(request: Request) -> tuple[Optional[str], str]:
+    """
+    识别请求来源
+
+    Returns:
+        tuple[Optional[str], str]: (JWT中的用户ID，没有有效令牌时为None, 客户端IP)
+    """
+    ip = request.client.host if request.client else "unknown"
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            # 只信任最近一跳代理（路由或后端网关）追加的地址，左边的值可能是客户端伪造的
+            ip = forwarded.split(",")[-1].strip()
+
+    user_id = None
+    authorization = request.headers.get("authorization", "")
+    if jwt is not None and authorization.startswith("Bearer "):
+        try:
+            payload = jwt.decode(authorization[7:], JWT_SECRET, algorithms=[JWT_ALGORITHM])
+            user_id = payload.get("sub")
+        except jwt.PyJWTError:
+            user_id = None
+    return user_id, ip
+
+
+def enforce_rate_limit(request: Request) -> str:
+    """
+    按用户和IP做令牌桶限流，超限时返回429并带上 Retry-After
+
+    Returns:
+        str: 该请求所属的租户标识，用于公平调度
+    """
+    user_id, ip = get_client_identity(request)
+    checks = [(IP_RATE_LIMITER, f"ip:{ip}")]
+    if user_id:
+        checks.append((USER_RATE_LIMITER, f"user:{user_id}"))
+    tenant = checks[-1][1]
+
+    wait = max(limiter.check(key) for limiter, key in checks)
+    if wait > 0:
+        for limiter, _ in checks:
+            limiter.record_rejection()
+        raise HTTPException(
+            status_code=429,
+            detail="请求过于频繁，请稍后再试",
+            headers={"Retry-After": str(max(1, math.ceil(wait)))},
+        )
+    for limiter, key in checks:
+        limiter.consume(key)
+    return tenant
+
+
+def resolve_priority(requested: Optional[str], default: str) -> str:
+    """
+    确定任务的优先级类别，客户端只能把任务降级（如标记为 speculative），不能提升
+    """
+    if not requested:
+        return default
+    if requested not in PRIORITY_RANK:
+        raise HTTPException(status_code=400, detail=f"未知的优先级类别: {requested}")
+    if PRIORITY_RANK[requested] < PRIORITY_RANK[default]:
+        raise HTTPException(status_code=400, detail=f"该接口不允许使用优先级 {requested}")
+    return requested
 
 
 # == 修改 /synthesize 接口 ==
 @app.post("/synthesize")
 async def synthesize(
-    background_tasks: BackgroundTasks,
+    request: Request,
     text: str = Form(...),
     gender: str = Form(...),
     voice_label: str = Form(...),
+    priority: Optional[str] = Form(None),
+    mode: Optional[str] = Form(None),
 ):
-    """异步语音合成：立即返回 202 并在后台执行任务"""
+    """
+    异步语音合成：立即返回 202，任务进入公平调度队列由推理线程执行
+
+    默认按交互试听（interactive）优先级调度，客户端预取可传 priority=speculative。
+    mode=preview 时只先合成第一段，结果中 more_available 为真时可通过 more_url 继续合成剩余分段。
+    与排队中或执行中的任务文本和声音完全相同时（双击、重试、多个标签页），不再重复合成，
+    返回的新任务共享该任务的结果，coalesced_with 为被合并的任务ID
+    """
+    ensure_model_ready()
+    priority = resolve_priority(priority, "interactive")
+    if mode not in (None, "full", "preview"):
+        raise HTTPException(status_code=400, detail=f"未知的合成模式: {mode}")
+    tenant = enforce_rate_limit(request)
     try:
         task_id = str(uuid.uuid4())
         SYNTHESIS_TASKS[task_id] = {
+            "kind": "preview" if mode == "preview" else "synthesize",
             "status": TaskState.pending,
             "result": None,
-            "error": None
+            "error": None,
+            "priority": priority,
+            "gender": gender,
+            "voice_label": voice_label,
+            "created_at": time.time()
         }
-        # 将耗时任务加入后台
-        background_tasks.add_task(_run_synthesis_task, task_id, text, gender, voice_label)
+        text_segments = split_text_for(text, priority)
+        if mode == "preview":
+            PREVIEW_STATE[task_id] = {
+                "text": text,
+                "gender": gender,
+                "voice_label": voice_label,
+                "segments": text_segments,
+                "rendered": [],
+                "output_id": str(uuid.uuid4()),
+                "tenant": tenant,
+                "pending": True,
+            }
+            job = Job(task_id, tenant, 1, lambda: _run_preview_segments(task_id, 1), priority=priority)
+            SYNTHESIS_QUEUE.put(job)
+            TASKS_TOTAL.labels("preview", TaskState.pending.value).inc()
+        elif not _coalesce_task(("synthesize", text, gender, voice_label), task_id, priority):
+            # 按分段数计算任务代价，放入公平调度队列
+            job = Job(task_id, tenant, len(text_segments),
+                      lambda: _run_synthesis_task(task_id, text, gender, voice_label), priority=priority)
+            _enqueue_flight(("synthesize", text, gender, voice_label), task_id, job)
+            TASKS_TOTAL.labels("synthesize", TaskState.pending.value).inc()
+        task = SYNTHESIS_TASKS[task_id]
         # 返回 202 与任务信息
-        return JSONResponse(
-            {
-                "task_id": task_id,
-                "status": TaskState.pending,
-                "status_url": f"/synthesis_tasks/{task_id}/status"
-            },
-            status_code=202,
-        )
+        response = {
+            "task_id": task_id,
+            "status": task["status"],
+            "status_url": f"/synthesis_tasks/{task_id}/status"
+        }
+        if "coalesced_with" in task:
+            response["coalesced_with"] = task["coalesced_with"]
+        return JSONResponse(response, status_code=202)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"无法创建合成任务: {str(e)}")
 
 
+@app.get("/queue_metrics")
+async def get_queue_metrics():
+    """按优先级类别和租户统计的调度队列指标"""
+    return JSONResponse({
+        "success": True,
+        "queue_depth": SYNTHESIS_QUEUE.depth(),
+        "classes": SYNTHESIS_QUEUE.class_snapshot(),
+        "tenants": SYNTHESIS_QUEUE.snapshot(),
+        "rate_limited": {"ip": IP_RATE_LIMITER.rejected, "user": USER_RATE_LIMITER.rejected},
+        "coalesced": COALESCED_TASKS.stats(),
+        "event_loop_lag": LOOP_LAG_MONITOR.snapshot()
+    })
+
+
+@app.get("/segment_tuning")
+async def get_segment_tuning():
+    """分段长度自动调优的状态：各语言的样本汇总、拟合的推理耗时模型和当前分段长度"""
+    return JSONResponse({"success": True, "enabled": SEGMENT_AUTOTUNE,
+                         "latency_classes": sorted(SEGMENT_LATENCY_CLASSES), **SEGMENT_TUNER.snapshot()})
+
+
+# 抓取时读取的缓存命中率、队列深度和执行中任务数
+REGISTRY.register(ServiceCollector(
+    cache_stats={
+        "prompt": PROMPT_CACHE.stats,
+        "speaker": lambda: SPEAKER_CACHE_STATS,
+        "rendition": lambda: {"hits": RENDITION_CACHE.hits, "misses": RENDITION_CACHE.transcodes},
+        "preview_promotion": lambda: PREVIEW_PROMOTION_STATS,
+    },
+    queue_depths=lambda: {name: stats["queued_jobs"] for name, stats in SYNTHESIS_QUEUE.class_snapshot().items()},
+    in_flight=SYNTHESIS_QUEUE.in_flight,
+))
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus 文本格式的指标"""
+    return Response(content=generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+
 # == 任务状态查询接口 ==
+# 长轮询单次最长等待时间（秒）
+STATUS_MAX_WAIT_SECONDS = float(os.environ.get("TTS_STATUS_MAX_WAIT_SECONDS", "30"))
+
+
 @app.get("/synthesis_tasks/{task_id}/status")
-async def get_synthesis_task_status(task_id: str):
+async def get_synthesis_task_status(task_id: str, wait: Optional[float] = None):
+    """
+    查询任务状态
+
+    参数:
+    - wait: 长轮询秒数（可选，最长 TTS_STATUS_MAX_WAIT_SECONDS）；任务未结束时最多等待这么久再返回
+    """
     task = SYNTHESIS_TASKS.get(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="任务不存在")
+    if wait and wait > 0 and task["status"] not in FINAL_STATES:
+        deadline = time.monotonic() + min(wait, STATUS_MAX_WAIT_SECONDS)
+        subscription = TASK_EVENTS.subscribe([task_id])
+        try:
+            while task["status"] not in FINAL_STATES:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                # 状态变化会立即推送过来；每秒复查一次作为兜底
+                await subscription.get(min(remaining, 1.0))
+        finally:
+            TASK_EVENTS.unsubscribe(subscription)
     return task
 
+
+# 单个事件流最多订阅的任务数和心跳间隔（秒）
+EVENTS_MAX_TASKS = 50
+EVENTS_HEARTBEAT_SECONDS = 15.0
+
+
+@app.get("/synthesis_tasks/events")
+async def stream_task_events(task_ids: str):
+    """
+    以 server-sent events 推送一个或多个任务（或批量任务）的状态
+
+    参数:
+    - task_ids: 逗号分隔的任务ID
+
+    事件:
+    - status: 状态变化（连接建立时先推送一次当前状态），data 为任务快照
+    - progress: 每完成一段推送一次，data 为任务快照
+    - missing: 任务不存在
+    所有任务结束（completed/failed）后服务端关闭连接；查询状态接口仍可作为轮询兜底
+    """
+    ids = list(dict.fromkeys(t.strip() for t in task_ids.split(",") if t.strip()))
+    if not ids or len(ids) > EVENTS_MAX_TASKS:
+        raise HTTPException(status_code=400, detail=f"task_ids 需要1到{EVENTS_MAX_TASKS}个任务ID")
+
+    async def events():
+        # 先订阅再读取当前状态，避免两者之间的状态变化丢失
+        subscription = TASK_EVENTS.subscribe(ids)
+        EVENT_STREAMS.inc()
+        try:
+            waiting = set()
+            for task_id in ids:
+                task = SYNTHESIS_TASKS.get(task_id) or BATCH_TASKS.get(task_id)
+                if task is None:
+                    yield format_sse("missing", json.dumps({"task_id": task_id}))
+                    continue
+                yield format_sse("status", json.dumps({"task_id": task_id, **task}, ensure_ascii=False, default=str))
+                if task["status"] not in FINAL_STATES:
+                    waiting.add(task_id)
+            while waiting:
+                event = await subscription.get(EVENTS_HEARTBEAT_SECONDS)
+                if event is None:
+                    # 心跳注释行，防止代理断开空闲连接
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(event.kind, event.data)
+                if event.kind == "status" and event.status in FINAL_STATES:
+                    waiting.discard(event.task_id)
+        finally:
+            TASK_EVENTS.unsubscribe(subscription)
+            EVENT_STREAMS.dec()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.delete("/synthesis_tasks/{task_id}")
+async def cancel_synthesis_task(task_id: str):
+    """
+    取消合成任务（用户离开页面或换了音色时调用）
+
+    排队中的任务立即移出队列；执行中的任务在下一个分段边界停止，已生成的分段文件随之删除。
+    只合成了部分分段的试听任务也可以取消，已生成的试听片段会被删除。
+    合并了相同请求的作业按引用计数取消：还有其他任务在等待时只取消这个任务，作业继续执行。
+
+    返回:
+    - 200: 已取消，status 为 cancelled
+    - 202: 任务正在执行，cancel_requested 为真，停止后状态变为 cancelled（恰好已合成完最后一段时为 completed）
+    - 409: 任务已结束
+    """
+    task = SYNTHESIS_TASKS.get(task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    state = PREVIEW_STATE.get(task_id)
+    partial_preview = (state is not None and task["status"] == TaskState.completed
+                       and len(state["rendered"]) < len(state["segments"]))
+    if task["status"] in FINAL_STATES and not partial_preview:
+        raise HTTPException(status_code=409, detail=f"任务已结束: {task['status'].value}")
+
+    flight = COALESCED_TASKS.flight_of(task_id)
+    if flight is not None and COALESCED_TASKS.detach(task_id):
+        # 还有合并进来的任务在等待同一作业：只取消这个任务，作业继续执行。
+        # 换成独立的字典，作业之后写入的状态和进度不再影响它
+        SYNTHESIS_TASKS[task_id] = task = _detached_task(task)
+        _record_cancelled(task, task.get("kind", "synthesize"), 0)
+        if TASK_EVENTS.has_subscribers(task_id):
+            TASK_EVENTS.publish(task_id, "status", {"task_id": task_id, **task})
+        return {"task_id": task_id, "status": task["status"]}
+
+    # 最后一个订阅者取消时才取消作业（作业ID为 leader 的任务ID）
+    cancelled = SYNTHESIS_QUEUE.cancel(flight.leader if flight is not None else task_id)
+    if cancelled["running"]:
+        task["cancel_requested"] = True
+        _publish_task(task_id)
+        return JSONResponse({"task_id": task_id, "status": task["status"], "cancel_requested": True},
+                            status_code=202)
+    if not cancelled["queued"] and not partial_preview:
+        # 作业恰好在这期间执行完毕
+        raise HTTPException(status_code=409, detail=f"任务已结束: {task['status'].value}")
+
+    if state is not None:
+        _discard_preview(task_id)
+        skipped = len(state["segments"]) - len(state["rendered"])
+    else:
+        skipped = sum(job.cost for job in cancelled["queued"])
+    _record_cancelled(task, task.get("kind", "synthesize"), skipped)
+    if flight is not None:
+        COALESCED_TASKS.finish(flight)
+    _publish_task(task_id)
+    return {"task_id": task_id, "status": task["status"]}
+
+
+@app.post("/synthesis_tasks/{task_id}/more")
+async def synthesize_more(task_id: str, count: Optional[int] = Form(None)):
+    """
+    继续合成试听任务的剩余分段
+
+    参数:
+    - count: 本次继续合成的分段数（可选，默认合成全部剩余分段）；边播边取的客户端可每次只取下一段
+    """
+    task = SYNTHESIS_TASKS.get(task_id)
+    state = PREVIEW_STATE.get(task_id)
+    if not task or not state:
+        raise HTTPException(status_code=404, detail="试听任务不存在")
+    if count is not None and count < 1:
+        raise HTTPException(status_code=400, detail="count 必须大于0")
+    remaining = len(state["segments"]) - len(state["rendered"])
+    if remaining == 0 and not state["pending"]:
+        return task
+    if not state["pending"]:
+        # 同一任务同时只排队一个续合成作业，重复请求直接返回当前状态
+        state["pending"] = True
+        task["status"] = TaskState.pending
+        job = Job(f"{task_id}:more:{len(state['rendered'])}", state["tenant"],
+                  remaining if count is None else min(count, remaining),
+                  lambda: _run_preview_segments(task_id, count), priority=task["priority"])
+        SYNTHESIS_QUEUE.put(job)
+        TASKS_TOTAL.labels("preview", TaskState.pending.value).inc()
+        _publish_task(task_id)
+    return JSONResponse(
+        {
+            "task_id": task_id,
+            "status": task["status"],
+            "status_url": f"/synthesis_tasks/{task_id}/status"
+        },
+        status_code=202,
+    )
+
+def _render_final_audio(
+    text: str,
+    gender: str,
+    voice_label: str,
+    user_id: Optional[str],
+    session_id: Optional[str],
+    timer: StageTimer,
+    on_segment: Optional[Callable[[int, int], None]] = None,
+    priority: str = "final"
+) -> Dict[str, Any]:
+    """在推理线程中生成最终音频并保存记录，返回接口响应内容；每段完成后调用 on_segment(已完成段数, 总段数)"""
+    with timer.stage("prompt_load"):
+        # 获取声音文件路径和文本文件路径
+        voice_path, text_path = get_voice_path(gender, voice_label)
+
+        # 加载声音提示
+        prompt_speech_16k, prompt_text = PROMPT_CACHE.get(voice_path, text_path)
+
+    # 生成唯一文件名和ID
+    audio_id = str(uuid.uuid4())
+    final_wav_path = os.path.join(CLIENT_OUTPUT_DIR, f"{audio_id}.wav")
+
+    # 分割长文本
+    with timer.stage("text_split"):
+        text_segments = split_text_for(text, priority)
+    print(f"文本已分割为{len(text_segments)}段")
+
+    # 临时音频文件路径列表
+    temp_audio_files = []
+
+    # 逐段合成语音
+    try:
+        raise_if_cancelled()
+        for i, segment in enumerate(text_segments):
+            if i > 0:
+                # 分段边界：让排队中的试听任务先执行
+                SYNTHESIS_QUEUE.preempt_point()
+            print(f"开始合成第{i+1}/{len(text_segments)}段: '{segment}'")
+
+            # 临时文件路径
+            temp_output_path = os.path.join(CLIENT_OUTPUT_DIR, f"{audio_id}_part{i}.wav")
+
+            # 合成语音
+            render_segment(timer, segment, voice_path, prompt_text, prompt_speech_16k, temp_output_path)
+            print(f"已保存第{i+1}段语音文件: {temp_output_path}")
+
+            temp_audio_files.append(temp_output_path)
+            if on_segment is not None:
+                on_segment(i + 1, len(text_segments))
+    except JobCancelled:
+        # 任务被取消：删除已合成的分段
+        _remove_files(temp_audio_files)
+        raise
+
+    # 拼接所有音频段
+    if len(temp_audio_files) > 1:
+        print(f"正在拼接{len(temp_audio_files)}个音频文件...")
+        with timer.stage("concatenate"):
+            concatenate_audio(temp_audio_files, final_wav_path)
+        print(f"已拼接所有音频段: {final_wav_path}")
+    else:
+        # 单段音频直接使用
+        final_wav_path = temp_audio_files[0]
+
+    # 转换为MP3格式
+    with timer.stage("encode"):
+        mp3_path = convert_wav_to_mp3(final_wav_path)
+
+    # 删除临时文件
+    if len(temp_audio_files) > 1:
+        for temp_file in temp_audio_files:
+            try:
+                os.remove(temp_file)
+                print(f"已删除临时文件: {temp_file}")
+            except Exception as e:
+                print(f"删除临时文件失败: {str(e)}")
+
+    return _save_final_record(audio_id, text, final_wav_path, mp3_path, user_id, session_id, gender, voice_label)
+
+
+def _save_final_record(
+    audio_id: str,
+    text: str,
+    final_wav_path: str,
+    mp3_path: str,
+    user_id: Optional[str],
+    session_id: Optional[str],
+    gender: str,
+    voice_label: str
+) -> Dict[str, Any]:
+    """写入最终音频记录，返回接口响应内容"""
+    wav_filename = os.path.basename(final_wav_path)
+    mp3_filename = os.path.basename(mp3_path)
+
+    # 创建记录
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+    audio_record = {
+        "id": audio_id,
+        "text": text,
+        "timestamp": timestamp,
+        "wav_path": final_wav_path,
+        "mp3_path": mp3_path,
+        "wav_url": f"/client_output/{wav_filename}",
+        "mp3_url": f"/client_output/{mp3_filename}",
+        "user_id": user_id,
+        "session_id": session_id,
+        "gender": gender,
+        "voice_label": voice_label
+    }
+
+    # 保存记录
+    save_audio_record(audio_record)
+
+    return {
+        "success": True,
+        "message": "脚本已确认并生成最终音频",
+        "audio_id": audio_id,
+        "wav_url": f"/client_output/{wav_filename}",
+        "mp3_url": f"/client_output/{mp3_filename}",
+        "text": text,
+        "timestamp": timestamp
+    }
+
+def _link_or_copy(src: str, dst: str):
+    """优先用硬链接复用已有文件，跨文件系统时退回复制"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _find_preview(
+    preview_task_id: Optional[str],
+    text: str,
+    gender: str,
+    voice_label: str
+) -> Optional[str]:
+    """
+    查找可以直接作为最终音频的已完成试听任务
+
+    Returns:
+        Optional[str]: 试听任务ID，没有可复用的试听时返回None
+    """
+    if preview_task_id:
+        task = SYNTHESIS_TASKS.get(preview_task_id)
+        if not task:
+            raise HTTPException(status_code=404, detail="试听任务不存在")
+        if (task.get("gender"), task.get("voice_label")) != (gender, voice_label) or \
+                (task["result"] and task["result"]["text"] != text):
+            raise HTTPException(status_code=400, detail="试听任务的文本或声音与确认内容不一致")
+    else:
+        preview_task_id = COMPLETED_PREVIEWS.get((text, gender, voice_label))
+        task = SYNTHESIS_TASKS.get(preview_task_id) if preview_task_id else None
+    # 试听尚未完成或只合成了部分分段时，仍然重新合成
+    if not task or task["status"] != TaskState.completed or task["result"].get("more_available"):
+        return None
+    return preview_task_id
+
+
+def _promote_preview(
+    preview_task_id: str,
+    text: str,
+    gender: str,
+    voice_label: str,
+    user_id: Optional[str],
+    session_id: Optional[str]
+) -> Optional[Dict[str, Any]]:
+    """把已完成试听的音频链接到 client_output 并保存记录，试听文件已被清理时返回None"""
+    result = SYNTHESIS_TASKS[preview_task_id]["result"]
+    src_wav = os.path.join(OUTPUT_DIR, os.path.basename(result["wav_url"]))
+    src_mp3 = os.path.join(OUTPUT_DIR, os.path.basename(result["mp3_url"]))
+    if not (os.path.exists(src_wav) and os.path.exists(src_mp3)):
+        return None
+    audio_id = str(uuid.uuid4())
+    final_wav_path = os.path.join(CLIENT_OUTPUT_DIR, f"{audio_id}.wav")
+    mp3_path = os.path.join(CLIENT_OUTPUT_DIR, f"{audio_id}.mp3")
+    _link_or_copy(src_wav, final_wav_path)
+    _link_or_copy(src_mp3, mp3_path)
+    print(f"复用试听任务 {preview_task_id} 的音频作为最终音频: {final_wav_path}")
+    response = _save_final_record(audio_id, text, final_wav_path, mp3_path, user_id, session_id, gender, voice_label)
+    response["promoted_from"] = preview_task_id
+    return response
+
+
+def _run_final_task(
+    task_id: str,
+    text: str,
+    gender: str,
+    voice_label: str,
+    user_id: Optional[str],
+    session_id: Optional[str]
+):
+    """在推理线程中执行最终音频任务，并更新任务状态"""
+    task_ref = _job_task(task_id)
+    if not task_ref:
+        return
+    task_ref["status"] = TaskState.processing
+    started_at = time.time()
+    task_ref["timings"] = {"queue_seconds": round(started_at - task_ref["created_at"], 3)}
+    timer = StageTimer(task_ref["timings"])
+    timer.record("queue_wait", started_at - task_ref["created_at"])
+    _publish_task(task_id)
+
+    def on_segment(done: int, total: int):
+        task_ref["progress"] = {"segments_done": done, "segments_total": total}
+        _publish_task(task_id, "progress")
+
+    try:
+        task_ref["result"] = _render_final_audio(text, gender, voice_label, user_id, session_id, timer, on_segment,
+                                                 task_ref["priority"])
+        task_ref["status"] = TaskState.completed
+        TASKS_TOTAL.labels("final", TaskState.completed.value).inc()
+    except JobCancelled:
+        progress = task_ref.get("progress") or {"segments_done": 0, "segments_total": len(split_text_for(text, task_ref["priority"]))}
+        _record_cancelled(task_ref, "final", progress["segments_total"] - progress["segments_done"])
+    except Exception as e:
+        print(f"确认脚本过程中出错: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        task_ref["status"] = TaskState.failed
+        task_ref["error"] = str(e)
+        TASKS_TOTAL.labels("final", TaskState.failed.value).inc()
+    finally:
+        job = current_job()
+        preempted = job.preempted_seconds if job else 0.0
+        task_ref["timings"]["compute_seconds"] = round(time.time() - started_at - preempted, 3)
+        if preempted:
+            task_ref["timings"]["preempted_seconds"] = round(preempted, 3)
+        _publish_task(task_id)
+
+
+# /confirm_script 同步等待结果的最长时间（秒），超时后返回任务句柄
+CONFIRM_MAX_WAIT_SECONDS = float(os.environ.get("TTS_CONFIRM_MAX_WAIT_SECONDS", "60"))
+
+
 @app.post("/confirm_script")
 async def confirm_script(
+    request: Request,
     text: str = Body(...),
     gender: str = Body(...),
     voice_label: str = Body(...),
     user_id: str = Body(None),
-    session_id: str = Body(None)
+    session_id: str = Body(None),
+    priority: Optional[str] = Body(None),
+    wait_seconds: Optional[float] = Body(None),
+    preview_task_id: Optional[str] = Body(None)
 ):
     """
-    确认脚本并生成最终音频
+    确认脚本并提交最终音频任务
     
     参数:
     - text: 已确认的文本脚本
@@ -565,102 +1723,447 @@ async def confirm_script(
     - voice_label: 声音标签
     - user_id: 用户ID（可选）
     - session_id: 会话ID（可选）
+    - priority: 优先级类别（可选，默认 final，只能降级为 batch 或 speculative）
+    - wait_seconds: 同步等待结果的秒数（可选，最长 TTS_CONFIRM_MAX_WAIT_SECONDS）
+    - preview_task_id: 要直接采用的试听任务ID（可选，不传时按文本和声音查找已完成的试听）
     
     返回:
-    - 最终音频文件URL
+    - 在等待时间内完成时返回 200 和最终音频文件URL，否则返回 202 和任务句柄；
+      音频记录在任务完成时写入 saved_audios。复用试听音频时不做推理，直接返回 200。
+      同一用户、同一会话重复确认进行中的相同文案时共享同一个任务的结果，只保存一条记录
     """
-    try:
-        print(f"收到脚本确认请求: '{text}', 性别: {gender}, 声音: {voice_label}")
-        
-        # 获取声音文件路径和文本文件路径
-        voice_path, text_path = get_voice_path(gender, voice_label)
-        
-        # 加载声音提示
-        prompt_speech_16k, prompt_text = load_voice_prompt(voice_path, text_path)
-        
-        # 生成唯一文件名和ID
-        audio_id = str(uuid.uuid4())
-        final_wav_path = os.path.join(CLIENT_OUTPUT_DIR, f"{audio_id}.wav")
-        
-        # 分割长文本
-        text_segments = split_text(text)
-        print(f"文本已分割为{len(text_segments)}段")
-        
-        # 临时音频文件路径列表
-        temp_audio_files = []
-        
-        # 逐段合成语音
-        for i, segment in enumerate(text_segments):
-            print(f"开始合成第{i+1}/{len(text_segments)}段: '{segment}'")
-            
-            # 临时文件路径
-            temp_output_path = os.path.join(CLIENT_OUTPUT_DIR, f"{audio_id}_part{i}.wav")
-            
-            # 合成语音
-            for j, result in enumerate(cosyvoice.inference_zero_shot(segment, prompt_text, prompt_speech_16k, stream=False)):
-                tts_speech = result['tts_speech']
-                torchaudio.save(temp_output_path, tts_speech, cosyvoice.sample_rate)
-                print(f"已保存第{i+1}段语音文件: {temp_output_path}")
-                break  # 只保存第一个结果
-            
-            temp_audio_files.append(temp_output_path)
-        
-        # 拼接所有音频段
-        if len(temp_audio_files) > 1:
-            print(f"正在拼接{len(temp_audio_files)}个音频文件...")
-            concatenate_audio(temp_audio_files, final_wav_path)
-            print(f"已拼接所有音频段: {final_wav_path}")
-        else:
-            # 单段音频直接使用
-            final_wav_path = temp_audio_files[0]
-        
-        # 转换为MP3格式
-        mp3_path = convert_wav_to_mp3(final_wav_path)
-        mp3_filename = os.path.basename(mp3_path)
-        wav_filename = os.path.basename(final_wav_path)
-        
-        # 删除临时文件
-        if len(temp_audio_files) > 1:
-            for temp_file in temp_audio_files:
-                try:
-                    os.remove(temp_file)
-                    print(f"已删除临时文件: {temp_file}")
-                except Exception as e:
-                    print(f"删除临时文件失败: {str(e)}")
-        
-        # 创建记录
-        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-        audio_record = {
-            "id": audio_id,
-            "text": text,
-            "timestamp": timestamp,
-            "wav_path": final_wav_path,
-            "mp3_path": mp3_path,
-            "wav_url": f"/client_output/{wav_filename}",
-            "mp3_url": f"/client_output/{mp3_filename}",
-            "user_id": user_id,
-            "session_id": session_id,
-            "gender": gender,
-            "voice_label": voice_label
-        }
-        
-        # 保存记录
-        save_audio_record(audio_record)
-        
-        return JSONResponse({
-            "success": True,
-            "message": "脚本已确认并生成最终音频",
-            "audio_id": audio_id,
-            "wav_url": f"/client_output/{wav_filename}",
-            "mp3_url": f"/client_output/{mp3_filename}",
-            "text": text,
-            "timestamp": timestamp
+    ensure_model_ready()
+    priority = resolve_priority(priority, "final")
+    tenant = enforce_rate_limit(request)
+    print(f"收到脚本确认请求: '{text}', 性别: {gender}, 声音: {voice_label}")
+    source_task_id = _find_preview(preview_task_id, text, gender, voice_label)
+
+    task_id = str(uuid.uuid4())
+    SYNTHESIS_TASKS[task_id] = {
+        "kind": "final",
+        "status": TaskState.pending,
+        "result": None,
+        "error": None,
+        "priority": priority,
+        "gender": gender,
+        "voice_label": voice_label,
+        "created_at": time.time()
+    }
+
+    if source_task_id:
+        # 文本和声音完全一致，直接复用试听音频（文件操作放到线程中，避免阻塞事件循环）
+        result = await asyncio.to_thread(
+            _promote_preview, source_task_id, text, gender, voice_label, user_id, session_id
+        )
+        if result:
+            PREVIEW_PROMOTION_STATS["hits"] += 1
+            TASKS_TOTAL.labels("final", "promoted").inc()
+            SYNTHESIS_TASKS[task_id].update({
+                "status": TaskState.completed,
+                "result": result,
+                "timings": {"queue_seconds": 0.0, "compute_seconds": 0.0}
+            })
+            return JSONResponse({**result, "task_id": task_id, "timings": SYNTHESIS_TASKS[task_id]["timings"]})
+
+    PREVIEW_PROMOTION_STATS["misses"] += 1
+    # 同一用户同一会话重复确认相同的文案时合并到进行中的任务
+    flight = _coalesce_task(("final", text, gender, voice_label, user_id, session_id), task_id, priority)
+    if flight is not None:
+        job = flight.job
+    else:
+        try:
+            # 与 /synthesize 共用公平调度队列，由推理线程执行
+            job = Job(task_id, tenant, len(split_text_for(text, priority)),
+                      lambda: _run_final_task(task_id, text, gender, voice_label, user_id, session_id),
+                      priority=priority)
+            _enqueue_flight(("final", text, gender, voice_label, user_id, session_id), task_id, job)
+            TASKS_TOTAL.labels("final", TaskState.pending.value).inc()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"无法创建最终音频任务: {str(e)}")
+
+    if wait_seconds and wait_seconds > 0:
+        timeout = min(wait_seconds, CONFIRM_MAX_WAIT_SECONDS)
+        try:
+            # shield 防止等待超时时取消底层任务
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(job.future)), timeout)
+        except (asyncio.TimeoutError, JobCancelled):
+            pass
+        task = SYNTHESIS_TASKS[task_id]
+        if task["status"] == TaskState.completed:
+            return JSONResponse({**task["result"], "task_id": task_id, "timings": task.get("timings")})
+        if task["status"] == TaskState.failed:
+            raise HTTPException(status_code=500, detail=f"确认脚本失败: {task['error']}")
+        if task["status"] == TaskState.cancelled:
+            raise HTTPException(status_code=409, detail="任务已取消")
+
+    response = {
+        "task_id": task_id,
+        "status": SYNTHESIS_TASKS[task_id]["status"],
+        "status_url": f"/synthesis_tasks/{task_id}/status"
+    }
+    if flight is not None:
+        response["coalesced_with"] = flight.leader
+    return JSONResponse(response, status_code=202)
+
+# == 批量合成 ==
+# 一次提交多条文案，作为一个 batch 优先级任务调度；按音色分组执行以复用提示缓存
+BATCH_TASKS: Dict[str, Dict[str, Any]] = {}
+BATCH_MAX_ITEMS = int(os.environ.get("TTS_BATCH_MAX_ITEMS", "500"))
+
+
+def _parse_batch_items(raw_items: Any) -> List[Dict[str, str]]:
+    """校验批量条目，返回 [{"id", "text", "gender", "voice_label"}]，有问题时返回400并指出条目序号"""
+    if not isinstance(raw_items, list) or not raw_items:
+        raise HTTPException(status_code=400, detail="items 必须是非空列表")
+    if len(raw_items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"单个批量任务最多 {BATCH_MAX_ITEMS} 条")
+    items = []
+    checked_voices = set()
+    for index, raw in enumerate(raw_items):
+        if not isinstance(raw, dict) or not all(isinstance(raw.get(key), str) and raw.get(key).strip()
+                                                for key in ("text", "gender", "voice_label")):
+            raise HTTPException(status_code=400, detail=f"第{index + 1}条缺少 text、gender 或 voice_label")
+        voice = (raw["gender"], raw["voice_label"])
+        if voice not in checked_voices:
+            try:
+                get_voice_path(*voice)
+            except HTTPException as e:
+                raise HTTPException(status_code=400, detail=f"第{index + 1}条: {e.detail}")
+            checked_voices.add(voice)
+        items.append({
+            "id": str(raw.get("id") or index + 1),
+            "text": raw["text"],
+            "gender": raw["gender"],
+            "voice_label": raw["voice_label"],
         })
+    return items
+
+
+def _run_synthesis_batch(batch_id: str, items: List[Dict[str, str]]):
+    """在推理线程中依次合成批量条目，完成后生成清单和zip包"""
+    batch = BATCH_TASKS.get(batch_id)
+    if not batch:
+        return
+    batch["status"] = TaskState.processing
+    started_at = time.time()
+    batch["timings"] = {"queue_seconds": round(started_at - batch["created_at"], 3)}
+    timer = StageTimer(batch["timings"])
+    timer.record("queue_wait", started_at - batch["created_at"])
+    _publish_task(batch_id)
+    first_segment = True
+    # 同一音色的条目连续执行，提示音频和音色特征只加载一次
+    order = sorted(range(len(items)), key=lambda i: (items[i]["gender"], items[i]["voice_label"], i))
+    try:
+        raise_if_cancelled()
+        for index in order:
+            item, progress = items[index], batch["items"][index]
+            progress["status"] = TaskState.processing
+            file_stem = f"{batch_id}_{index + 1:04d}"
+            part_paths = []
+            try:
+                with timer.stage("prompt_load"):
+                    voice_path, text_path = get_voice_path(item["gender"], item["voice_label"])
+                    prompt_speech_16k, prompt_text = PROMPT_CACHE.get(voice_path, text_path)
+                with timer.stage("text_split"):
+                    text_segments = split_text_for(item["text"], batch["priority"])
+                for i, segment in enumerate(text_segments):
+                    if not first_segment:
+                        SYNTHESIS_QUEUE.preempt_point()
+                    first_segment = False
+                    part_path = os.path.join(OUTPUT_DIR, f"{file_stem}_part{i}.wav")
+                    render_segment(timer, segment, voice_path, prompt_text, prompt_speech_16k, part_path)
+                    part_paths.append(part_path)
+                    batch["segments_done"] += 1
+                    _publish_task(batch_id, "progress")
+                wav_path = os.path.join(OUTPUT_DIR, f"{file_stem}.wav")
+                with timer.stage("concatenate"):
+                    concatenate_audio(part_paths, wav_path)
+                with timer.stage("encode"):
+                    mp3_path = convert_wav_to_mp3(wav_path)
+                progress.update({
+                    "status": TaskState.completed,
+                    "wav_url": f"/output/{os.path.basename(wav_path)}",
+                    "mp3_url": f"/output/{os.path.basename(mp3_path)}",
+                })
+                batch["items_done"] += 1
+            except Exception as e:
+                progress.update({"status": TaskState.failed, "error": getattr(e, "detail", None) or str(e)})
+                batch["items_failed"] += 1
+                # 失败条目剩余的分段不再合成，计入进度
+                batch["segments_done"] += progress["segments"] - len(part_paths)
+            finally:
+                for part_path in part_paths:
+                    try:
+                        os.remove(part_path)
+                    except OSError:
+                        pass
+
+        with timer.stage("package"):
+            _package_batch(batch_id, items)
+        batch["status"] = TaskState.failed if batch["items_done"] == 0 else TaskState.completed
+    except JobCancelled:
+        # 已完成条目的音频保留，未完成的条目标记为取消，不再打包
+        _cancel_batch_items(batch)
+        batch["status"] = TaskState.cancelled
+        CANCELLED_SEGMENTS.labels("batch").inc(batch["segments_total"] - batch["segments_done"])
     except Exception as e:
-        print(f"确认脚本过程中出错: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"确认脚本失败: {str(e)}")
+        batch["status"] = TaskState.failed
+        batch["error"] = str(e)
+    finally:
+        TASKS_TOTAL.labels("batch", batch["status"].value).inc()
+        job = current_job()
+        preempted = job.preempted_seconds if job else 0.0
+        batch["timings"]["compute_seconds"] = round(time.time() - started_at - preempted, 3)
+        if preempted:
+            batch["timings"]["preempted_seconds"] = round(preempted, 3)
+        _publish_task(batch_id)
+
+
+def _cancel_batch_items(batch: Dict[str, Any]):
+    for progress in batch["items"]:
+        if progress["status"] in (TaskState.pending, TaskState.processing):
+            progress["status"] = TaskState.cancelled
+
+
+def _package_batch(batch_id: str, items: List[Dict[str, str]]):
+    """写入批量任务清单，并把成功条目的MP3和清单打成zip包"""
+    batch = BATCH_TASKS[batch_id]
+    manifest = []
+    archive_names = {}
+    for index, (item, progress) in enumerate(zip(items, batch["items"])):
+        entry = {**item, "status": progress["status"].value}
+        if progress["status"] == TaskState.completed:
+            # zip内文件名: 序号_条目ID.mp3
+            safe_id = re.sub(r"[^\w-]", "_", item["id"])
+            archive_names[index] = f"{index + 1:04d}_{safe_id}.mp3"
+            entry.update({"file": archive_names[index], "wav_url": progress["wav_url"], "mp3_url": progress["mp3_url"]})
+        else:
+            entry["error"] = progress.get("error")
+        manifest.append(entry)
+
+    manifest_path = os.path.join(OUTPUT_DIR, f"{batch_id}_manifest.json")
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    zip_path = os.path.join(OUTPUT_DIR, f"{batch_id}.zip")
+    # MP3已经是压缩格式，zip内直接存储
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_STORED) as archive:
+        archive.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2))
+        for index, name in archive_names.items():
+            archive.write(os.path.join(OUTPUT_DIR, os.path.basename(batch["items"][index]["mp3_url"])), name)
+    batch["manifest_url"] = f"/output/{os.path.basename(manifest_path)}"
+    batch["zip_url"] = f"/output/{os.path.basename(zip_path)}"
+
+
+@app.post("/synthesis_batches")
+async def create_synthesis_batch(request: Request):
+    """
+    批量语音合成：立即返回 202，所有条目作为一个 batch 优先级任务调度
+
+    请求体:
+    - JSON: {"items": [{"text", "gender", "voice_label", "id"(可选)}], "priority"(可选)}
+    - 或 multipart 表单: file 为每行一个条目的 JSONL 文件，priority（可选）
+
+    完成后 zip_url 为所有成功条目的MP3和 manifest.json 打包，manifest_url 为单独的清单
+    """
+    ensure_model_ready()
+    if "application/json" in request.headers.get("content-type", ""):
+        try:
+            payload = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="请求体不是有效的JSON")
+        if not isinstance(payload, dict):
+            raise HTTPException(status_code=400, detail="请求体必须是JSON对象")
+        raw_items, priority = payload.get("items"), payload.get("priority")
+    else:
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="请上传 JSONL 文件（字段名 file）")
+        raw_items = []
+        for line_no, line in enumerate((await upload.read()).decode("utf-8-sig").splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                raw_items.append(json.loads(line))
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"JSONL 第{line_no}行不是有效的JSON")
+        priority = form.get("priority")
+
+    items = _parse_batch_items(raw_items)
+    priority = resolve_priority(priority, "batch")
+    tenant = enforce_rate_limit(request)
+
+    batch_id = f"batch-{uuid.uuid4()}"
+    segment_counts = [len(split_text_for(item["text"], priority)) for item in items]
+    BATCH_TASKS[batch_id] = {
+        "batch_id": batch_id,
+        "status": TaskState.pending,
+        "priority": priority,
+        "created_at": time.time(),
+        "items_total": len(items),
+        "items_done": 0,
+        "items_failed": 0,
+        "segments_total": sum(segment_counts),
+        "segments_done": 0,
+        "items": [
+            {"id": item["id"], "status": TaskState.pending, "segments": count}
+            for item, count in zip(items, segment_counts)
+        ],
+        "manifest_url": None,
+        "zip_url": None,
+        "error": None,
+    }
+    job = Job(batch_id, tenant, sum(segment_counts), lambda: _run_synthesis_batch(batch_id, items), priority=priority)
+    SYNTHESIS_QUEUE.put(job)
+    TASKS_TOTAL.labels("batch", TaskState.pending.value).inc()
+    return JSONResponse(
+        {
+            "batch_id": batch_id,
+            "status": TaskState.pending,
+            "items_total": len(items),
+            "status_url": f"/synthesis_batches/{batch_id}"
+        },
+        status_code=202,
+    )
+
+
+@app.get("/synthesis_batches/{batch_id}")
+async def get_synthesis_batch(batch_id: str):
+    """批量任务进度：条目数、分段数和每个条目的状态"""
+    batch = BATCH_TASKS.get(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="批量任务不存在")
+    return batch
+
+
+@app.delete("/synthesis_batches/{batch_id}")
+async def cancel_synthesis_batch(batch_id: str):
+    """
+    取消批量任务：排队中的直接取消；执行中的在下一个分段边界停止，已完成条目的音频保留，不再打包
+
+    返回值与 DELETE /synthesis_tasks/{task_id} 相同
+    """
+    batch = BATCH_TASKS.get(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="批量任务不存在")
+    if batch["status"] in FINAL_STATES:
+        raise HTTPException(status_code=409, detail=f"批量任务已结束: {batch['status'].value}")
+    cancelled = SYNTHESIS_QUEUE.cancel(batch_id)
+    if cancelled["running"]:
+        batch["cancel_requested"] = True
+        _publish_task(batch_id)
+        return JSONResponse({"batch_id": batch_id, "status": batch["status"], "cancel_requested": True},
+                            status_code=202)
+    if not cancelled["queued"]:
+        raise HTTPException(status_code=409, detail=f"批量任务已结束: {batch['status'].value}")
+    _cancel_batch_items(batch)
+    _record_cancelled(batch, "batch", batch["segments_total"])
+    _publish_task(batch_id)
+    return {"batch_id": batch_id, "status": batch["status"]}
+
+
+# == 音频下载 ==
+# 输出文件名带UUID且写入后不再修改，可以长期缓存
+AUDIO_CACHE_CONTROL = "public, max-age=31536000, immutable"
+RENDITION_CACHE = RenditionCache(transcode_audio)
+
+
+async def _read_file_range(path: str, start: int, end: int, chunk_size: int = 64 * 1024):
+    """在线程中按块读取文件的 [start, end] 闭区间，不阻塞事件循环"""
+    with open(path, "rb") as f:
+        await asyncio.to_thread(f.seek, start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await asyncio.to_thread(f.read, min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def _serve_audio(directory: str, filename: str, request: Request, format: Optional[str]) -> Response:
+    """
+    下载输出音频，支持 Range、ETag 和按需转码
+
+    参数:
+    - format: 目标格式（可选），AUDIO_FORMATS 中的格式名，或 auto 按 Accept 头协商；
+      转码结果缓存在原文件旁边，同一格式只转码一次
+    """
+    if os.path.basename(filename) != filename or filename.startswith("."):
+        raise HTTPException(status_code=404, detail="文件不存在")
+    path = os.path.join(directory, filename)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="文件不存在")
+
+    headers = {"Cache-Control": AUDIO_CACHE_CONTROL}
+    media_type = None
+    if format:
+        if format == "auto":
+            format = negotiate_format(request.headers.get("accept", ""))
+            headers["Vary"] = "Accept"
+        elif format not in AUDIO_FORMATS:
+            raise HTTPException(status_code=400, detail=f"不支持的音频格式: {format}，可选: {', '.join(AUDIO_FORMATS)}")
+        # 优先从同名WAV转码，避免有损格式二次压缩
+        source_path = os.path.splitext(path)[0] + ".wav"
+        if not os.path.isfile(source_path):
+            source_path = path
+        if format == "wav" and source_path.endswith(".wav"):
+            path = source_path
+        else:
+            try:
+                path = await asyncio.to_thread(RENDITION_CACHE.get, source_path, format)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"音频转码失败: {str(e)}")
+        media_type = AUDIO_FORMATS[format].media_type
+
+    stat = os.stat(path)
+    headers["Accept-Ranges"] = "bytes"
+    response = FileResponse(path, media_type=media_type, headers=headers, stat_result=stat)
+    etag = response.headers["etag"]
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag, **headers})
+
+    # 自行处理 Range：旧版本 Starlette 的 FileResponse 总是返回整个文件。
+    # If-Range 与当前版本不符时（文件已变化）按规范返回整个文件
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and if_range in (None, etag, response.headers["last-modified"]):
+        try:
+            byte_range = parse_byte_range(range_header, stat.st_size)
+        except ValueError:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{stat.st_size}", **headers})
+        if byte_range is not None:
+            start, end = byte_range
+            headers.update({
+                "Content-Range": f"bytes {start}-{end}/{stat.st_size}",
+                "Content-Length": str(end - start + 1),
+                "ETag": etag,
+                "Last-Modified": response.headers["last-modified"],
+            })
+            return StreamingResponse(_read_file_range(path, start, end), status_code=206,
+                                     media_type=response.media_type, headers=headers)
+    return response
+
+
+@app.api_route("/output/{filename}", methods=["GET", "HEAD"])
+async def get_output_file(filename: str, request: Request, format: Optional[str] = None):
+    """下载试听音频"""
+    return await _serve_audio(OUTPUT_DIR, filename, request, format)
+
+
+@app.api_route("/client_output/{filename}", methods=["GET", "HEAD"])
+async def get_client_output_file(filename: str, request: Request, format: Optional[str] = None):
+    """下载最终音频"""
+    return await _serve_audio(CLIENT_OUTPUT_DIR, filename, request, format)
+
+
+@app.api_route("/voice_samples/{gender}/{filename}", methods=["GET", "HEAD"])
+async def get_voice_sample(gender: str, filename: str, request: Request):
+    """下载音色试听样本（文件名带内容哈希，可永久缓存）"""
+    if gender not in ("male", "female"):
+        raise HTTPException(status_code=404, detail="文件不存在")
+    return await _serve_audio(os.path.join(VOICE_SAMPLES_DIR, gender), filename, request, None)
+
 
 @app.get("/saved_audios")
 async def get_saved_audios():
@@ -677,12 +2180,28 @@ async def get_saved_audios():
 
 @app.get("/health")
 async def health_check():
-    """健康检查端点"""
+    """存活检查端点：进程能响应即返回ok，不代表模型已就绪"""
     return JSONResponse({
         "status": "ok",
         "message": "TTS服务正常运行"
     })
 
+@app.get("/ready")
+async def readiness_check():
+    """就绪检查端点：模型和音色库加载完成、预热结束后返回200，否则返回503"""
+    ready = MODEL_READY.is_set() and SERVICE_STATE["voice_catalog"]["status"] == "ready"
+    return JSONResponse({
+        "ready": ready,
+        "model": SERVICE_STATE["model"],
+        "voice_catalog": SERVICE_STATE["voice_catalog"],
+        "voice_samples": SERVICE_STATE["voice_samples"],
+        "warm_cache": {
+            **SERVICE_STATE["warm_up"],
+            "prompt_cache": PROMPT_CACHE.stats(),
+            "registered_speakers": len(REGISTERED_SPEAKERS)
+        }
+    }, status_code=200 if ready else 503)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8080) 
\ No newline at end of file
@@ -46,7 +46,7 @@ async def wechat_login_route(login_data: SocialLogin):
     微信登录
     """
     try:
-        result = wechat_login(login_data.code)
+        result = await wechat_login(login_data.code)
         return result
     except ValueError as e:
         raise HTTPException(status_code=401, detail=str(e))
@@ -60,7 +60,7 @@ async def google_login_route(login_data: GoogleLogin):
         # 打印接收到的请求数据
         print(f"接收到的Google登录数据: {login_data}")
         print(f"收到Google登录请求，授权码: {login_data.code[:10] if login_data.code else 'None'}...")
-        result = google_login(login_data.code)
+        result = await google_login(login_data.code)
         print("Google登录成功")
         return result
     except ValueError as e:
@@ -2,7 +2,9 @@ import os
 import json
 import hashlib
 import jwt
-import requests
+import httpx
+import asyncio
+import random
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 from uuid import uuid4
@@ -23,6 +25,59 @@ WECHAT_APP_SECRET = os.environ.get("WECHAT_APP_SECRET", "your-wechat-app-secret"
 GOOGLE_CLIENT_ID = os.environ.get("GOOGLE_CLIENT_ID", "your-google-client-id")
 GOOGLE_CLIENT_SECRET = os.environ.get("GOOGLE_CLIENT_SECRET", "your-google-client-secret")
 
+# OAuth服务地址（可通过环境变量指向本地模拟服务进行测试）
+WECHAT_API_BASE = os.environ.get("WECHAT_API_BASE", "https://api.weixin.qq.com")
+GOOGLE_TOKEN_URL = os.environ.get("GOOGLE_TOKEN_URL", "https://oauth2.googleapis.com/token")
+GOOGLE_USERINFO_URL = os.environ.get("GOOGLE_USERINFO_URL", "https://www.googleapis.com/oauth2/v2/userinfo")
+
+# OAuth HTTP客户端配置：显式超时与有限重试
+OAUTH_TIMEOUT = float(os.environ.get("OAUTH_TIMEOUT", "10"))
+OAUTH_CONNECT_TIMEOUT = float(os.environ.get("OAUTH_CONNECT_TIMEOUT", "3"))
+OAUTH_MAX_RETRIES = int(os.environ.get("OAUTH_MAX_RETRIES", "2"))
+OAUTH_RETRY_BACKOFF = 0.3  # 秒，指数退避的基数
+
+# 全局共享的OAuth客户端（连接池 + keep-alive）
+_oauth_client: Optional[httpx.AsyncClient] = None
+
+def get_oauth_client() -> httpx.AsyncClient:
+    """获取共享的异步OAuth HTTP客户端，首次调用时创建"""
+    global _oauth_client
+    if _oauth_client is None or _oauth_client.is_closed:
+        _oauth_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(OAUTH_TIMEOUT, connect=OAUTH_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=30.0),
+        )
+    return _oauth_client
+
+async def close_oauth_client():
+    """关闭共享的OAuth客户端（应用关闭时调用）"""
+    global _oauth_client
+    if _oauth_client is not None:
+        await _oauth_client.aclose()
+        _oauth_client = None
+
+async def _oauth_request(method: str, url: str, idempotent: bool = True, **kwargs) -> httpx.Response:
+    """
+    发送OAuth请求，失败时按指数退避重试
+
+    授权码只能使用一次，所以换取令牌这类非幂等请求只在连接阶段失败时重试，
+    幂等请求在网络错误和5xx响应时都会重试。
+    """
+    client = get_oauth_client()
+    for attempt in range(OAUTH_MAX_RETRIES + 1):
+        try:
+            response = await client.request(method, url, **kwargs)
+        except (httpx.ConnectError, httpx.ConnectTimeout):
+            if attempt >= OAUTH_MAX_RETRIES:
+                raise
+        except httpx.TransportError:
+            if not idempotent or attempt >= OAUTH_MAX_RETRIES:
+                raise
+        else:
+            if response.status_code < 500 or not idempotent or attempt >= OAUTH_MAX_RETRIES:
+                return response
+        await asyncio.sleep(OAUTH_RETRY_BACKOFF * (2 ** attempt) * (1 + random.random()))
+
 # 密码哈希
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
@@ -119,22 +174,38 @@ def login_user(email: str, password: str) -> Dict[str, Any]:
     }
 
 # 微信登录
-def wechat_login(code: str) -> Dict[str, Any]:
-    # 获取微信访问令牌
-    token_url = f"https://api.weixin.qq.com/sns/oauth2/access_token?appid={WECHAT_APP_ID}&secret={WECHAT_APP_SECRET}&code={code}&grant_type=authorization_code"
-    response = requests.get(token_url)
-    token_data = response.json()
+async def wechat_login(code: str) -> Dict[str, Any]:
+    # 获取微信访问令牌（授权码只能使用一次，不做重试）
+    token_url = f"{WECHAT_API_BASE}/sns/oauth2/access_token"
+    try:
+        response = await _oauth_request("GET", token_url, idempotent=False, params={
+            "appid": WECHAT_APP_ID,
+            "secret": WECHAT_APP_SECRET,
+            "code": code,
+            "grant_type": "authorization_code",
+        })
+        token_data = response.json()
+    except httpx.HTTPError as e:
+        raise ValueError(f"微信授权请求失败: {str(e)}")
     
     if "errcode" in token_data:
         raise ValueError(f"微信授权失败: {token_data.get('errmsg')}")
     
     access_token = token_data.get("access_token")
     openid = token_data.get("openid")
+    if not access_token or not openid:
+        raise ValueError("微信授权失败: 响应中缺少access_token或openid")
     
     # 获取用户信息
-    user_info_url = f"https://api.weixin.qq.com/sns/userinfo?access_token={access_token}&openid={openid}"
-    user_info_response = requests.get(user_info_url)
-    user_info = user_info_response.json()
+    user_info_url = f"{WECHAT_API_BASE}/sns/userinfo"
+    try:
+        user_info_response = await _oauth_request("GET", user_info_url, params={
+            "access_token": access_token,
+            "openid": openid,
+        })
+        user_info = user_info_response.json()
+    except httpx.HTTPError as e:
+        raise ValueError(f"获取微信用户信息失败: {str(e)}")
     
     if "errcode" in user_info:
         raise ValueError(f"获取微信用户信息失败: {user_info.get('errmsg')}")
@@ -142,7 +213,7 @@ def wechat_login(code: str) -> Dict[str, Any]:
     # 查找或创建用户
     user = None
     for u in users_db.values():
-        if hasattr(u, "wechat_openid") and getattr(u, "wechat_openid") == openid:
+        if u.wechat_id is not None and u.wechat_id == openid:
             user = u
             break
     
@@ -155,9 +226,8 @@ def wechat_login(code: str) -> Dict[str, Any]:
             email=f"{openid}@wechat.user",  # 微信不提供邮箱，使用虚拟邮箱
             password=hash_password(str(uuid4())),  # 随机密码
             avatar=user_info.get("headimgurl"),
+            wechat_id=openid,  # 记录微信OpenID
         )
-        # 添加微信OpenID
-        setattr(user, "wechat_openid", openid)
         users_db[user_id] = user
     
     # 创建令牌
@@ -177,7 +247,7 @@ def wechat_login(code: str) -> Dict[str, Any]:
     }
 
 # Google登录
-def google_login(code: str) -> Dict[str, Any]:
+async def google_login(code: str) -> Dict[str, Any]:
     """
     处理Google OAuth授权码登录
     获取访问令牌，然后获取用户信息
@@ -192,7 +262,7 @@ def google_login(code: str) -> Dict[str, Any]:
     print(f"Google OAuth配置: client_id={client_id[:10]}..., redirect_uri={redirect_uri}")
     
     # 获取访问令牌
-    token_url = "https://oauth2.googleapis.com/token"
+    token_url = GOOGLE_TOKEN_URL
     token_data = {
         "code": code,
         "client_id": client_id,
@@ -204,7 +274,7 @@ def google_login(code: str) -> Dict[str, Any]:
     try:
         # 发送请求获取访问令牌
         print("发送Google令牌请求...")
-        token_response = requests.post(token_url, data=token_data, headers={
+        token_response = await _oauth_request("POST", token_url, idempotent=False, data=token_data, headers={
             "Content-Type": "application/x-www-form-urlencoded"
         })
         
@@ -232,8 +302,9 @@ def google_login(code: str) -> Dict[str, Any]:
             raise ValueError("未获取到有效的访问令牌")
             
         # 获取用户信息
-        user_info_url = "https://www.googleapis.com/oauth2/v2/userinfo"
-        user_info_response = requests.get(
+        user_info_url = GOOGLE_USERINFO_URL
+        user_info_response = await _oauth_request(
+            "GET",
             user_info_url,
             headers={"Authorization": f"Bearer {access_token}"}
         )
@@ -296,7 +367,7 @@ def google_login(code: str) -> Dict[str, Any]:
             )
         }
         
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"Google OAuth请求异常: {str(e)}")
         raise ValueError(f"Google OAuth请求失败: {str(e)}")
     except ValueError as e:
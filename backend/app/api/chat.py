@@ -1,5 +1,4 @@
 from fastapi import APIRouter, HTTPException, Body
-import httpx
 import os
 from typing import List, Dict, Any, Optional
 import json
@@ -8,14 +7,39 @@ import random
 import re
 from collections import defaultdict
 
+from ..llm_client import LLMUnavailable, get_llm_client
+from ..metrics import LLM_FALLBACKS_TOTAL, record_llm_usage
+
 # 设置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-DEEPSEEK_API_KEY = "sk-cd33591640b74e3cadbcb3407ac0c298"
-DEEPSEEK_API_URL = "https://api.deepseek.com/v1/chat/completions"
+# 未配置时不请求上游，聊天和音色推荐直接返回本地兜底结果
+DEEPSEEK_API_KEY = os.environ.get("DEEPSEEK_API_KEY", "")
+if not DEEPSEEK_API_KEY:
+    logger.warning("未设置DEEPSEEK_API_KEY，聊天和音色推荐将只返回本地兜底结果")
+# 可指向本地模拟服务进行测试（见 backend/mock_llm.py）
+DEEPSEEK_API_URL = os.environ.get("DEEPSEEK_API_URL", "https://api.deepseek.com/v1/chat/completions")
+
+# 上游不可用时的本地兜底：聊天直接打开音色列表，让用户不依赖AI助手也能继续试听和生成配音
+CHAT_FALLBACK_MESSAGE = """抱歉，AI助手暂时繁忙，请稍后再试。您也可以先从下面的音色列表中试听和选择音色。
+<<<{
+  "action": "recommend_voice_styles",
+  "text": ""
+}>>>"""
+# 音色推荐按关键词推断风格标签
+LOCAL_STYLE_KEYWORDS = {
+    "促销": ("元", "折", "优惠", "特价", "促销", "活动", "送"),
+    "党政": ("党", "政府", "人民", "建设"),
+    "颁奖": ("颁奖", "获奖", "荣获"),
+    "年会": ("年会", "新年", "新春"),
+    "故事": ("从前", "故事"),
+    "介绍": ("公司", "企业", "品牌", "集团"),
+    "温情": ("温馨", "提示", "请注意"),
+}
+DEFAULT_STYLE_TAGS = ["大气", "质感", "沉稳"]
 
 # 魔声AI的系统提示
 SYSTEM_PROMPT = """你是魔声AI，一个专业的AI配音助手。你专门帮助用户构思创作配音文案，并提供多种专业配音员音色，生成高质量的商业多语言配音。包括中文、英文、日语、韩语、法语、西语。
@@ -105,6 +129,21 @@ SYSTEM_PROMPT = """你是魔声AI，一个专业的AI配音助手。你专门帮
 4. 始终保持专业、友好和有帮助的态度。
 """
 
+async def post_to_deepseek(operation: str, payload: Dict[str, Any], max_timeout: float, hedge: bool = False):
+    """
+    经共享的大模型客户端发送请求
+
+    Raises:
+        LLMUnavailable: 未配置API密钥，或上游暂不可用
+    """
+    if not DEEPSEEK_API_KEY:
+        raise LLMUnavailable("no_api_key")
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {DEEPSEEK_API_KEY}"
+    }
+    return await get_llm_client(DEEPSEEK_API_URL).post(operation, payload, headers, max_timeout, hedge=hedge)
+
 @router.post("/chat")
 async def chat_with_deepseek(
     messages: List[Dict[str, str]] = Body(...),
@@ -130,74 +169,77 @@ async def chat_with_deepseek(
             "stream": False
         }
         
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {DEEPSEEK_API_KEY}"
-        }
-        
         logger.info(f"发送请求到DeepSeek API")
         
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                DEEPSEEK_API_URL,
-                json=payload,
-                headers=headers
-            )
-            
-            logger.info(f"DeepSeek API响应状态码: {response.status_code}")
-            
-            # 保存完整响应以便调试
-            response_text = response.text
-            logger.info(f"DeepSeek API原始响应: {response_text}")
-            
-            if response.status_code != 200:
-                error_detail = response_text
-                try:
-                    error_json = response.json()
-                    if "error" in error_json:
-                        error_detail = error_json["error"].get("message", error_detail)
-                except:
-                    pass
-                
-                logger.error(f"DeepSeek API错误: {error_detail}")
-                
-                # 如果API密钥无效或额度不足，返回特定错误消息
-                if "API key" in error_detail or "authentication" in error_detail.lower() or "insufficient" in error_detail.lower():
-                    raise HTTPException(
-                        status_code=402,
-                        detail="DeepSeek API密钥无效或额度不足，请检查您的API密钥或充值账户。"
-                    )
-                
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"DeepSeek API错误: {error_detail}"
-                )
-            
-            result = response.json()
-            logger.info(f"处理后的结果: {result}")
-            
-            # 确保我们获得了正确的响应格式
-            if "choices" not in result or not result["choices"]:
-                logger.error("DeepSeek API响应格式错误: 缺少choices字段")
+        try:
+            response = await post_to_deepseek("chat", payload, max_timeout=60.0)
+        except LLMUnavailable as e:
+            logger.warning(f"DeepSeek API暂不可用（{e.reason}），返回本地兜底回复")
+            LLM_FALLBACKS_TOTAL.labels("chat", e.reason).inc()
+            return {"message": CHAT_FALLBACK_MESSAGE, "usage": {}, "degraded": True}
+        
+        logger.info(f"DeepSeek API响应状态码: {response.status_code}")
+
+        # 保存完整响应以便调试
+        response_text = response.text
+        logger.info(f"DeepSeek API原始响应: {response_text}")
+
+        if response.status_code != 200:
+            error_detail = response_text
+            try:
+                error_json = response.json()
+                if "error" in error_json:
+                    error_detail = error_json["error"].get("message", error_detail)
+            except:
+                pass
+
+            logger.error(f"DeepSeek API错误: {error_detail}")
+
+            # 如果API密钥无效或额度不足，返回特定错误消息
+            if "API key" in error_detail or "authentication" in error_detail.lower() or "insufficient" in error_detail.lower():
                 raise HTTPException(
-                    status_code=500,
-                    detail="DeepSeek API响应格式错误"
+                    status_code=402,
+                    detail="DeepSeek API密钥无效或额度不足，请检查您的API密钥或充值账户。"
                 )
-                
-            # 返回实际的AI响应，而不是固定的欢迎语
-            ai_message = result["choices"][0]["message"]["content"]
-            
-            return {
-                "message": ai_message,
-                "usage": result.get("usage", {})
-            }
-            
+
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"DeepSeek API错误: {error_detail}"
+            )
+
+        result = response.json()
+        logger.info(f"处理后的结果: {result}")
+
+        # 确保我们获得了正确的响应格式
+        if "choices" not in result or not result["choices"]:
+            logger.error("DeepSeek API响应格式错误: 缺少choices字段")
+            raise HTTPException(
+                status_code=500,
+                detail="DeepSeek API响应格式错误"
+            )
+
+        # 返回实际的AI响应，而不是固定的欢迎语
+        ai_message = result["choices"][0]["message"]["content"]
+        record_llm_usage("chat", result.get("usage", {}))
+
+        return {
+            "message": ai_message,
+            "usage": result.get("usage", {})
+        }
+
     except HTTPException:
         raise
     except Exception as e:
         logger.exception(f"处理聊天请求时发生错误: {str(e)}")
         raise HTTPException(status_code=500, detail=f"服务器错误: {str(e)}")
 
+def local_style_tags(text: str) -> List[str]:
+    """上游不可用时按关键词推断风格标签，不足3个时用默认标签补齐"""
+    letters = sum(1 for ch in text if ch.isascii() and ch.isalpha())
+    tags = ["英文"] if text and letters > len(text) / 2 else []
+    tags += [tag for tag, keywords in LOCAL_STYLE_KEYWORDS.items() if any(k in text for k in keywords)]
+    return tags + [tag for tag in DEFAULT_STYLE_TAGS if tag not in tags][:max(0, 3 - len(tags))]
+
 @router.post("/recommend_voice_styles")
 async def recommend_voice_styles(
     text: str = Body(..., embed=True),
@@ -237,22 +279,21 @@ async def recommend_voice_styles(
             "stream": False
         }
         
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {DEEPSEEK_API_KEY}"
-        }
-        
         logger.info(f"发送推荐请求到DeepSeek API")
         
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            response = await client.post(
-                DEEPSEEK_API_URL,
-                json=payload,
-                headers=headers
-            )
-            
+        try:
+            # 短调用：超过最近的p90耗时仍未返回时发出对冲请求
+            response = await post_to_deepseek("recommend_voice_styles", payload, max_timeout=20.0, hedge=True)
+        except LLMUnavailable as e:
+            logger.warning(f"DeepSeek API暂不可用（{e.reason}），按关键词推荐风格标签")
+            LLM_FALLBACKS_TOTAL.labels("recommend_voice_styles", e.reason).inc()
+            response = None
+
+        if response is None:
+            style_tags = local_style_tags(text)
+        else:
             logger.info(f"DeepSeek API响应状态码: {response.status_code}")
-            
+
             if response.status_code != 200:
                 error_detail = response.text
                 try:
@@ -261,19 +302,20 @@ async def recommend_voice_styles(
                         error_detail = error_json["error"].get("message", error_detail)
                 except:
                     pass
-                
+
                 logger.error(f"DeepSeek API错误: {error_detail}")
                 raise HTTPException(
                     status_code=response.status_code,
                     detail=f"DeepSeek API错误: {error_detail}"
                 )
-            
+
             result = response.json()
             logger.info(f"处理后的结果: {result}")
-            
+
             # 提取响应中的风格标签
             ai_message = result["choices"][0]["message"]["content"]
-            
+            record_llm_usage("recommend_voice_styles", result.get("usage", {}))
+
             # 尝试解析JSON
             try:
                 # 查找JSON格式内容
@@ -290,94 +332,95 @@ async def recommend_voice_styles(
                 logger.error(f"解析风格标签失败: {str(e)}")
                 # 使用一些默认标签
                 style_tags = ["大气", "质感", "沉稳"]
-            
-            logger.info(f"提取的风格标签: {style_tags}")
-            
-            if not style_tags:
-                style_tags = ["大气", "质感", "沉稳"]
-                logger.info(f"未提取到标签，使用默认: {style_tags}")
-
-            project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-            voice_dir = os.path.join(project_root, "prompt_voice")
-            male_dir = os.path.join(voice_dir, "male")
-            female_dir = os.path.join(voice_dir, "female")
-
-            all_male_voices_files = [f for f in os.listdir(male_dir) if f.endswith(".wav")]
-            all_female_voices_files = [f for f in os.listdir(female_dir) if f.endswith(".wav")]
-            all_male_voices = [os.path.splitext(f)[0] for f in all_male_voices_files]
-            all_female_voices = [os.path.splitext(f)[0] for f in all_female_voices_files]
-
-            def select_voices_for_gender(all_voices: List[str], target_tags: List[str], num_required: int) -> List[str]:
-                """为指定性别选择音色的核心逻辑 - 修正版"""
-                if not all_voices:
-                    return []
-
-                final_selection = set()
-                voices_used = set() # 跟踪已被选中的音色
-
-                # 1. 优先确保每个标签至少有一个代表
-                random.shuffle(target_tags)
-                for tag in target_tags:
-                    if len(final_selection) >= num_required:
-                        break
-
-                    # 在 *所有* 音色中查找包含当前标签且 *尚未被使用* 的音色
-                    tag_specific_matches = [
-                        voice for voice in all_voices
-                        if tag in voice and voice not in voices_used
-                    ]
-
-                    if tag_specific_matches:
-                        chosen_voice = random.choice(tag_specific_matches)
-                        final_selection.add(chosen_voice)
-                        voices_used.add(chosen_voice)
-
-                # 2. 如果名额未满，从所有 *至少匹配一个标签* 但 *尚未被使用* 的音色中随机补充
-                needed_more = num_required - len(final_selection)
-                if needed_more > 0:
-                    # 找到所有匹配至少一个标签的音色
-                    all_matching_voices = {
-                        voice for voice in all_voices
-                        if any(tag in voice for tag in target_tags)
-                    }
-                    # 排除已使用的
-                    available_matching = list(all_matching_voices - voices_used)
-                    if available_matching:
-                        fillers = random.sample(available_matching, min(needed_more, len(available_matching)))
-                        final_selection.update(fillers)
-                        voices_used.update(fillers)
-
-                # 3. 如果名额还未满，从所有 *剩余* 音色中（不匹配任何标签且未被使用）随机补充
-                needed_even_more = num_required - len(final_selection)
-                if needed_even_more > 0:
-                    available_others = [v for v in all_voices if v not in voices_used]
-                    if available_others:
-                        fillers = random.sample(available_others, min(needed_even_more, len(available_others)))
-                        final_selection.update(fillers)
-                        # voices_used.update(fillers) # 这里不需要再更新，因为不会再用到
-
-                # 4. 最终结果处理
-                final_list = list(final_selection)
-                # 如果因为某种原因选多了（理论上不太可能），裁剪
-                if len(final_list) > num_required:
-                    final_list = random.sample(final_list, num_required)
-
-                random.shuffle(final_list) # 最后打乱顺序
-                return final_list
-
-            selected_male_voices = select_voices_for_gender(all_male_voices, style_tags, count)
-            selected_female_voices = select_voices_for_gender(all_female_voices, style_tags, count)
-
-            logger.info(f"最终推荐男声: {selected_male_voices}")
-            logger.info(f"最终推荐女声: {selected_female_voices}")
-
-            return {
-                "success": True,
-                "recommended_styles": style_tags,
-                "male_voices": selected_male_voices,
-                "female_voices": selected_female_voices
-            }
-            
+
+        logger.info(f"提取的风格标签: {style_tags}")
+
+        if not style_tags:
+            style_tags = ["大气", "质感", "沉稳"]
+            logger.info(f"未提取到标签，使用默认: {style_tags}")
+
+        project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+        voice_dir = os.path.join(project_root, "prompt_voice")
+        male_dir = os.path.join(voice_dir, "male")
+        female_dir = os.path.join(voice_dir, "female")
+
+        all_male_voices_files = [f for f in os.listdir(male_dir) if f.endswith(".wav")]
+        all_female_voices_files = [f for f in os.listdir(female_dir) if f.endswith(".wav")]
+        all_male_voices = [os.path.splitext(f)[0] for f in all_male_voices_files]
+        all_female_voices = [os.path.splitext(f)[0] for f in all_female_voices_files]
+
+        def select_voices_for_gender(all_voices: List[str], target_tags: List[str], num_required: int) -> List[str]:
+            """为指定性别选择音色的核心逻辑 - 修正版"""
+            if not all_voices:
+                return []
+
+            final_selection = set()
+            voices_used = set() # 跟踪已被选中的音色
+
+            # 1. 优先确保每个标签至少有一个代表
+            random.shuffle(target_tags)
+            for tag in target_tags:
+                if len(final_selection) >= num_required:
+                    break
+
+                # 在 *所有* 音色中查找包含当前标签且 *尚未被使用* 的音色
+                tag_specific_matches = [
+                    voice for voice in all_voices
+                    if tag in voice and voice not in voices_used
+                ]
+
+                if tag_specific_matches:
+                    chosen_voice = random.choice(tag_specific_matches)
+                    final_selection.add(chosen_voice)
+                    voices_used.add(chosen_voice)
+
+            # 2. 如果名额未满，从所有 *至少匹配一个标签* 但 *尚未被使用* 的音色中随机补充
+            needed_more = num_required - len(final_selection)
+            if needed_more > 0:
+                # 找到所有匹配至少一个标签的音色
+                all_matching_voices = {
+                    voice for voice in all_voices
+                    if any(tag in voice for tag in target_tags)
+                }
+                # 排除已使用的
+                available_matching = list(all_matching_voices - voices_used)
+                if available_matching:
+                    fillers = random.sample(available_matching, min(needed_more, len(available_matching)))
+                    final_selection.update(fillers)
+                    voices_used.update(fillers)
+
+            # 3. 如果名额还未满，从所有 *剩余* 音色中（不匹配任何标签且未被使用）随机补充
+            needed_even_more = num_required - len(final_selection)
+            if needed_even_more > 0:
+                available_others = [v for v in all_voices if v not in voices_used]
+                if available_others:
+                    fillers = random.sample(available_others, min(needed_even_more, len(available_others)))
+                    final_selection.update(fillers)
+                    # voices_used.update(fillers) # 这里不需要再更新，因为不会再用到
+
+            # 4. 最终结果处理
+            final_list = list(final_selection)
+            # 如果因为某种原因选多了（理论上不太可能），裁剪
+            if len(final_list) > num_required:
+                final_list = random.sample(final_list, num_required)
+
+            random.shuffle(final_list) # 最后打乱顺序
+            return final_list
+
+        selected_male_voices = select_voices_for_gender(all_male_voices, style_tags, count)
+        selected_female_voices = select_voices_for_gender(all_female_voices, style_tags, count)
+
+        logger.info(f"最终推荐男声: {selected_male_voices}")
+        logger.info(f"最终推荐女声: {selected_female_voices}")
+
+        return {
+            "success": True,
+            "recommended_styles": style_tags,
+            "male_voices": selected_male_voices,
+            "female_voices": selected_female_voices,
+            "degraded": response is None
+        }
+
     except HTTPException:
         raise
     except Exception as e:
@@ -387,4 +430,4 @@ async def recommend_voice_styles(
 # 添加一个简单的健康检查端点
 @router.get("/health")
 async def health_check():
-    return {"status": "ok", "message": "聊天服务正常运行"} 
\ No newline at end of file
+    return {"status": "ok", "message": "聊天服务正常运行", "upstream": get_llm_client(DEEPSEEK_API_URL).snapshot()} 
\ No newline at end of file
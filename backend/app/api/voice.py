@@ -1,73 +1,78 @@
-from fastapi import APIRouter, HTTPException, Body
-from typing import List, Dict, Any
-import os
-import random
-import string
+from fastapi import APIRouter, HTTPException, Body, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+from tts_service.router import HOP_BY_HOP_HEADERS
+from ..tts_gateway import AUDIO_DIRECTORIES, AUDIO_REQUEST_HEADERS, choose_voices, forwarded_headers, get_tts_gateway
 
 router = APIRouter()
 
 @router.post("/generate")
 async def generate_voice(
+    request: Request,
     text: str = Body(...),
     accent: str = Body(...),
     style: str = Body(...)
 ):
     """
-    生成配音（模拟）
-    实际应用中，这里会调用TTS服务
+    生成配音：按风格匹配TTS音色，提交最终音频任务并等待结果
     """
-    try:
-        # 这里只是模拟，实际应用中会调用实际的TTS服务
-        file_name = ''.join(random.choices(string.ascii_letters + string.digits, k=10)) + '.mp3'
-        file_path = f"/static/output/{file_name}"
-        
-        # 在实际应用中，这里会保存TTS生成的音频文件
-        
-        return {
-            "success": True,
-            "file_url": file_path,
-            "text": text,
-            "accent": accent,
-            "style": style
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"生成语音失败: {str(e)}")
+    gateway = get_tts_gateway()
+    voices = choose_voices(await gateway.voice_catalog(), style)
+    if not voices:
+        raise HTTPException(status_code=503, detail="TTS服务没有可用的音色")
+    gender, voice_label = voices[0]
+    result = await gateway.confirm(text, gender, voice_label, headers=forwarded_headers(request))
+    return {
+        "success": True,
+        "file_url": result["mp3_url"],
+        "wav_url": result["wav_url"],
+        "text": text,
+        "accent": accent,
+        "style": style,
+        "gender": gender,
+        "voice_label": voice_label
+    }
 
 @router.post("/previews")
 async def get_audio_previews(
-    text: str = Body(...)
+    request: Request,
+    text: str = Body(..., embed=True)
 ):
     """
-    获取音频预览（模拟）
-    实际应用中，这里会生成多个不同风格的短音频预览
+    获取音频预览：三个不同的音色（在性别之间轮流选择），每个只合成第一段
     """
-    try:
-        # 模拟生成预览
-        previews = [
-            {
-                "id": "preview_1",
-                "url": "/static/samples/sample1.mp3",
-                "accent": "美式口音",
-                "voice_style": "专业"
-            },
+    gateway = get_tts_gateway()
+    voices = choose_voices(await gateway.voice_catalog(), count=3)
+    previews = await gateway.previews(text, voices, forwarded_headers(request))
+    return {
+        "success": True,
+        "previews": [
             {
-                "id": "preview_2",
-                "url": "/static/samples/sample2.mp3",
-                "accent": "英式口音",
-                "voice_style": "友好"
-            },
-            {
-                "id": "preview_3",
-                "url": "/static/samples/sample3.mp3",
-                "accent": "澳洲口音",
-                "voice_style": "热情"
+                "id": preview["task_id"],
+                "url": preview["mp3_url"],
+                "accent": None,
+                "voice_style": preview["voice_label"],
+                "gender": preview["gender"]
             }
-        ]
-        
-        return {
-            "success": True,
-            "previews": previews,
-            "text": text
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"获取预览失败: {str(e)}") 
\ No newline at end of file
+            for preview in previews
+        ],
+        "text": text
+    }
+
+@router.api_route("/audio/{replica}/{directory}/{filename}", methods=["GET", "HEAD"])
+async def stream_audio(replica: int, directory: str, filename: str, request: Request):
+    """
+    透传TTS副本上的音频文件，边收边发不在后端缓冲
+
+    Range、条件请求头和 format 参数原样转给TTS服务，状态码（206、304等）和缓存头原样返回
+    """
+    if directory not in AUDIO_DIRECTORIES or "/" in filename or filename.startswith("."):
+        raise HTTPException(status_code=404, detail="文件不存在")
+    headers = {k: v for k, v in request.headers.items() if k.lower() in AUDIO_REQUEST_HEADERS}
+    upstream = await get_tts_gateway().open_audio(
+        replica, f"/{directory}/{filename}", request.method, headers, dict(request.query_params)
+    )
+    response_headers = {k: v for k, v in upstream.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+    return StreamingResponse(upstream.aiter_raw(), status_code=upstream.status_code, headers=response_headers,
+                             background=BackgroundTask(upstream.aclose))
@@ -0,0 +1,50 @@
+"""
+上游服务的熔断器，TTS网关和大模型客户端共用
+"""
+import time
+from typing import Optional
+
+
+class CircuitBreaker:
+    """
+    连续失败 failure_threshold 次后断开，reset_seconds 秒内的请求直接失败；
+    之后进入半开状态，只放行一个探测请求，成功则闭合，失败则重新断开。
+    探测请求在 reset_seconds 内没有结果（如被取消）时再放行下一个
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_started: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_seconds:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        """是否放行一个请求；半开状态下只放行一个探测请求"""
+        state = self.state
+        if state == "closed":
+            return True
+        now = time.monotonic()
+        if state == "open" or (self.probe_started is not None and now - self.probe_started < self.reset_seconds):
+            return False
+        self.probe_started = now
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started = None
+
+    def record_failure(self):
+        self.failures += 1
+        self.probe_started = None
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
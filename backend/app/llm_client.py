@@ -0,0 +1,245 @@
+"""
+上游大模型（DeepSeek）的客户端
+
+上游的长尾延迟和故障不应直接变成后端的长尾延迟和堆积的协程：
+- 并发限制：同时在途的请求数不超过 LLM_MAX_CONCURRENCY，排队超过 LLM_QUEUE_TIMEOUT 秒直接失败
+- 自适应超时：按最近成功请求的p99耗时乘以 LLM_TIMEOUT_P99_MULTIPLIER，限制在 [LLM_MIN_TIMEOUT, 调用方给的上限] 内
+- 对冲请求：短调用超过最近的p90耗时仍未返回时再发一个相同的请求，取先返回的结果；
+  对冲请求数不超过总请求数的 LLM_HEDGE_BUDGET，且只在有空闲并发名额时发出
+- 熔断：连续失败 LLM_BREAKER_FAILURES 次后 LLM_BREAKER_RESET_SECONDS 秒内直接失败，由调用方返回本地兜底结果
+"""
+import asyncio
+import os
+import random
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Optional
+
+import httpx
+
+from .circuit_breaker import CircuitBreaker
+from .metrics import LLM_BREAKER_OPEN, LLM_HEDGES_TOTAL, LLM_IN_FLIGHT, observe_llm_request
+
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "16"))
+LLM_QUEUE_TIMEOUT = float(os.environ.get("LLM_QUEUE_TIMEOUT", "5"))
+LLM_CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", "3"))
+LLM_MIN_TIMEOUT = float(os.environ.get("LLM_MIN_TIMEOUT", "3"))
+LLM_TIMEOUT_P99_MULTIPLIER = float(os.environ.get("LLM_TIMEOUT_P99_MULTIPLIER", "3"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "1"))
+LLM_RETRY_BACKOFF = 0.5  # 秒，指数退避的基数
+LLM_HEDGE_BUDGET = float(os.environ.get("LLM_HEDGE_BUDGET", "0.1"))
+LLM_BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.environ.get("LLM_BREAKER_RESET_SECONDS", "30"))
+
+# 计算分位数所需的最少样本数，不足时不对冲、超时取调用方给的上限
+LLM_MIN_LATENCY_SAMPLES = 20
+# 429和5xx视为上游故障：计入熔断，可以重试
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+class LLMUnavailable(Exception):
+    """上游大模型暂不可用（熔断、并发已满、超时或持续返回错误），调用方应返回本地兜底结果"""
+
+    def __init__(self, reason: str, retry_after: Optional[str] = None):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class LatencyWindow:
+    """最近 size 次成功请求的耗时，用于计算分位数"""
+
+    def __init__(self, size: int = 200):
+        self.samples: Deque[float] = deque(maxlen=size)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if len(self.samples) < LLM_MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LLMClient:
+    """
+    共享连接池的大模型客户端，所有方法在事件循环中调用
+
+    Args:
+        url: chat completions 接口地址
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(60.0, connect=LLM_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=LLM_MAX_CONCURRENCY * 2, max_keepalive_connections=LLM_MAX_CONCURRENCY,
+                                keepalive_expiry=30.0),
+        )
+        self.semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+        self.breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_SECONDS)
+        self.latency: Dict[str, LatencyWindow] = defaultdict(LatencyWindow)
+        self.requests: Dict[str, int] = defaultdict(int)
+        self.hedges: Dict[str, int] = defaultdict(int)
+
+    async def close(self):
+        await self.client.aclose()
+
+    def timeout_for(self, operation: str, max_timeout: float) -> float:
+        """按最近的p99耗时计算本次请求的超时，样本不足时取上限"""
+        p99 = self.latency[operation].quantile(0.99)
+        if p99 is None:
+            return max_timeout
+        return min(max_timeout, max(LLM_MIN_TIMEOUT, p99 * LLM_TIMEOUT_P99_MULTIPLIER))
+
+    async def post(self, operation: str, payload: Dict[str, Any], headers: Dict[str, str],
+                   max_timeout: float, hedge: bool = False) -> httpx.Response:
+        """
+        发送 chat completions 请求
+
+        Args:
+            operation: 操作名，分别统计耗时分位数
+            max_timeout: 超时上限（秒）
+            hedge: 超过p90耗时后是否发出对冲请求，只适用于短小、可重复的调用
+
+        Returns:
+            httpx.Response: 上游的响应（非5xx/429）
+
+        Raises:
+            LLMUnavailable: 熔断中、排队超时、请求超时或重试后仍然失败
+        """
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), LLM_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise LLMUnavailable("saturated")
+        try:
+            if not self.breaker.allow():
+                raise LLMUnavailable("breaker_open")
+            self.requests[operation] += 1
+            timeout = self.timeout_for(operation, max_timeout)
+            if hedge:
+                return await self._hedged(operation, payload, headers, timeout)
+            return await self._with_retries(operation, payload, headers, timeout)
+        finally:
+            self.semaphore.release()
+
+    async def _attempt(self, operation: str, payload: Dict[str, Any], headers: Dict[str, str],
+                       timeout: float) -> httpx.Response:
+        """单次请求：记录耗时和熔断状态，429/5xx 时抛出 LLMUnavailable"""
+        LLM_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            response = await self.client.post(self.url, json=payload, headers=headers,
+                                              timeout=httpx.Timeout(timeout, connect=LLM_CONNECT_TIMEOUT))
+        except httpx.TimeoutException:
+            observe_llm_request(operation, time.perf_counter() - started, "timeout")
+            self._record(failed=True)
+            raise LLMUnavailable("timeout")
+        except httpx.TransportError as e:
+            observe_llm_request(operation, time.perf_counter() - started, type(e).__name__)
+            self._record(failed=True)
+            raise LLMUnavailable(type(e).__name__)
+        finally:
+            LLM_IN_FLIGHT.dec()
+        elapsed = time.perf_counter() - started
+        observe_llm_request(operation, elapsed, response.status_code)
+        if response.status_code in RETRYABLE_STATUSES:
+            self._record(failed=True)
+            raise LLMUnavailable(f"http_{response.status_code}", response.headers.get("retry-after"))
+        self._record(failed=False)
+        if response.status_code == 200:
+            self.latency[operation].record(elapsed)
+        return response
+
+    def _record(self, failed: bool):
+        if failed:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        LLM_BREAKER_OPEN.set(0 if self.breaker.state == "closed" else 1)
+
+    async def _with_retries(self, operation: str, payload: Dict[str, Any], headers: Dict[str, str],
+                            timeout: float) -> httpx.Response:
+        """连接失败和429/5xx时按带抖动的指数退避重试；超时不重试，以免等待时间翻倍"""
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            try:
+                return await self._attempt(operation, payload, headers, timeout)
+            except LLMUnavailable as e:
+                if e.reason == "timeout" or attempt >= LLM_MAX_RETRIES or self.breaker.state != "closed":
+                    raise
+                delay = random.uniform(0, LLM_RETRY_BACKOFF * (2 ** attempt))
+                if e.retry_after and e.retry_after.isdigit():
+                    delay = max(delay, min(float(e.retry_after), LLM_RETRY_BACKOFF * 4))
+                await asyncio.sleep(delay)
+
+    def _may_hedge(self, operation: str) -> bool:
+        """对冲预算内、熔断器闭合且有空闲并发名额时才对冲，避免上游变慢时放大负载"""
+        return (self.hedges[operation] < LLM_HEDGE_BUDGET * self.requests[operation]
+                and self.breaker.state == "closed" and not self.semaphore.locked())
+
+    async def _hedged(self, operation: str, payload: Dict[str, Any], headers: Dict[str, str],
+                      timeout: float) -> httpx.Response:
+        """先发一个请求，超过p90耗时仍未返回时再发一个相同的请求，返回先成功的结果"""
+        primary = asyncio.ensure_future(self._attempt(operation, payload, headers, timeout))
+        pending = {primary}
+        hedge: Optional[asyncio.Future] = None
+        error: Optional[LLMUnavailable] = None
+        try:
+            p90 = self.latency[operation].quantile(0.9)
+            if p90 is not None:
+                await asyncio.wait(pending, timeout=p90)
+                if not primary.done() and self._may_hedge(operation):
+                    await self.semaphore.acquire()
+                    self.hedges[operation] += 1
+                    LLM_HEDGES_TOTAL.labels(operation, "launched").inc()
+                    hedge = asyncio.ensure_future(self._attempt(operation, payload, headers, timeout))
+                    pending.add(hedge)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            LLM_HEDGES_TOTAL.labels(operation, "won").inc()
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+            if hedge is not None:
+                self.semaphore.release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "breaker": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "saturated": self.semaphore.locked(),
+            "operations": {
+                operation: {
+                    "requests": self.requests[operation],
+                    "hedges": self.hedges[operation],
+                    "p90_seconds": window.quantile(0.9),
+                    "p99_seconds": window.quantile(0.99),
+                }
+                for operation, window in self.latency.items()
+            },
+        }
+
+
+# 全局共享的大模型客户端（连接池 + keep-alive）
+_llm_client: Optional[LLMClient] = None
+
+def get_llm_client(url: str) -> LLMClient:
+    """获取共享的大模型客户端，首次调用时创建"""
+    global _llm_client
+    if _llm_client is None or _llm_client.client.is_closed:
+        _llm_client = LLMClient(url)
+    return _llm_client
+
+async def close_llm_client():
+    """关闭共享的大模型客户端（应用关闭时调用）"""
+    global _llm_client
+    if _llm_client is not None:
+        await _llm_client.close()
+        _llm_client = None
@@ -1,10 +1,19 @@
-from fastapi import FastAPI, HTTPException
+import os
+import time
+
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from typing import List, Optional
-import os
+
 from .api import router as api_router
+from .api.auth.service import close_oauth_client
+from .llm_client import close_llm_client
+from .metrics import HTTP_REQUEST_SECONDS
+from .tts_gateway import choose_voices, close_tts_gateway, forwarded_headers, get_tts_gateway
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from tts_service.profiler import PROFILER, create_profiler_router
 
 app = FastAPI(title="魔声AI API", description="AI商业英文配音服务")
 
@@ -20,11 +29,45 @@ app.add_middleware(
 # 注册API路由
 app.include_router(api_router, prefix="/api")
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """记录每个接口的耗时，按路由模板而不是实际路径分组，避免标签数量无限增长"""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.labels(
+            request.method, getattr(route, "path", "unmatched"), str(status)
+        ).observe(time.perf_counter() - started)
+        PROFILER.request_finished(request.url.path)
+
+# 按需采样分析接口（需配置 ADMIN_TOKEN）
+app.include_router(create_profiler_router("ADMIN_TOKEN"))
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus 文本格式的指标"""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.on_event("shutdown")
+async def shutdown_http_clients():
+    """关闭共享的HTTP连接池"""
+    await close_oauth_client()
+    await close_tts_gateway()
+    await close_llm_client()
+
 # 定义数据模型
 class TextToSpeechRequest(BaseModel):
     text: str
     accent: str = "美式口音"  # 默认美式口音
     voice_style: Optional[str] = None
+    # 直接指定TTS音色时优先使用，否则按 voice_style 匹配音色标签
+    gender: Optional[str] = None
+    voice_label: Optional[str] = None
 
 class AudioPreviewResponse(BaseModel):
     preview_id: str
@@ -56,25 +99,21 @@ def read_root():
     return {"message": "欢迎使用魔声AI - AI商业多语言配音服务"}
 
 @app.post("/api/audio-previews", response_model=List[AudioPreviewResponse])
-async def generate_audio_previews(request: TextToSpeechRequest):
-    """生成音频预览"""
-    # 这里将来会实现实际的TTS API调用
-    # 目前返回模拟数据
-    previews = [
+async def generate_audio_previews(request: TextToSpeechRequest, http_request: Request):
+    """生成音频预览：选出两个音色，由TTS服务并发合成各自的第一段"""
+    gateway = get_tts_gateway()
+    voices = choose_voices(await gateway.voice_catalog(), request.voice_style, request.gender,
+                           request.voice_label, count=2)
+    previews = await gateway.previews(request.text, voices, forwarded_headers(http_request))
+    return [
         AudioPreviewResponse(
-            preview_id="preview1",
-            audio_url="/static/samples/preview1.mp3",
+            preview_id=preview["task_id"],
+            audio_url=preview["mp3_url"],
             accent=request.accent,
-            voice_style="专业"
-        ),
-        AudioPreviewResponse(
-            preview_id="preview2",
-            audio_url="/static/samples/preview2.mp3",
-            accent=request.accent,
-            voice_style="自然"
+            voice_style=preview["voice_label"]
         )
+        for preview in previews
     ]
-    return previews
 
 @app.post("/api/generate-script")
 async def generate_script(prompt: str):
@@ -87,13 +126,20 @@ async def generate_script(prompt: str):
     }
 
 @app.post("/api/final-audio")
-async def generate_final_audio(request: TextToSpeechRequest):
+async def generate_final_audio(request: TextToSpeechRequest, http_request: Request):
     """生成最终的配音音频"""
-    # 这里将来会实现实际的TTS API调用生成最终音频
-    # 目前返回模拟数据
+    gateway = get_tts_gateway()
+    voices = choose_voices(await gateway.voice_catalog(), request.voice_style, request.gender, request.voice_label)
+    if not voices:
+        raise HTTPException(status_code=503, detail="TTS服务没有可用的音色")
+    gender, voice_label = voices[0]
+    result = await gateway.confirm(request.text, gender, voice_label, headers=forwarded_headers(http_request))
     return {
-        "audio_url": "/static/output/final_audio.mp3",
-        "download_url": "/static/output/final_audio.mp3"
+        "audio_url": result["mp3_url"],
+        "download_url": result["mp3_url"],
+        "wav_url": result["wav_url"],
+        "gender": gender,
+        "voice_label": voice_label
     }
 
 @app.get("/api/health")
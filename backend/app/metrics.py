@@ -0,0 +1,70 @@
+"""
+后端服务的 Prometheus 指标
+"""
+from typing import Any, Dict
+
+from prometheus_client import Counter, Gauge, Histogram
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "backend_http_request_seconds",
+    "后端接口耗时（秒）",
+    ["method", "route", "status"],
+)
+LLM_REQUEST_SECONDS = Histogram(
+    "backend_llm_request_seconds",
+    "上游大模型接口耗时（秒）",
+    ["operation", "status"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60),
+)
+LLM_TOKENS_TOTAL = Counter(
+    "backend_llm_tokens",
+    "上游大模型消耗的token数",
+    ["operation", "type"],
+)
+LLM_IN_FLIGHT = Gauge(
+    "backend_llm_in_flight",
+    "正在进行的上游大模型请求数（含对冲请求）",
+)
+LLM_HEDGES_TOTAL = Counter(
+    "backend_llm_hedges",
+    "超过p90耗时后发出的对冲请求数，outcome 为 launched 或 won（对冲请求先返回）",
+    ["operation", "outcome"],
+)
+LLM_FALLBACKS_TOTAL = Counter(
+    "backend_llm_fallbacks",
+    "上游大模型不可用时改用本地兜底结果的次数",
+    ["operation", "reason"],
+)
+LLM_BREAKER_OPEN = Gauge(
+    "backend_llm_breaker_open",
+    "上游大模型的熔断器是否断开（1为断开或半开）",
+)
+TTS_REQUEST_SECONDS = Histogram(
+    "backend_tts_request_seconds",
+    "发往TTS副本的请求耗时（秒），长轮询的等待时间也计算在内",
+    ["replica", "operation", "status"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60),
+)
+TTS_BREAKER_OPEN = Gauge(
+    "backend_tts_breaker_open",
+    "TTS副本的熔断器是否断开（1为断开或半开）",
+    ["replica"],
+)
+
+
+def observe_llm_request(operation: str, seconds: float, status: Any):
+    """记录一次大模型请求的耗时，status 为HTTP状态码或错误类型"""
+    LLM_REQUEST_SECONDS.labels(operation, str(status)).observe(seconds)
+
+
+def observe_tts_request(replica: str, operation: str, seconds: float, status: Any):
+    """记录一次TTS请求的耗时，status 为HTTP状态码或错误类型"""
+    TTS_REQUEST_SECONDS.labels(replica, operation, str(status)).observe(seconds)
+
+
+def record_llm_usage(operation: str, usage: Dict[str, Any]):
+    """累计大模型响应中 usage 字段的token用量"""
+    for token_type in ("prompt_tokens", "completion_tokens"):
+        value = usage.get(token_type)
+        if isinstance(value, (int, float)) and value > 0:
+            LLM_TOKENS_TOTAL.labels(operation, token_type.replace("_tokens", "")).inc(value)
@@ -0,0 +1,366 @@
+"""
+后端到TTS服务的网关
+
+浏览器只访问后端一个源：试听和最终音频请求由后端转发给TTS服务，生成的音频也经后端以流的方式透传。
+多个TTS副本时按 (性别, 音色) 一致性哈希选择副本，让同一音色的提示缓存保持命中，
+首选副本连接失败、未就绪或熔断时依次换到哈希环上的下一个副本。
+
+配置（环境变量）:
+- TTS_SERVICE_URLS: 逗号分隔的TTS副本地址，默认 http://localhost:8080
+- TTS_GATEWAY_TIMEOUT / TTS_GATEWAY_CONNECT_TIMEOUT: 单次请求的读取和连接超时（秒）
+- TTS_GATEWAY_MAX_RETRIES: 失败后的最大重试次数，每次重试前随机退避
+- TTS_GATEWAY_SYNTHESIS_SECONDS: 等待一次合成完成的最长时间（秒）
+- TTS_BREAKER_FAILURES / TTS_BREAKER_RESET_SECONDS: 连续失败多少次后熔断，熔断多久后放行探测请求
+- TRUSTED_PROXIES: 后端前面的反向代理地址，逗号分隔
+"""
+import asyncio
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from fastapi import HTTPException, Request
+
+from tts_service.router import HashRing
+from .circuit_breaker import CircuitBreaker
+from .metrics import TTS_BREAKER_OPEN, observe_tts_request
+
+TTS_SERVICE_URLS = [
+    url.strip().rstrip("/")
+    for url in os.environ.get("TTS_SERVICE_URLS", "http://localhost:8080").split(",")
+    if url.strip()
+]
+TTS_GATEWAY_TIMEOUT = float(os.environ.get("TTS_GATEWAY_TIMEOUT", "10"))
+TTS_GATEWAY_CONNECT_TIMEOUT = float(os.environ.get("TTS_GATEWAY_CONNECT_TIMEOUT", "2"))
+TTS_GATEWAY_MAX_RETRIES = int(os.environ.get("TTS_GATEWAY_MAX_RETRIES", "2"))
+TTS_GATEWAY_RETRY_BACKOFF = 0.2  # 秒，指数退避的基数
+TTS_GATEWAY_SYNTHESIS_SECONDS = float(os.environ.get("TTS_GATEWAY_SYNTHESIS_SECONDS", "120"))
+TTS_BREAKER_FAILURES = int(os.environ.get("TTS_BREAKER_FAILURES", "5"))
+TTS_BREAKER_RESET_SECONDS = float(os.environ.get("TTS_BREAKER_RESET_SECONDS", "15"))
+# 后端前面的反向代理地址（逗号分隔），只有来自这些地址的 X-Forwarded-For 才被采用
+TRUSTED_PROXIES = {ip.strip() for ip in os.environ.get("TRUSTED_PROXIES", "").split(",") if ip.strip()}
+
+# 长轮询任务状态时单次等待的秒数（TTS服务端上限为 TTS_STATUS_MAX_WAIT_SECONDS，默认30）
+STATUS_POLL_SECONDS = 25.0
+# 音色目录的缓存时间（秒）
+VOICE_CATALOG_TTL = 300.0
+# 任务的最终状态
+FINAL_STATES = ("completed", "failed", "cancelled")
+# 可以透传给TTS服务的音频目录
+AUDIO_DIRECTORIES = ("output", "client_output")
+# 透传音频时转发给TTS服务的请求头
+AUDIO_REQUEST_HEADERS = ("range", "if-none-match", "if-modified-since", "accept")
+
+
+def _rotate(items: List[int], offset: int) -> List[int]:
+    offset %= len(items)
+    return items[offset:] + items[:offset]
+
+
+def choose_voices(catalog: Dict[str, List[str]], style: Optional[str] = None, gender: Optional[str] = None,
+                  voice_label: Optional[str] = None, count: int = 1) -> List[Tuple[str, str]]:
+    """
+    从音色目录中选出 count 个 (性别, 声音标签)
+
+    指定的 voice_label 排在最前；其次是标签中包含 style 的音色（如"激情"匹配"男声18激情质感风格"）；
+    不足时在各性别之间轮流补齐。指定 gender 时只在该性别中选择
+    """
+    genders = [g for g in catalog if gender is None or g == gender] or list(catalog)
+    chosen: List[Tuple[str, str]] = []
+
+    def add(candidate: Tuple[str, str]):
+        if candidate not in chosen and len(chosen) < count:
+            chosen.append(candidate)
+
+    if voice_label:
+        owner = gender or next((g for g in catalog if voice_label in catalog[g]), None)
+        if owner is not None:
+            add((owner, voice_label))
+    if style:
+        for g in genders:
+            for label in catalog[g]:
+                if style in label:
+                    add((g, label))
+    for i in range(max((len(catalog[g]) for g in genders), default=0)):
+        for g in genders:
+            if i < len(catalog[g]):
+                add((g, catalog[g][i]))
+    return chosen
+
+
+def client_address(request: Request) -> str:
+    """
+    浏览器的真实地址：对端不是 TRUSTED_PROXIES 中的反向代理时就是对端地址；
+    否则从右往左跳过 X-Forwarded-For 中的可信代理，第一个不可信的地址即浏览器。浏览器自带的值不会被采用
+    """
+    peer = request.client.host if request.client else ""
+    if peer not in TRUSTED_PROXIES:
+        return peer
+    hops = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if hop not in TRUSTED_PROXIES:
+            return hop
+    return peer
+
+
+def forwarded_headers(request: Request) -> Dict[str, str]:
+    """
+    转发给TTS服务的身份信息：用户令牌和浏览器地址
+
+    TTS副本设置 TTS_TRUST_FORWARDED_FOR=1 后按真实用户和IP限流，而不是把后端当成一个客户端
+    """
+    headers = {"X-Forwarded-For": client_address(request)}
+    authorization = request.headers.get("authorization")
+    if authorization:
+        headers["Authorization"] = authorization
+    return headers
+
+
+class TTSGateway:
+    """
+    TTS副本的客户端：共享连接池、超时、带随机抖动的重试和按副本的熔断
+
+    Args:
+        urls: TTS副本地址
+    """
+
+    def __init__(self, urls: List[str]):
+        if not urls:
+            raise ValueError("至少需要一个TTS副本地址")
+        self.urls = urls
+        self.breakers = [CircuitBreaker(TTS_BREAKER_FAILURES, TTS_BREAKER_RESET_SECONDS) for _ in urls]
+        self.ring = HashRing([str(i) for i in range(len(urls))])
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(TTS_GATEWAY_TIMEOUT, connect=TTS_GATEWAY_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=50, keepalive_expiry=30.0),
+        )
+        self._catalog: Optional[Dict[str, List[str]]] = None
+        self._catalog_expires = 0.0
+
+    async def close(self):
+        await self.client.aclose()
+
+    def preference(self, key: Optional[str]) -> List[int]:
+        """副本的尝试顺序：有路由键时按哈希环顺序，否则随机"""
+        if key is None:
+            return random.sample(range(len(self.urls)), len(self.urls))
+        return [int(node) for node in self.ring.preference(key)]
+
+    def _record(self, index: int, operation: str, started: float, status: Any, failed: bool):
+        breaker = self.breakers[index]
+        if failed:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        observe_tts_request(self.urls[index], operation, time.perf_counter() - started, status)
+        TTS_BREAKER_OPEN.labels(self.urls[index]).set(0 if breaker.state == "closed" else 1)
+
+    async def request(self, operation: str, method: str, path: str, key: Optional[str] = None,
+                      replica: Optional[int] = None, idempotent: bool = True,
+                      **kwargs) -> Tuple[int, httpx.Response]:
+        """
+        发送请求，失败时换到下一个副本重试
+
+        提交合成任务这类非幂等请求只在请求肯定没有被处理时（连接失败、副本返回503）重试，
+        幂等请求在超时和502/504时也会重试。所有候选副本都熔断时直接返回503，不再等待超时。
+
+        Args:
+            operation: 指标中的操作名
+            key: 路由键，相同的键优先发往同一个副本
+            replica: 固定发往该副本（任务状态只在创建任务的副本上）
+
+        Returns:
+            tuple[int, httpx.Response]: (副本序号, 响应)
+        """
+        candidates = [replica] if replica is not None else self.preference(key)
+        error = "所有TTS副本均已熔断"
+        for attempt in range(TTS_GATEWAY_MAX_RETRIES + 1):
+            index = next((i for i in _rotate(candidates, attempt) if self.breakers[i].allow()), None)
+            if index is None:
+                break
+            started = time.perf_counter()
+            try:
+                response = await self.client.request(method, f"{self.urls[index]}{path}", **kwargs)
+            except httpx.TransportError as e:
+                self._record(index, operation, started, type(e).__name__, failed=True)
+                error = f"TTS服务请求失败: {type(e).__name__}"
+                if not idempotent and not isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout)):
+                    break
+            else:
+                retryable = response.status_code == 503 or (idempotent and response.status_code in (502, 504))
+                self._record(index, operation, started, response.status_code, failed=retryable)
+                if not retryable:
+                    return index, response
+                error = f"TTS服务暂不可用: HTTP {response.status_code}"
+            if attempt < TTS_GATEWAY_MAX_RETRIES:
+                await asyncio.sleep(random.uniform(0, TTS_GATEWAY_RETRY_BACKOFF * (2 ** attempt)))
+        raise HTTPException(status_code=503, detail=error, headers={"Retry-After": "5"})
+
+    async def voice_catalog(self) -> Dict[str, List[str]]:
+        """TTS服务的音色目录 {性别: [声音标签]}，缓存 VOICE_CATALOG_TTL 秒"""
+        if self._catalog is None or time.monotonic() >= self._catalog_expires:
+            _, response = await self.request("voice_types", "GET", "/voice_types")
+            _raise_for_status(response)
+            self._catalog = response.json().get("voice_types") or {}
+            self._catalog_expires = time.monotonic() + VOICE_CATALOG_TTL
+        return self._catalog
+
+    async def wait_task(self, replica: int, status_url: str, deadline: float,
+                        headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """长轮询任务状态直到结束，超过 deadline 返回504"""
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise HTTPException(status_code=504, detail="等待TTS合成超时")
+            wait = min(remaining, STATUS_POLL_SECONDS)
+            _, response = await self.request(
+                "status", "GET", status_url, replica=replica, headers=headers, params={"wait": wait},
+                timeout=httpx.Timeout(wait + TTS_GATEWAY_TIMEOUT, connect=TTS_GATEWAY_CONNECT_TIMEOUT),
+            )
+            _raise_for_status(response)
+            task = response.json()
+            if task.get("status") in FINAL_STATES:
+                return task
+
+    async def synthesize(self, text: str, gender: str, voice_label: str, mode: Optional[str] = None,
+                         headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """
+        提交合成任务并等待结果，mode=preview 时只合成第一段
+
+        Returns:
+            dict: 合成结果，音频URL已改写为经后端透传的地址
+        """
+        data = {"text": text, "gender": gender, "voice_label": voice_label}
+        if mode:
+            data["mode"] = mode
+        deadline = time.monotonic() + TTS_GATEWAY_SYNTHESIS_SECONDS
+        replica, response = await self.request("synthesize", "POST", "/synthesize", key=f"{gender}/{voice_label}",
+                                               idempotent=False, data=data, headers=headers)
+        _raise_for_status(response)
+        submitted = response.json()
+        task = await self.wait_task(replica, submitted["status_url"], deadline, headers)
+        return {**self._task_result(replica, task), "task_id": submitted["task_id"]}
+
+    async def previews(self, text: str, voices: List[Tuple[str, str]],
+                       headers: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        """
+        并发为多个音色生成试听（各自只合成第一段）
+
+        Returns:
+            list[dict]: 成功的试听结果，附带 gender 和 voice_label；全部失败时抛出第一个错误
+        """
+        results = await asyncio.gather(
+            *(self.synthesize(text, gender, voice_label, mode="preview", headers=headers) for gender, voice_label in voices),
+            return_exceptions=True,
+        )
+        previews = [
+            {**result, "gender": gender, "voice_label": voice_label}
+            for (gender, voice_label), result in zip(voices, results) if not isinstance(result, BaseException)
+        ]
+        if not previews:
+            if results:
+                raise results[0]
+            raise HTTPException(status_code=503, detail="TTS服务没有可用的音色")
+        return previews
+
+    async def confirm(self, text: str, gender: str, voice_label: str, user_id: Optional[str] = None,
+                      session_id: Optional[str] = None, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """提交最终音频任务并等待结果，完成时TTS服务会写入音频记录"""
+        deadline = time.monotonic() + TTS_GATEWAY_SYNTHESIS_SECONDS
+        body = {"text": text, "gender": gender, "voice_label": voice_label, "user_id": user_id,
+                "session_id": session_id, "wait_seconds": STATUS_POLL_SECONDS}
+        replica, response = await self.request(
+            "confirm_script", "POST", "/confirm_script", key=f"{gender}/{voice_label}", idempotent=False,
+            json=body, headers=headers,
+            timeout=httpx.Timeout(STATUS_POLL_SECONDS + TTS_GATEWAY_TIMEOUT, connect=TTS_GATEWAY_CONNECT_TIMEOUT),
+        )
+        _raise_for_status(response)
+        payload = response.json()
+        if response.status_code == 200:
+            return self._rewrite_urls(replica, payload)
+        task = await self.wait_task(replica, payload["status_url"], deadline, headers)
+        return self._task_result(replica, task)
+
+    def _task_result(self, replica: int, task: Dict[str, Any]) -> Dict[str, Any]:
+        if task["status"] != "completed":
+            raise HTTPException(status_code=502, detail=f"TTS合成{task['status']}: {task.get('error')}")
+        return self._rewrite_urls(replica, task["result"])
+
+    def _rewrite_urls(self, replica: int, result: Dict[str, Any]) -> Dict[str, Any]:
+        rewritten = dict(result)
+        for field in ("wav_url", "mp3_url"):
+            if result.get(field):
+                rewritten[field] = audio_url(replica, result[field])
+        return rewritten
+
+    async def open_audio(self, replica: int, path: str, method: str, headers: Dict[str, str],
+                         params: Dict[str, str]) -> httpx.Response:
+        """
+        以流的方式打开副本上的音频文件，调用方负责关闭响应
+
+        文件只在生成它的副本上，所以不换副本；只在连接失败时重试
+        """
+        if not 0 <= replica < len(self.urls):
+            raise HTTPException(status_code=404, detail="文件不存在")
+        breaker = self.breakers[replica]
+        for attempt in range(TTS_GATEWAY_MAX_RETRIES + 1):
+            if not breaker.allow():
+                break
+            started = time.perf_counter()
+            request = self.client.build_request(method, f"{self.urls[replica]}{path}", headers=headers, params=params)
+            try:
+                response = await self.client.send(request, stream=True)
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                self._record(replica, "audio", started, type(e).__name__, failed=True)
+            except httpx.TransportError as e:
+                self._record(replica, "audio", started, type(e).__name__, failed=True)
+                break
+            else:
+                self._record(replica, "audio", started, response.status_code, failed=response.status_code >= 502)
+                return response
+            if attempt < TTS_GATEWAY_MAX_RETRIES:
+                await asyncio.sleep(random.uniform(0, TTS_GATEWAY_RETRY_BACKOFF * (2 ** attempt)))
+        raise HTTPException(status_code=503, detail="TTS服务暂不可用", headers={"Retry-After": "5"})
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [
+            {"url": url, "breaker": breaker.state, "consecutive_failures": breaker.failures}
+            for url, breaker in zip(self.urls, self.breakers)
+        ]
+
+
+def audio_url(replica: int, url: str) -> str:
+    """把TTS服务的音频地址（如 /output/x.mp3）改写为经后端透传的地址"""
+    return f"/api/voice/audio/{replica}{url}"
+
+
+def _raise_for_status(response: httpx.Response):
+    """TTS服务返回的错误原样转给调用方（如429带 Retry-After）"""
+    if response.status_code < 400:
+        return
+    try:
+        detail = response.json().get("detail")
+    except ValueError:
+        detail = None
+    headers = {"Retry-After": response.headers["retry-after"]} if "retry-after" in response.headers else None
+    raise HTTPException(status_code=response.status_code, detail=detail or f"TTS服务错误: HTTP {response.status_code}",
+                        headers=headers)
+
+
+# 全局共享的网关（连接池 + keep-alive）
+_tts_gateway: Optional[TTSGateway] = None
+
+def get_tts_gateway() -> TTSGateway:
+    """获取共享的TTS网关，首次调用时创建"""
+    global _tts_gateway
+    if _tts_gateway is None or _tts_gateway.client.is_closed:
+        _tts_gateway = TTSGateway(TTS_SERVICE_URLS)
+    return _tts_gateway
+
+async def close_tts_gateway():
+    """关闭共享的TTS网关（应用关闭时调用）"""
+    global _tts_gateway
+    if _tts_gateway is not None:
+        await _tts_gateway.close()
+        _tts_gateway = None
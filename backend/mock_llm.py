@@ -0,0 +1,83 @@
+"""
+本地模拟的 DeepSeek chat completions 服务，可注入延迟、长尾和错误，用于测试后端的并发限制、对冲请求和熔断：
+
+    python mock_llm.py --port 9100 --latency 0.3 --tail-rate 0.1 --tail-latency 5
+    DEEPSEEK_API_KEY=test DEEPSEEK_API_URL=http://localhost:9100/v1/chat/completions uvicorn app.main:app
+
+运行中可以调整注入参数，例如模拟上游故障：
+
+    curl -X POST localhost:9100/mock/config -H 'Content-Type: application/json' -d '{"error_rate": 1}'
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Any, Dict
+
+import uvicorn
+from fastapi import Body, FastAPI
+from fastapi.responses import JSONResponse
+
+
+def create_app(config: Dict[str, float]) -> FastAPI:
+    app = FastAPI(title="模拟DeepSeek服务")
+    stats = {"requests": 0, "in_flight": 0, "max_in_flight": 0, "errors": 0}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(payload: Dict[str, Any] = Body(...)):
+        stats["requests"] += 1
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        try:
+            # 对数正态分布的基础延迟，一部分请求落在长尾上
+            delay = random.lognormvariate(0, 0.25) * config["latency"]
+            if random.random() < config["tail_rate"]:
+                delay = config["tail_latency"]
+            await asyncio.sleep(delay)
+            if random.random() < config["error_rate"]:
+                stats["errors"] += 1
+                return JSONResponse({"error": {"message": "模拟的上游故障"}}, status_code=503)
+            messages = payload.get("messages", [])
+            if any("style_tags" in m.get("content", "") for m in messages if m.get("role") == "system"):
+                content = json.dumps({"style_tags": ["促销", "激情", "大气"]}, ensure_ascii=False)
+            else:
+                content = f"（模拟回复）{messages[-1]['content'] if messages else ''}"
+            return JSONResponse({
+                "id": f"mock-{stats['requests']}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": payload.get("model", "deepseek-chat"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+            })
+        finally:
+            stats["in_flight"] -= 1
+
+    @app.get("/mock/stats")
+    async def get_stats():
+        return {**stats, "config": config}
+
+    @app.post("/mock/config")
+    async def update_config(changes: Dict[str, float] = Body(...)):
+        config.update({k: float(v) for k, v in changes.items() if k in config})
+        return config
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟的DeepSeek服务")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.3, help="延迟中位数（秒）")
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="落在长尾上的请求比例")
+    parser.add_argument("--tail-latency", type=float, default=5.0, help="长尾请求的延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回503的请求比例")
+    args = parser.parse_args()
+    config = {"latency": args.latency, "tail_rate": args.tail_rate,
+              "tail_latency": args.tail_latency, "error_rate": args.error_rate}
+    uvicorn.run(create_app(config), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
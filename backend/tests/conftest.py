@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 让测试可以 import app（backend 目录）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
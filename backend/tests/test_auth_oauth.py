@@ -0,0 +1,57 @@
+"""
+OAuth登录调用第三方接口时不能阻塞事件循环：慢的登录进行中，其他请求照常完成
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from app.api.auth import service
+from app.main import app
+
+
+def install_provider(monkeypatch, handler):
+    """把共享的OAuth客户端换成由 handler 应答的模拟微信接口"""
+    monkeypatch.setattr(service, "_oauth_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(service, "users_db", {})
+
+
+@pytest.mark.asyncio
+async def test_slow_wechat_login_does_not_block_other_requests(monkeypatch):
+    token_requested = asyncio.Event()
+    release = asyncio.Event()
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/sns/oauth2/access_token":
+            token_requested.set()
+            await release.wait()
+            return httpx.Response(200, json={"access_token": "token", "openid": "openid-1"})
+        return httpx.Response(200, json={"nickname": "微信用户"})
+
+    install_provider(monkeypatch, handler)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        login = asyncio.create_task(client.post("/api/auth/wechat-login", json={"code": "code-1"}))
+        await asyncio.wait_for(token_requested.wait(), 5)
+
+        health = await asyncio.wait_for(client.get("/api/health"), 2)
+        assert health.status_code == 200
+        assert not login.done()
+
+        release.set()
+        response = await asyncio.wait_for(login, 5)
+    assert response.status_code == 200
+    assert response.json()["user"]["username"] == "微信用户"
+
+
+@pytest.mark.asyncio
+async def test_wechat_login_without_openid_is_rejected(monkeypatch):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/sns/oauth2/access_token":
+            return httpx.Response(200, json={"access_token": "token"})
+        return httpx.Response(200, json={"nickname": "微信用户"})
+
+    install_provider(monkeypatch, handler)
+    # 邮箱注册的用户没有 wechat_id，不能被当成缺少 openid 的微信用户登录
+    service.register_user("email-user", "user@example.com", "password")
+    with pytest.raises(ValueError):
+        await service.wechat_login("code-2")
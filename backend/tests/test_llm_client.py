@@ -0,0 +1,136 @@
+"""
+大模型客户端的并发限制、对冲请求和熔断，上游用进程内的 mock_llm 服务模拟
+"""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import mock_llm
+from app import llm_client
+from app.api import chat
+from app.llm_client import LLMClient, LLMUnavailable
+from app.main import app
+
+MOCK_URL = "http://mock-llm/v1/chat/completions"
+PAYLOAD = {"model": "deepseek-chat", "messages": [{"role": "user", "content": "hello"}]}
+
+
+def make_client(**overrides):
+    """创建连到进程内模拟服务的客户端，返回 (客户端, 可在运行中修改的注入参数)"""
+    config = {"latency": 0.01, "tail_rate": 0.0, "tail_latency": 0.0, "error_rate": 0.0, **overrides}
+    client = LLMClient(MOCK_URL)
+    client.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=mock_llm.create_app(config)))
+    return client, config
+
+
+async def upstream_stats(client: LLMClient):
+    return (await client.client.get("http://mock-llm/mock/stats")).json()
+
+
+@pytest.fixture(autouse=True)
+def no_retries(monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_MAX_RETRIES", 0)
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_after_consecutive_failures(monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_BREAKER_FAILURES", 3)
+    client, _ = make_client(error_rate=1.0)
+    try:
+        for _ in range(3):
+            with pytest.raises(LLMUnavailable, match="http_503"):
+                await client.post("chat", PAYLOAD, {}, max_timeout=5.0)
+        assert client.breaker.state == "open"
+
+        with pytest.raises(LLMUnavailable, match="breaker_open"):
+            await client.post("chat", PAYLOAD, {}, max_timeout=5.0)
+        # 熔断期间的请求不会到达上游
+        assert (await upstream_stats(client))["requests"] == 3
+    finally:
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_chat_returns_degraded_fallback_when_upstream_fails(monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_BREAKER_FAILURES", 2)
+    client, _ = make_client(error_rate=1.0)
+    monkeypatch.setattr(llm_client, "_llm_client", client)
+    monkeypatch.setattr(chat, "DEEPSEEK_API_KEY", "test")
+    monkeypatch.setattr(chat, "DEEPSEEK_API_URL", MOCK_URL)
+    messages = [{"role": "user", "content": "推荐一个音色"}]
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as api:
+            for _ in range(3):
+                response = await api.post("/api/chat/chat", json={"messages": messages})
+                assert response.status_code == 200
+                assert response.json()["degraded"] is True
+                assert response.json()["message"] == chat.CHAT_FALLBACK_MESSAGE
+
+            response = await api.post("/api/chat/recommend_voice_styles", json={"text": "Big sale today!"})
+            assert response.status_code == 200
+            assert response.json()["degraded"] is True
+        assert client.breaker.state == "open"
+        assert (await upstream_stats(client))["requests"] == 2
+    finally:
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_chat_without_api_key_does_not_call_upstream(monkeypatch):
+    client, _ = make_client()
+    monkeypatch.setattr(llm_client, "_llm_client", client)
+    monkeypatch.setattr(chat, "DEEPSEEK_API_KEY", "")
+    monkeypatch.setattr(chat, "DEEPSEEK_API_URL", MOCK_URL)
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as api:
+            response = await api.post("/api/chat/chat", json={"messages": [{"role": "user", "content": "hi"}]})
+        assert response.status_code == 200
+        assert response.json()["degraded"] is True
+        assert (await upstream_stats(client))["requests"] == 0
+    finally:
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_hedges_stay_within_budget(monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_HEDGE_BUDGET", 0.1)
+    client, config = make_client()
+    try:
+        for _ in range(llm_client.LLM_MIN_LATENCY_SAMPLES):
+            await client.post("recommend", PAYLOAD, {}, max_timeout=5.0, hedge=True)
+        assert client.hedges["recommend"] == 0
+
+        # 之后三成请求落在长尾上，每个都满足对冲条件，但对冲数受预算限制
+        config.update(tail_rate=0.3, tail_latency=0.1)
+        for _ in range(40):
+            await client.post("recommend", PAYLOAD, {}, max_timeout=5.0, hedge=True)
+
+        requests, hedges = client.requests["recommend"], client.hedges["recommend"]
+        assert 0 < hedges <= llm_client.LLM_HEDGE_BUDGET * requests
+        assert (await upstream_stats(client))["requests"] == requests + hedges
+    finally:
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_saturated_limiter_fails_fast(monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_MAX_CONCURRENCY", 2)
+    monkeypatch.setattr(llm_client, "LLM_QUEUE_TIMEOUT", 0.05)
+    client, _ = make_client(latency=2.0)
+    in_flight = [asyncio.create_task(client.post("chat", PAYLOAD, {}, max_timeout=10.0)) for _ in range(2)]
+    try:
+        while not client.semaphore.locked():
+            await asyncio.sleep(0.01)
+
+        started = time.perf_counter()
+        with pytest.raises(LLMUnavailable, match="saturated"):
+            await client.post("chat", PAYLOAD, {}, max_timeout=10.0)
+        assert time.perf_counter() - started < 0.5
+        assert (await upstream_stats(client))["max_in_flight"] == 2
+    finally:
+        for task in in_flight:
+            task.cancel()
+        await asyncio.gather(*in_flight, return_exceptions=True)
+        await client.close()
@@ -0,0 +1,6 @@
+"""
+语音合成服务热点路径的微基准测试
+
+    python -m benchmarks run --output benchmarks/baselines/main.json
+    python -m benchmarks compare benchmarks/baselines/main.json current.json --threshold 0.15
+"""
@@ -0,0 +1,54 @@
+import argparse
+import sys
+
+from benchmarks.runner import compare_results, load_results, run_benchmarks, save_results
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="语音合成热点路径微基准")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="运行基准测试")
+    run_parser.add_argument("-k", "--filter", help="只运行名称包含该字符串的基准")
+    run_parser.add_argument("--repeat", type=int, default=5, help="每个基准的采样次数")
+    run_parser.add_argument("--min-sample-time", type=float, default=0.05, help="每个样本的最短时长（秒）")
+    run_parser.add_argument("--output", help="把结果保存为JSON基线")
+
+    cmp_parser = sub.add_parser("compare", help="对比两次结果，发现性能回退")
+    cmp_parser.add_argument("baseline", help="基线结果JSON")
+    cmp_parser.add_argument("current", help="当前结果JSON")
+    cmp_parser.add_argument("--threshold", type=float, default=0.15, help="允许的变慢比例，默认15%%")
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        import benchmarks.suite  # noqa: F401  注册所有基准
+
+        results = run_benchmarks(args.filter, repeat=args.repeat, min_sample_time=args.min_sample_time)
+        if args.output:
+            save_results(results, args.output)
+            print(f"结果已保存: {args.output}")
+        return 0
+
+    rows = compare_results(load_results(args.baseline), load_results(args.current), args.threshold)
+    regressions = 0
+    for row in rows:
+        if "unmatched" in row:
+            print(f"{row['name']:60s} 无法对比（{row['unmatched']}）")
+            continue
+        flag = "回退" if row["regression"] else ""
+        regressions += row["regression"]
+        print(f"{row['name']:60s} {row['baseline'] * 1000:10.4f} ms -> {row['current'] * 1000:10.4f} ms "
+              f"x{row['ratio']:.2f} {flag}")
+    unmatched = sum(1 for row in rows if "unmatched" in row)
+    if unmatched:
+        print(f"{unmatched}个基准无法对比")
+    if regressions:
+        print(f"{regressions}个基准变慢超过{args.threshold:.0%}")
+        return 1
+    print("未发现性能回退")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+# 已注册的基准测试: (名称, 参数列表, 准备函数)
+BENCHMARKS: List[tuple] = []
+
+
+class SkipBenchmark(Exception):
+    """当前环境无法运行该基准（例如缺少ffmpeg）"""
+
+
+def benchmark(name: str, params: Optional[List[Any]] = None):
+    """
+    注册基准测试
+
+    被装饰的函数接收一个参数值，完成准备工作后返回要计时的无参函数。
+    """
+
+    def decorator(setup: Callable[[Any], Callable[[], Any]]):
+        BENCHMARKS.append((name, params or [None], setup))
+        return setup
+
+    return decorator
+
+
+def _time_callable(fn: Callable[[], Any], repeat: int, min_sample_time: float) -> List[float]:
+    """自动确定每个样本的循环次数，返回每次调用的耗时样本（秒）"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_sample_time or number >= 1 << 20:
+            break
+        number *= 2 if elapsed == 0 else max(2, int(min_sample_time / elapsed) + 1)
+
+    samples = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    return samples
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(pattern: Optional[str] = None, repeat: int = 5, min_sample_time: float = 0.05) -> Dict[str, Any]:
+    """
+    运行所有（或名称包含 pattern 的）基准测试
+
+    Returns:
+        Dict[str, Any]: 包含环境信息和每个基准耗时统计的结果
+    """
+    results: Dict[str, Dict[str, Any]] = {}
+    for name, params, setup in BENCHMARKS:
+        if pattern and pattern not in name:
+            continue
+        for param in params:
+            key = name if param is None else f"{name}[{param}]"
+            # 被测函数中的 print 会干扰输出，统一丢弃
+            with contextlib.redirect_stdout(io.StringIO()):
+                try:
+                    fn = setup(param)
+                    samples = _time_callable(fn, repeat, min_sample_time)
+                except SkipBenchmark as e:
+                    results[key] = {"skipped": str(e)}
+                    continue
+            results[key] = {
+                "median": statistics.median(samples),
+                "min": min(samples),
+                "mean": statistics.fmean(samples),
+                "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+                "repeat": len(samples),
+            }
+            print(f"{key:60s} {results[key]['median'] * 1000:12.4f} ms")
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """
+    按中位数对比两次结果
+
+    Returns:
+        List[Dict[str, Any]]: 每个基准的对比，regression 表示变慢超过阈值；
+        只出现在一边或被跳过、无法对比的基准带有 unmatched 字段说明原因
+    """
+    rows = []
+    names = list(current["results"]) + [key for key in baseline["results"] if key not in current["results"]]
+    for key in names:
+        base = baseline["results"].get(key)
+        cur = current["results"].get(key)
+        if base is None or cur is None:
+            rows.append({"name": key, "unmatched": "不在基线中" if base is None else "不在当前结果中"})
+            continue
+        if "median" not in base or "median" not in cur:
+            rows.append({"name": key, "unmatched": f"已跳过: {cur.get('skipped') or base.get('skipped')}"})
+            continue
+        ratio = cur["median"] / base["median"] if base["median"] else float("inf")
+        rows.append({
+            "name": key,
+            "baseline": base["median"],
+            "current": cur["median"],
+            "ratio": ratio,
+            "regression": ratio > 1 + threshold,
+        })
+    return rows
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_results(results: Dict[str, Any], path: str):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,140 @@
+import atexit
+import json
+import os
+import shutil
+import tempfile
+
+import torch
+import torchaudio
+
+import app
+from benchmarks.runner import SkipBenchmark, benchmark
+
+AD_COPY_ZH = (
+    "锅圈食汇泉山湖店，双十二活动开始啦，活动一，消费一百二十八元送锅，二十厘米电火锅，二十六厘米煎烤盘，"
+    "露营烧烤炉，三十二厘米不锈钢鸳鸯锅以上四选一。注意，咱们一定要购入一张一点九九的抢锅券。活动二，"
+    "充值五百元享受九五折还能享受送锅。活动日期，十二月二号至十二月十八号，活动不累计参加，不参与银行活动。"
+)
+AD_COPY_EN = (
+    "Grand opening this weekend! Everything in store is forty percent off, and the first hundred customers "
+    "get a free gift. Visit us at the second floor of the Riverside Mall, right above the supermarket; "
+    "we are open from nine in the morning until ten at night. Don't miss out - call now to reserve yours."
+)
+
+# 文本规模: 一条广告、一篇长文档（约1万字）、一本小册子（约10万字）
+TEXT_SIZES = {"ad": 1, "doc": 10_000, "book": 100_000}
+
+_tmp_root = tempfile.mkdtemp(prefix="moshengai-bench-")
+atexit.register(shutil.rmtree, _tmp_root, ignore_errors=True)
+
+
+def _sized_text(base: str, size: str) -> str:
+    target = TEXT_SIZES[size]
+    if target == 1:
+        return base
+    return (base * (target // len(base) + 1))[:target]
+
+
+def _with_app_global(name: str, value, fn):
+    """返回调用期间把 app 的模块级配置 name 换成 value 的函数，调用结束后恢复原值"""
+
+    def run():
+        previous = getattr(app, name)
+        setattr(app, name, value)
+        try:
+            return fn()
+        finally:
+            setattr(app, name, previous)
+
+    return run
+
+
+@benchmark("split_text_zh", params=list(TEXT_SIZES))
+def bench_split_text_zh(size):
+    text = _sized_text(AD_COPY_ZH, size)
+    return lambda: app.split_text(text)
+
+
+@benchmark("split_text_en", params=list(TEXT_SIZES))
+def bench_split_text_en(size):
+    text = _sized_text(AD_COPY_EN, size)
+    return lambda: app.split_text(text)
+
+
+@benchmark("split_chinese_text", params=list(TEXT_SIZES))
+def bench_split_chinese_text(size):
+    text = _sized_text(AD_COPY_ZH, size)
+    return lambda: app.split_chinese_text(text, app.MAX_TEXT_LENGTH)
+
+
+@benchmark("split_english_text", params=list(TEXT_SIZES))
+def bench_split_english_text(size):
+    text = _sized_text(AD_COPY_EN, size)
+    return lambda: app.split_english_text(text, app.MAX_TEXT_LENGTH)
+
+
+@benchmark("is_chinese_text", params=list(TEXT_SIZES))
+def bench_is_chinese_text(size):
+    text = _sized_text(AD_COPY_ZH + AD_COPY_EN, size)
+    return lambda: app.is_chinese_text(text)
+
+
+def _write_segments(count: int, seconds: float = 1.0, sample_rate: int = 24000) -> list:
+    directory = os.path.join(_tmp_root, f"segments_{count}")
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"part{i}.wav")
+        torchaudio.save(path, 0.1 * torch.randn(1, int(seconds * sample_rate)), sample_rate)
+        paths.append(path)
+    return paths
+
+
+@benchmark("concatenate_audio", params=[2, 20, 200])
+def bench_concatenate_audio(count):
+    paths = _write_segments(count)
+    output = os.path.join(_tmp_root, f"concat_{count}.wav")
+    return lambda: app.concatenate_audio(paths, output)
+
+
+@benchmark("convert_wav_to_mp3", params=[5, 60])
+def bench_convert_wav_to_mp3(seconds):
+    if shutil.which("ffmpeg") is None:
+        raise SkipBenchmark("ffmpeg 不可用")
+    path = os.path.join(_tmp_root, f"convert_{seconds}.wav")
+    torchaudio.save(path, 0.1 * torch.randn(1, seconds * 24000), 24000)
+    return lambda: app.convert_wav_to_mp3(path)
+
+
+@benchmark("get_voice_types", params=[1000])
+def bench_get_voice_types(count):
+    # 构造一个合成的音色库：男女各一半，每个音色有 wav 和 txt
+    library = os.path.join(_tmp_root, "prompt_voice")
+    for gender in ("male", "female"):
+        os.makedirs(os.path.join(library, gender), exist_ok=True)
+        for i in range(count // 2):
+            label = f"{'男声' if gender == 'male' else '女声'}{i}大气磁性"
+            for ext in (".wav", ".txt"):
+                open(os.path.join(library, gender, label + ext), "w").close()
+    return _with_app_global("VOICE_TYPES_DIR", library, app.get_voice_types)
+
+
+@benchmark("save_audio_record", params=[100_000])
+def bench_save_audio_record(existing):
+    path = os.path.join(_tmp_root, "saved_audios.json")
+    record = {
+        "id": "00000000-0000-0000-0000-000000000000",
+        "text": AD_COPY_ZH,
+        "timestamp": "2025-01-01 00:00:00",
+        "wav_path": "/srv/moshengai/client_output/00000000-0000-0000-0000-000000000000.wav",
+        "mp3_path": "/srv/moshengai/client_output/00000000-0000-0000-0000-000000000000.mp3",
+        "wav_url": "/client_output/00000000-0000-0000-0000-000000000000.wav",
+        "mp3_url": "/client_output/00000000-0000-0000-0000-000000000000.mp3",
+        "user_id": None,
+        "session_id": None,
+        "gender": "女声",
+        "voice_label": "女声1大气磁性",
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([record] * existing, f, ensure_ascii=False, indent=2)
+    return _with_app_global("SAVED_AUDIOS_FILE", path, lambda: app.save_audio_record(record))
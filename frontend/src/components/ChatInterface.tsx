@@ -1,7 +1,7 @@
 import React, { useState, useRef, useEffect } from 'react';
 import AudioPlayer from './AudioPlayer';
 // import { Message as MessageType, chatAPI, ttsAPI, ConfirmScriptResponse, TTSResponse } from '../services/api'; // Temporarily comment out unused types
-import { Message as MessageType, chatAPI, ttsAPI } from '../services/api'; // Keep used ones
+import { Message as MessageType, chatAPI, ttsAPI, VoiceSamples } from '../services/api'; // Keep used ones
 import LogoIcon from './LogoIcon';
 import LoginModal from './LoginModal';
 // import { VoiceSelector, Voice } from './VoiceSelector'; // Revert to default for now and comment out
@@ -97,6 +97,12 @@ const ChatInterface: React.FC = () => {
   const [showLoginModal, setShowLoginModal] = useState(false);
   const [selectedVoice, setSelectedVoice] = useState<VoicePreview | null>(null); // 仍然需要跟踪哪个被选中
   const [confirmingVoiceId, setConfirmingVoiceId] = useState<string | null>(null); // 跟踪哪个音色正在合成
+  const synthesisAbortRef = useRef<AbortController | null>(null); // 进行中的合成，换音色或离开页面时取消
+
+  // 离开页面时取消仍在进行的合成任务
+  useEffect(() => {
+    return () => synthesisAbortRef.current?.abort();
+  }, []);
   
   // 监听清除会话事件
   useEffect(() => {
@@ -438,6 +444,8 @@ const ChatInterface: React.FC = () => {
     try {
       const recommendResult = await chatAPI.recommendVoiceStyles(text);
       if (recommendResult.success) {
+        // 优先使用TTS服务预先生成的试听样本，取不到时退回原始提示音频
+        const samples = await ttsAPI.getVoiceSamples().catch((): VoiceSamples => ({}));
         const mapVoice = (voiceLabel: string, gender: string): VoicePreview => {
           const genderDir = gender === '男声' ? 'male' : 'female';
           return {
@@ -445,7 +453,8 @@ const ChatInterface: React.FC = () => {
             label: voiceLabel,
             gender: gender,
             // 构建指向后端 API (8000) 的绝对 URL
-            audioUrl: `${API_BASE_URL_FOR_PREVIEW}/prompt_voice/${genderDir}/${voiceLabel}.wav`,
+            audioUrl: samples[gender]?.[voiceLabel]?.url
+              || `${API_BASE_URL_FOR_PREVIEW}/prompt_voice/${genderDir}/${voiceLabel}.wav`,
             isLoading: false
           };
         };
@@ -501,6 +510,10 @@ const ChatInterface: React.FC = () => {
     }
     
     setConfirmingVoiceId(voice.id);
+    // 换了音色：取消上一个还没完成的合成
+    synthesisAbortRef.current?.abort();
+    const controller = new AbortController();
+    synthesisAbortRef.current = controller;
     
     try {
       const gender = voice.gender;
@@ -508,7 +521,7 @@ const ChatInterface: React.FC = () => {
       const textToSynthesize = message.formattedText;
       
       // 调用 synthesize API (它现在返回绝对 URL)
-      const response = await ttsAPI.synthesize(textToSynthesize, gender, voiceLabel);
+      const response = await ttsAPI.synthesize(textToSynthesize, gender, voiceLabel, controller.signal);
       if (response.success && response.mp3_url) {
         const aiMessage: Message = {
           id: generateId(),
@@ -521,6 +534,9 @@ const ChatInterface: React.FC = () => {
         throw new Error(response.message || '语音合成失败，未返回有效URL');
       }
     } catch (error: unknown) {
+      if (controller.signal.aborted) {
+        return;
+      }
       console.error('确认使用音色并合成时出错:', error);
       const errorMsg: Message = {
         id: generateId(),
@@ -530,7 +546,11 @@ const ChatInterface: React.FC = () => {
       };
       setMessages(prev => [...prev, errorMsg]);
     } finally {
-      setConfirmingVoiceId(null);
+      // 被新的合成取代时，加载状态交给新的合成
+      if (synthesisAbortRef.current === controller) {
+        synthesisAbortRef.current = null;
+        setConfirmingVoiceId(null);
+      }
     }
   };
 
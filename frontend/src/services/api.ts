@@ -300,6 +300,17 @@ export interface VoiceTypes {
   [gender: string]: string[];
 }
 
+export interface VoiceSample {
+  url: string;
+  opus_url: string;
+  duration: number;
+}
+
+// 性别 -> 声音标签 -> 试听样本
+export interface VoiceSamples {
+  [gender: string]: { [voiceLabel: string]: VoiceSample };
+}
+
 export interface TTSResponse {
   success: boolean;
   message: string;
@@ -322,6 +333,74 @@ export interface ConfirmScriptResponse {
 // const TTS_API_BASE_URL = 'http://localhost:8080'; // TTS 服务运行在 8080 端口
 const TTS_API_BASE_URL = import.meta.env.VITE_TTS_BASE_URL || 'http://localhost:8080';
 
+interface TaskStatus<T> {
+  status: string;
+  result?: T;
+  error?: string;
+}
+
+const isFinished = (status: string) => status === 'completed' || status === 'failed' || status === 'cancelled';
+
+// 长轮询：服务端在任务结束或等待超时后才返回
+const longPollTask = async <T>(statusUrl: string, signal?: AbortSignal): Promise<TaskStatus<T>> => {
+  for (;;) {
+    const resp = await axios.get<TaskStatus<T>>(`${TTS_API_BASE_URL}${statusUrl}`, {
+      params: { wait: 25 },
+      timeout: 60000,
+      signal
+    });
+    if (isFinished(resp.data.status)) {
+      return resp.data;
+    }
+  }
+};
+
+// 等待任务结束：优先用 SSE 接收服务端推送，连接失败时退回长轮询；signal 中止时停止等待
+const waitForTask = <T>(taskId: string, statusUrl: string, signal?: AbortSignal): Promise<TaskStatus<T>> => {
+  if (typeof EventSource === 'undefined') {
+    return longPollTask<T>(statusUrl, signal);
+  }
+  return new Promise((resolve, reject) => {
+    const source = new EventSource(
+      `${TTS_API_BASE_URL}/synthesis_tasks/events?task_ids=${encodeURIComponent(taskId)}`
+    );
+    let settled = false;
+    const finish = (data?: TaskStatus<T>) => {
+      settled = true;
+      source.close();
+      if (data) {
+        resolve(data);
+      } else {
+        longPollTask<T>(statusUrl, signal).then(resolve, reject);
+      }
+    };
+    signal?.addEventListener('abort', () => {
+      if (!settled) {
+        settled = true;
+        source.close();
+        reject(new DOMException('已取消', 'AbortError'));
+      }
+    });
+    source.addEventListener('status', (event) => {
+      const data = JSON.parse((event as MessageEvent).data) as TaskStatus<T>;
+      if (isFinished(data.status)) {
+        finish(data);
+      }
+    });
+    source.addEventListener('missing', () => {
+      settled = true;
+      source.close();
+      reject(new Error('任务不存在'));
+    });
+    source.onerror = () => {
+      // 连接断开（或服务端结束推送）且尚未拿到结果时改用长轮询
+      if (!settled) {
+        finish();
+      }
+    };
+  });
+};
+
 // API服务 - 修改 ttsAPI
 export const ttsAPI = {
   // 获取可用的声音类型
@@ -335,8 +414,26 @@ export const ttsAPI = {
     }
   },
 
-  // 合成语音 - 异步接口，内部自动轮询直到任务完成，返回绝对 URL
-  synthesize: async (text: string, gender: string, voiceLabel: string): Promise<TTSResponse> => {
+  // 获取音色试听样本（短小的压缩片段），返回绝对 URL
+  getVoiceSamples: async (): Promise<VoiceSamples> => {
+    const response = await axios.get(`${TTS_API_BASE_URL}/voice_types`);
+    const samples: VoiceSamples = response.data.samples || {};
+    for (const voices of Object.values(samples)) {
+      for (const sample of Object.values(voices)) {
+        sample.url = `${TTS_API_BASE_URL}${sample.url}`;
+        sample.opus_url = `${TTS_API_BASE_URL}${sample.opus_url}`;
+      }
+    }
+    return samples;
+  },
+
+  // 取消合成任务（用户离开或换了音色），释放推理资源；任务已结束时忽略
+  cancelTask: async (taskId: string): Promise<void> => {
+    await axios.delete(`${TTS_API_BASE_URL}/synthesis_tasks/${taskId}`, { validateStatus: () => true });
+  },
+
+  // 合成语音 - 异步接口，等待服务端推送任务结果，返回绝对 URL；signal 中止时同时取消服务端任务
+  synthesize: async (text: string, gender: string, voiceLabel: string, signal?: AbortSignal): Promise<TTSResponse> => {
     try {
       const formData = new FormData();
       formData.append('text', text);
@@ -362,38 +459,36 @@ export const ttsAPI = {
         throw new Error('服务器未返回 task_id 或 status_url');
       }
 
-      // 2. 轮询任务状态
-      const poll = async (): Promise<TTSResponse> => {
-        const resp = await axios.get<{
-          status: string;
-          result?: { wav_url: string; mp3_url: string; text: string; message: string; success: boolean };
-          error?: string;
-        }>(`${TTS_API_BASE_URL}${status_url}`);
-        const data = resp.data;
-        if (data.status === 'completed' && data.result) {
-          const abs = {
-            ...data.result,
-            wav_url: data.result.wav_url ? `${TTS_API_BASE_URL}${data.result.wav_url}` : '',
-            mp3_url: data.result.mp3_url ? `${TTS_API_BASE_URL}${data.result.mp3_url}` : ''
-          } as TTSResponse;
-          return abs;
-        }
-        if (data.status === 'failed') {
-          throw new Error(data.error || '语音合成任务失败');
-        }
-        // pending 或 processing
-        await new Promise((res) => setTimeout(res, 20000));
-        return poll();
+      // 2. 等待服务端推送任务结果
+      if (signal?.aborted) {
+        await ttsAPI.cancelTask(task_id);
+        throw new DOMException('已取消', 'AbortError');
+      }
+      const onAbort = () => {
+        ttsAPI.cancelTask(task_id).catch(() => undefined);
+      };
+      signal?.addEventListener('abort', onAbort);
+      let data: TaskStatus<TTSResponse>;
+      try {
+        data = await waitForTask<TTSResponse>(task_id, status_url, signal);
+      } finally {
+        signal?.removeEventListener('abort', onAbort);
+      }
+      if (data.status !== 'completed' || !data.result) {
+        throw new Error(data.error || '语音合成任务失败');
+      }
+      return {
+        ...data.result,
+        wav_url: data.result.wav_url ? `${TTS_API_BASE_URL}${data.result.wav_url}` : '',
+        mp3_url: data.result.mp3_url ? `${TTS_API_BASE_URL}${data.result.mp3_url}` : ''
       };
-
-      return await poll();
     } catch (error) {
       console.error('语音合成失败:', error);
       throw error;
     }
   },
 
-  // 确认脚本 - 返回绝对 URL
+  // 确认脚本 - 最终音频在后台生成，超过等待时间时轮询任务状态，返回绝对 URL
   confirmScript: async (
     text: string,
     gender: string,
@@ -402,27 +497,41 @@ export const ttsAPI = {
     sessionId?: string
   ): Promise<ConfirmScriptResponse> => {
     try {
-      const response = await axios.post<ConfirmScriptResponse>(
+      const response = await axios.post(
           `${TTS_API_BASE_URL}/confirm_script`, 
           {
             text,
             gender,
             voice_label: voiceLabel,
             user_id: userId,
-            session_id: sessionId
+            session_id: sessionId,
+            wait_seconds: 30
           },
           {
             headers: {
               'Content-Type': 'application/json',
               'Accept': 'application/json'
-            }
+            },
+            validateStatus: (status) => status === 200 || status === 202
           }
       );
+
+      let result: ConfirmScriptResponse = response.data;
+      if (response.status === 202) {
+        // 等待时间内未完成，等待服务端推送任务结果
+        const { task_id, status_url } = response.data as { task_id: string; status_url: string };
+        const taskData = await waitForTask<ConfirmScriptResponse>(task_id, status_url);
+        if (taskData.status !== 'completed' || !taskData.result) {
+          throw new Error(taskData.error || '生成最终音频失败');
+        }
+        result = taskData.result;
+      }
+
        // Prepend TTS base URL to relative paths
        const absoluteData = {
-        ...response.data,
-        wav_url: response.data.wav_url ? `${TTS_API_BASE_URL}${response.data.wav_url}` : '',
-        mp3_url: response.data.mp3_url ? `${TTS_API_BASE_URL}${response.data.mp3_url}` : ''
+        ...result,
+        wav_url: result.wav_url ? `${TTS_API_BASE_URL}${result.wav_url}` : '',
+        mp3_url: result.mp3_url ? `${TTS_API_BASE_URL}${result.mp3_url}` : ''
       };
       return absoluteData;
     } catch (error) {
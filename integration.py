@@ -1,56 +1,50 @@
 import os
 import sys
 import json
-import requests
 from pathlib import Path
 
+from tts_service.client import TTSClient, TTSClientError
+
 """
 这个脚本演示了如何从魔声AI应用调用语音合成API。
 在实际应用中，这些代码应该集成到魔声AI应用的后端。
 """
 
 # API地址
-API_URL = "http://localhost:8080/synthesize"
+API_URL = os.environ.get("TTS_API_URL", "http://localhost:8080")
 
-def synthesize_speech(text, voice_type="默认"):
+def synthesize_speech(client, text, gender="女声", voice_label="女声1大气磁性"):
     """
     调用API合成语音
     
     参数:
+    - client: TTSClient 实例（复用连接池）
     - text: 要合成的文本
-    - voice_type: 声音类型，默认为"默认"
+    - gender: 性别（男声/女声）
+    - voice_label: 声音标签
     
     返回:
     - 语音文件的路径
     """
     try:
-        print(f"正在合成文本: '{text}', 声音类型: {voice_type}")
-        
-        # 准备请求数据
-        data = {
-            "text": text,
-            "voice_type": voice_type
-        }
+        print(f"正在合成文本: '{text}', 声音: {gender}/{voice_label}")
         
-        # 发送请求
-        response = requests.post(API_URL, data=data)
+        # 提交任务并等待合成完成
+        result = client.synthesize(text, gender, voice_label, timeout=300)
         
-        if response.status_code != 200:
-            print(f"合成失败: {response.status_code} - {response.text}")
-            return None
-        
-        # 保存语音文件
+        # 下载语音文件
         output_dir = Path("./client_output")
         output_dir.mkdir(exist_ok=True)
         
-        output_path = output_dir / f"speech_{voice_type}.wav"
-        
-        with open(output_path, "wb") as f:
-            f.write(response.content)
+        output_path = output_dir / f"speech_{voice_label}.mp3"
+        client.download(result["mp3_url"], str(output_path))
         
         print(f"已保存语音文件: {output_path}")
         return str(output_path)
     
+    except (TTSClientError, TimeoutError) as e:
+        print(f"合成失败: {str(e)}")
+        return None
     except Exception as e:
         print(f"合成过程中出错: {str(e)}")
         return None
@@ -63,7 +57,8 @@ def main():
     test_text = "好消息，好消息！魔声AI语音合成全面升级了！促销配音一次搞定，不信你就试试看！全友家居年货节，家具买一万送8999元，定制衣柜、整体橱柜，沙发，床垫，软床，成品家具，一站式购齐，地址:南屏首座二楼永辉超市楼上，全友家居。电话18859826481"
     
     # 合成语音
-    output_path = synthesize_speech(test_text)
+    with TTSClient(API_URL) as client:
+        output_path = synthesize_speech(client, test_text)
     
     if output_path:
         print(f"语音合成成功，文件保存在: {output_path}")
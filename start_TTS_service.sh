@@ -20,6 +20,16 @@ else
     echo "ffmpeg-python已安装，继续启动服务..."
 fi
 
+# 检查prometheus_client是否安装（/metrics 指标接口）
+if ! pip list | grep -q "prometheus[-_]client"; then
+    echo "prometheus_client未安装，正在安装..."
+    pip install prometheus_client
+    if [ $? -ne 0 ]; then
+        echo "安装prometheus_client失败，请手动安装后重试"
+        exit 1
+    fi
+fi
+
 # 检查系统ffmpeg命令是否可用
 if ! command -v ffmpeg &> /dev/null; then
     echo "警告: 系统ffmpeg命令不可用，可能会影响音频转换功能"
@@ -0,0 +1,143 @@
+"""
+FairShareQueue 的调度顺序：租户间赤字轮询、租户内短任务优先、优先级类别与防饿死、插队和取消
+"""
+import pytest
+
+from tts_service.scheduler import FairShareQueue, Job, JobCancelled, raise_if_cancelled
+
+
+def make_job(job_id, tenant="t", cost=1, priority="interactive", fn=None):
+    return Job(job_id, tenant, cost, fn or (lambda: job_id), priority)
+
+
+def drain(queue):
+    order = []
+    while True:
+        job = queue.get(timeout=0)
+        if job is None:
+            return order
+        order.append(job.job_id)
+
+
+def test_tenants_share_the_queue_round_robin():
+    queue = FairShareQueue(quantum=4, starvation_seconds=None)
+    for i in range(6):
+        queue.put(make_job(f"a{i}", tenant="a", cost=4))
+    queue.put(make_job("b0", tenant="b", cost=4))
+    queue.put(make_job("b1", tenant="b", cost=4))
+
+    # 先提交大量任务的租户不会把后来的租户挤到最后
+    assert drain(queue) == ["a0", "b0", "a1", "b1", "a2", "a3", "a4", "a5"]
+
+
+def test_deficit_carries_over_for_jobs_larger_than_quantum():
+    queue = FairShareQueue(quantum=2, starvation_seconds=None)
+    queue.put(make_job("big", tenant="a", cost=5))
+    for i in range(3):
+        queue.put(make_job(f"b{i}", tenant="b", cost=2))
+
+    # a 要攒满三轮额度才能执行5个分段的任务，期间 b 每轮执行一个
+    assert drain(queue) == ["b0", "b1", "big", "b2"]
+
+
+def test_shortest_job_first_within_a_tenant():
+    queue = FairShareQueue(quantum=100, starvation_seconds=None)
+    queue.put(make_job("long", cost=8))
+    queue.put(make_job("short", cost=1))
+    queue.put(make_job("medium", cost=3))
+
+    assert drain(queue) == ["short", "medium", "long"]
+
+
+def test_higher_priority_classes_go_first():
+    queue = FairShareQueue(starvation_seconds=None)
+    queue.put(make_job("speculative", priority="speculative"))
+    queue.put(make_job("batch", priority="batch"))
+    queue.put(make_job("final", priority="final"))
+    queue.put(make_job("interactive", priority="interactive"))
+
+    assert drain(queue) == ["interactive", "final", "batch", "speculative"]
+
+
+def test_starved_job_is_served_before_higher_priority():
+    queue = FairShareQueue(starvation_seconds=10.0)
+    starved = make_job("batch", priority="batch")
+    starved.enqueued_at -= 11.0
+    queue.put(starved)
+    queue.put(make_job("interactive", priority="interactive"))
+
+    assert drain(queue) == ["batch", "interactive"]
+
+
+def test_speculative_jobs_are_never_boosted():
+    queue = FairShareQueue(starvation_seconds=10.0)
+    speculative = make_job("speculative", priority="speculative")
+    speculative.enqueued_at -= 3600.0
+    queue.put(speculative)
+    queue.put(make_job("interactive", priority="interactive"))
+
+    assert drain(queue) == ["interactive", "speculative"]
+
+
+def test_preempt_point_runs_higher_priority_jobs_first():
+    queue = FairShareQueue(starvation_seconds=None)
+    order = []
+
+    def long_job():
+        order.append("final:0")
+        queue.put(make_job("interactive", fn=lambda: order.append("interactive")))
+        queue.put(make_job("batch", priority="batch", fn=lambda: order.append("batch")))
+        queue.preempt_point()
+        order.append("final:1")
+
+    queue.put(make_job("final", priority="final", fn=long_job))
+    job = queue.get(timeout=0)
+    job.run()
+
+    job.future.result()
+    # 只插队更高优先级的任务，低优先级的留在队列中
+    assert order == ["final:0", "interactive", "final:1"]
+    assert job.preemptions == 1
+    assert drain(queue) == ["batch"]
+
+
+def test_cancel_removes_queued_sub_jobs_by_prefix():
+    queue = FairShareQueue(starvation_seconds=None)
+    parent = make_job("t1")
+    more = make_job("t1:more")
+    other = make_job("t10")
+    for job in (parent, more, other):
+        queue.put(job)
+
+    cancelled = queue.cancel("t1")
+
+    assert [job.job_id for job in cancelled["queued"]] == ["t1", "t1:more"]
+    assert cancelled["running"] == []
+    for job in (parent, more):
+        with pytest.raises(JobCancelled):
+            job.future.result(timeout=0)
+    # 只是ID前缀相同的其他任务不受影响
+    assert drain(queue) == ["t10"]
+
+
+def test_cancel_marks_running_sub_job():
+    queue = FairShareQueue(starvation_seconds=None)
+    segments = []
+
+    def render():
+        for i in range(3):
+            raise_if_cancelled()
+            segments.append(i)
+            if i == 0:
+                queue.cancel("t1")
+
+    queue.put(make_job("t1:more", fn=render))
+    job = queue.get(timeout=0)
+    job.run()
+
+    # 执行中的作业在下一个分段边界停止
+    assert job.cancel_requested
+    assert segments == [0]
+    with pytest.raises(JobCancelled):
+        job.future.result(timeout=0)
+    assert queue.in_flight() == 0
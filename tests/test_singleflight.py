@@ -0,0 +1,80 @@
+"""
+相同请求合并的引用计数取消：一个订阅者取消不影响共享作业，最后一个订阅者取消时作业才被取消
+
+按 app.py 中取消任务的流程操作：先 detach，返回 False（最后一个订阅者）时再按 leader 的任务ID取消作业
+"""
+import pytest
+
+from tts_service.scheduler import FairShareQueue, Job, JobCancelled, raise_if_cancelled
+from tts_service.singleflight import SingleFlight
+
+KEY = ("synthesize", "好消息，好消息！", "女声", "女声1大气磁性")
+
+
+def cancel_subscriber(flights: SingleFlight, queue: FairShareQueue, task_id: str):
+    """与 DELETE /synthesis_tasks/{task_id} 相同：还有其他订阅者时只退出，否则取消作业"""
+    flight = flights.flight_of(task_id)
+    if flights.detach(task_id):
+        return None
+    return queue.cancel(flight.leader)
+
+
+def start_shared_job(fn):
+    flights, queue = SingleFlight(), FairShareQueue(starvation_seconds=None)
+    job = Job("leader", "ip:1", 1, fn)
+    flight = flights.start(KEY, "leader", job, {"status": "pending"})
+    queue.put(job)
+    assert flights.join(KEY, "follower") is flight
+    return flights, queue, flight, job
+
+
+def test_job_keeps_running_for_remaining_subscriber():
+    flights, queue, flight, job = start_shared_job(lambda: "audio.wav")
+
+    assert cancel_subscriber(flights, queue, "leader") is None
+
+    assert flight.subscribers == ["follower"]
+    assert not flight.closed
+    # 作业仍在队列中，执行完成后结果属于剩下的订阅者
+    assert queue.get(timeout=0) is job
+    job.run()
+    assert job.future.result(timeout=0) == "audio.wav"
+    assert flights.flight_of("follower") is flight
+
+
+def test_job_is_cancelled_once_every_subscriber_cancelled():
+    flights, queue, flight, job = start_shared_job(lambda: "audio.wav")
+
+    assert cancel_subscriber(flights, queue, "follower") is None
+    cancelled = cancel_subscriber(flights, queue, "leader")
+
+    assert cancelled["queued"] == [job]
+    assert flight.closed
+    with pytest.raises(JobCancelled):
+        job.future.result(timeout=0)
+    assert queue.depth() == 0
+    # 已关闭的作业不再接受新的订阅者
+    assert flights.join(KEY, "late") is None
+
+
+def test_running_job_stops_after_last_subscriber_cancels():
+    segments = []
+
+    def render():
+        for i in range(3):
+            raise_if_cancelled()
+            segments.append(i)
+            if i == 0:
+                cancel_subscriber(flights, queue, "leader")
+            elif i == 1:
+                cancel_subscriber(flights, queue, "follower")
+
+    flights, queue, flight, job = start_shared_job(render)
+    assert queue.get(timeout=0) is job
+    job.run()
+
+    # 第一个订阅者取消后作业继续，第二个取消后在下一个分段边界停止
+    assert segments == [0, 1]
+    assert job.cancel_requested
+    with pytest.raises(JobCancelled):
+        job.future.result(timeout=0)
@@ -0,0 +1 @@
+"""魔声AI语音合成服务的内部组件（调度、限流等），由 app.py 使用"""
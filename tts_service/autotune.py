@@ -0,0 +1,327 @@
+"""
+分段长度自动调优：按语言记录每段推理耗时与分段长度的关系，拟合出耗时模型后选择分段长度
+
+分段太短时每次调用的固定开销（提示条件化、模型启动）占比高，分段太长则首段延迟变大、质量也更容易下降。
+耗时模型为 推理秒数 = a + b·字符数 + c·字符数²：a 是每次调用的固定开销，c 反映长序列的额外代价。
+吞吐量（每秒计算生成的音频秒数）在 字符数 = sqrt(a / c) 附近最高；首段延迟目标则取满足目标的最长分段。
+
+用法:
+    # 离线测量：加载模型，按不同分段长度合成校准文本，样本追加到 samples.jsonl 并输出报告
+    python -m tts_service.autotune measure --output segment_samples.jsonl --gender 女声 --voice-label 女声1大气磁性
+    # 根据服务记录（TTS_SEGMENT_SAMPLES_FILE）或离线测量的样本输出调优报告
+    python -m tts_service.autotune report segment_samples.jsonl
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+
+# 两种优化目标：吞吐量优先（最终成品、批量），首段延迟优先（交互试听）
+OBJECTIVES = ("throughput", "first_segment")
+# 报告中按字符数分桶的宽度
+BUCKET_CHARS = 10
+
+
+class SegmentCostModel(NamedTuple):
+    """单段推理耗时模型：seconds = overhead + linear·chars + quadratic·chars²"""
+
+    overhead: float
+    linear: float
+    quadratic: float
+    audio_per_char: float  # 每个字符对应的音频秒数
+    samples: int
+
+    def predict(self, chars: int) -> float:
+        return self.overhead + self.linear * chars + self.quadratic * chars * chars
+
+    def throughput(self, chars: int) -> float:
+        """每秒推理生成的音频秒数（实时率的倒数）"""
+        seconds = self.predict(chars)
+        return self.audio_per_char * chars / seconds if seconds > 0 else 0.0
+
+
+class _LanguageStats:
+    """一种语言的样本：最小二乘所需的累加量，以及按长度分桶的汇总（用于报告）"""
+
+    def __init__(self):
+        self.x_powers = np.zeros(5)  # Σx^0..Σx^4
+        self.xy = np.zeros(3)  # Σy, Σxy, Σx²y
+        self.chars = 0
+        self.audio_seconds = 0.0
+        self.buckets: Dict[int, List[float]] = {}  # 桶 -> [样本数, 推理秒数, 音频秒数, 字符数]
+
+    @property
+    def count(self) -> int:
+        return int(self.x_powers[0])
+
+    def add(self, chars: int, seconds: float, audio_seconds: float):
+        self.x_powers += [chars ** k for k in range(5)]
+        self.xy += [seconds * chars ** k for k in range(3)]
+        self.chars += chars
+        self.audio_seconds += audio_seconds
+        bucket = self.buckets.setdefault((chars - 1) // BUCKET_CHARS, [0, 0.0, 0.0, 0])
+        bucket[0] += 1
+        bucket[1] += seconds
+        bucket[2] += audio_seconds
+        bucket[3] += chars
+
+    def fit(self) -> Optional[SegmentCostModel]:
+        """最小二乘拟合耗时模型；样本覆盖的长度不足三档时返回 None"""
+        if len(self.buckets) < 3 or self.chars <= 0:
+            return None
+        s = self.x_powers
+        normal = np.array([[s[0], s[1], s[2]], [s[1], s[2], s[3]], [s[2], s[3], s[4]]])
+        try:
+            overhead, linear, quadratic = np.linalg.solve(normal, self.xy)
+            if quadratic < 0:
+                # 测量噪声导致的负二次项：退化为线性模型
+                overhead, linear = np.linalg.solve(normal[:2, :2], self.xy[:2])
+                quadratic = 0.0
+        except np.linalg.LinAlgError:
+            return None
+        return SegmentCostModel(max(0.0, float(overhead)), max(0.0, float(linear)), float(quadratic),
+                                self.audio_seconds / self.chars, self.count)
+
+
+def choose_budgets(model: SegmentCostModel, min_length: int, max_length: int,
+                   first_segment_seconds: float) -> Dict[str, int]:
+    """
+    根据耗时模型选择两种目标下的分段长度
+
+    Returns:
+        Dict[str, int]: {"throughput": 吞吐量最高的长度, "first_segment": 首段推理不超过目标的最长长度}
+    """
+    lengths = range(min_length, max_length + 1)
+    throughput = max(lengths, key=lambda n: (round(model.throughput(n), 6), n))
+    fitting = [n for n in range(min_length, throughput + 1) if model.predict(n) <= first_segment_seconds]
+    return {"throughput": throughput, "first_segment": max(fitting) if fitting else min_length}
+
+
+class SegmentTuner:
+    """
+    在线分段长度调优器：推理线程每合成一段调用 record，每 refit_every 个样本重新拟合一次
+
+    Args:
+        default_length: 样本不足时使用的分段长度
+        min_length / max_length: 分段长度的取值范围（上限同时防止长分段的质量下降）
+        first_segment_seconds: 首段延迟优先时，单段推理耗时的目标（秒）
+        min_samples: 开始调优前每种语言至少需要的样本数
+        refit_every: 每多少个新样本重新拟合一次
+        samples_path: 样本文件（JSONL），启动时读入已有样本，新样本追加写入；None 表示只保存在内存
+    """
+
+    def __init__(self, default_length: int, min_length: int = 20, max_length: int = 150,
+                 first_segment_seconds: float = 1.5, min_samples: int = 30, refit_every: int = 20,
+                 samples_path: Optional[str] = None):
+        self.default_length = default_length
+        self.min_length = min_length
+        self.max_length = max(min_length, max_length)
+        self.first_segment_seconds = first_segment_seconds
+        self.min_samples = min_samples
+        self.refit_every = refit_every
+        self.samples_path = samples_path
+        self._stats: Dict[str, _LanguageStats] = {}
+        self._models: Dict[str, SegmentCostModel] = {}
+        self._budgets: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self._samples_file = None
+        if samples_path and os.path.exists(samples_path):
+            with open(samples_path, "r", encoding="utf-8") as f:
+                self.load(f)
+
+    def load(self, lines: Iterable[str]) -> int:
+        """读入 JSONL 样本（忽略无法解析的行），返回读入的样本数"""
+        loaded = 0
+        with self._lock:
+            for line in lines:
+                try:
+                    sample = json.loads(line)
+                    stats = self._stats.setdefault(sample["language"], _LanguageStats())
+                    stats.add(int(sample["chars"]), float(sample["inference_seconds"]), float(sample["audio_seconds"]))
+                except (ValueError, KeyError, TypeError):
+                    continue
+                loaded += 1
+            for language in self._stats:
+                self._refit_locked(language)
+        return loaded
+
+    def record(self, language: str, chars: int, inference_seconds: float, audio_seconds: float):
+        """记录一段推理，可在推理线程中调用"""
+        if chars <= 0 or inference_seconds <= 0:
+            return
+        with self._lock:
+            stats = self._stats.setdefault(language, _LanguageStats())
+            stats.add(chars, inference_seconds, audio_seconds)
+            if stats.count % self.refit_every == 0:
+                self._refit_locked(language)
+            if self.samples_path:
+                if self._samples_file is None:
+                    self._samples_file = open(self.samples_path, "a", encoding="utf-8")
+                self._samples_file.write(json.dumps({
+                    "language": language,
+                    "chars": chars,
+                    "inference_seconds": round(inference_seconds, 4),
+                    "audio_seconds": round(audio_seconds, 4),
+                    "timestamp": round(time.time(), 3),
+                }) + "\n")
+                self._samples_file.flush()
+
+    def _refit_locked(self, language: str):
+        stats = self._stats[language]
+        model = stats.fit() if stats.count >= self.min_samples else None
+        if model is None:
+            return
+        self._models[language] = model
+        self._budgets[language] = choose_budgets(model, self.min_length, self.max_length, self.first_segment_seconds)
+
+    def budgets(self, language: str) -> Dict[str, int]:
+        """该语言两种目标下的分段长度；样本不足时都是默认长度"""
+        budgets = self._budgets.get(language)
+        if budgets is None:
+            return {objective: self.default_length for objective in OBJECTIVES}
+        return budgets
+
+    def snapshot(self) -> Dict[str, Any]:
+        """各语言的样本汇总、耗时模型和当前分段长度"""
+        with self._lock:
+            languages = {}
+            for language, stats in sorted(self._stats.items()):
+                model = self._models.get(language)
+                languages[language] = {
+                    "samples": stats.count,
+                    "model": model._asdict() if model else None,
+                    "budgets": self.budgets(language),
+                    "buckets": [
+                        {
+                            "chars": f"{bucket * BUCKET_CHARS + 1}-{(bucket + 1) * BUCKET_CHARS}",
+                            "samples": count,
+                            "mean_chars": round(chars / count, 1),
+                            "mean_inference_seconds": round(seconds / count, 4),
+                            "real_time_factor": round(seconds / audio, 3) if audio else None,
+                        }
+                        for bucket, (count, seconds, audio, chars) in sorted(stats.buckets.items())
+                    ],
+                }
+            return {
+                "default_length": self.default_length,
+                "min_length": self.min_length,
+                "max_length": self.max_length,
+                "first_segment_seconds": self.first_segment_seconds,
+                "languages": languages,
+            }
+
+
+def format_report(snapshot: Dict[str, Any]) -> str:
+    """把 SegmentTuner.snapshot() 格式化为文本报告"""
+    default = snapshot["default_length"]
+    lines = [
+        f"分段长度范围 {snapshot['min_length']}-{snapshot['max_length']} 字符，"
+        f"首段推理目标 {snapshot['first_segment_seconds']} 秒，当前固定长度 {default} 字符",
+    ]
+    for language, entry in snapshot["languages"].items():
+        lines.append("")
+        lines.append(f"[{'中文' if language == 'zh' else '英文'}] {entry['samples']} 个样本")
+        lines.append(f"{'字符数':>10} {'样本':>6} {'平均推理秒':>10} {'实时率':>8}")
+        for bucket in entry["buckets"]:
+            rtf = "-" if bucket["real_time_factor"] is None else f"{bucket['real_time_factor']:.3f}"
+            lines.append(f"{bucket['chars']:>10} {bucket['samples']:>6} {bucket['mean_inference_seconds']:>10.3f} {rtf:>8}")
+        if entry["model"] is None:
+            lines.append("样本不足（至少需要覆盖三档长度），使用固定长度")
+            continue
+        model = SegmentCostModel(**entry["model"])
+        budgets = entry["budgets"]
+        lines.append(
+            f"耗时模型: {model.overhead:.4f} + {model.linear:.5f}·n + {model.quadratic:.7f}·n² 秒"
+            f"（每字符 {model.audio_per_char:.3f} 秒音频）"
+        )
+        for objective, label in (("throughput", "吞吐量优先"), ("first_segment", "首段延迟优先")):
+            length = budgets[objective]
+            lines.append(
+                f"{label}: {length} 字符，单段推理 {model.predict(length):.3f} 秒，"
+                f"吞吐 {model.throughput(length):.2f} 音频秒/秒"
+                f"（固定长度 {default}: {model.predict(default):.3f} 秒，{model.throughput(default):.2f} 音频秒/秒）"
+            )
+    return "\n".join(lines)
+
+
+# 离线测量使用的校准文本
+CALIBRATION_TEXTS = {
+    "zh": "欢迎光临魔声AI，全场商品限时优惠，好消息不容错过。定制衣柜、整体橱柜、沙发床垫一站式购齐，"
+          "新春特惠活动火热进行中，到店即可领取精美礼品，详情请咨询门店工作人员。",
+    "en": "Welcome to our grand opening sale, with great deals on furniture, kitchens and mattresses. "
+          "Visit our showroom this weekend to claim a free gift and talk to our design team. ",
+}
+
+
+def measure(tts, tuner: SegmentTuner, gender: str, voice_label: str, lengths: List[int],
+            repeats: int, languages: List[str]):
+    """用已加载模型的服务模块 tts 按各长度合成校准文本，把耗时记录到 tuner"""
+    voice_path, text_path = tts.get_voice_path(gender, voice_label)
+    prompt_speech_16k, prompt_text = tts.PROMPT_CACHE.get(voice_path, text_path)
+    # 第一次调用包含延迟初始化，不计入样本
+    tts.synthesize_segment(CALIBRATION_TEXTS["zh"][:20], voice_path, prompt_text, prompt_speech_16k)
+    for language in languages:
+        base = CALIBRATION_TEXTS[language]
+        for length in lengths:
+            text = (base * (length // len(base) + 1))[:length]
+            for _ in range(repeats):
+                started = time.perf_counter()
+                speech = tts.synthesize_segment(text, voice_path, prompt_text, prompt_speech_16k)
+                seconds = time.perf_counter() - started
+                tuner.record(language, len(text), seconds, speech.shape[-1] / tts.cosyvoice.sample_rate)
+            print(f"[{language}] {length} 字符: {seconds:.3f} 秒")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="分段长度调优：离线测量与报告")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    tuning = argparse.ArgumentParser(add_help=False)
+    tuning.add_argument("--default-length", type=int, default=100, help="当前固定分段长度")
+    tuning.add_argument("--min-length", type=int, default=20)
+    tuning.add_argument("--max-length", type=int, default=150)
+    tuning.add_argument("--first-segment-seconds", type=float, default=1.5, help="首段推理耗时目标（秒）")
+    tuning.add_argument("--json", action="store_true", help="输出JSON而不是文本报告")
+
+    report = subparsers.add_parser("report", parents=[tuning], help="根据样本文件输出调优报告")
+    report.add_argument("samples", help="样本文件（JSONL）")
+
+    measure_parser = subparsers.add_parser("measure", parents=[tuning], help="加载模型测量各分段长度的推理耗时")
+    measure_parser.add_argument("--output", default="segment_samples.jsonl", help="样本追加写入的文件")
+    measure_parser.add_argument("--backend", default=os.environ.get("TTS_MODEL_BACKEND", "cosyvoice"))
+    measure_parser.add_argument("--gender", default="女声")
+    measure_parser.add_argument("--voice-label", default="女声1大气磁性")
+    measure_parser.add_argument("--lengths", default="10,20,30,40,60,80,100,120,150,200", help="逗号分隔的分段长度")
+    measure_parser.add_argument("--repeats", type=int, default=3)
+    measure_parser.add_argument("--languages", default="zh,en")
+    args = parser.parse_args(argv)
+
+    options = dict(min_length=args.min_length, max_length=args.max_length,
+                   first_segment_seconds=args.first_segment_seconds, min_samples=1, refit_every=1)
+    if args.command == "report":
+        if not os.path.exists(args.samples):
+            parser.error(f"样本文件不存在: {args.samples}")
+        tuner = SegmentTuner(args.default_length, samples_path=args.samples, **options)
+    else:
+        os.environ["TTS_MODEL_BACKEND"] = args.backend
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        # 复用服务的提示缓存和推理代码；导入时不会加载模型
+        import app as tts
+        from tts_service.engine import load_model
+
+        tts.cosyvoice = load_model(args.backend, tts.COSYVOICE_PATH)
+        tuner = SegmentTuner(args.default_length, samples_path=args.output, **options)
+        measure(tts, tuner, args.gender, args.voice_label,
+                [int(n) for n in args.lengths.split(",") if n], args.repeats,
+                [language for language in args.languages.split(",") if language])
+        print()
+    snapshot = tuner.snapshot()
+    print(json.dumps(snapshot, ensure_ascii=False, indent=2) if args.json else format_report(snapshot))
+
+
+if __name__ == "__main__":
+    main()
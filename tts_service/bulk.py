@@ -0,0 +1,298 @@
+"""
+离线批量合成：不经过HTTP，直接在本机启动多个进程（每个进程加载一次模型）合成 JSONL 中的全部条目
+
+输入文件每行一个条目: {"id": "可选", "text": "...", "gender": "女声", "voice_label": "女声1大气磁性"}
+同一音色的条目分到同一个进程并连续执行，提示音频和音色特征只加载一次。每完成一条立即把结果追加到
+输出目录的 results.jsonl，进程崩溃或中断后用同样的命令重新运行，已完成的条目会被跳过。
+
+用法:
+    python -m tts_service.bulk scripts.jsonl --output-dir bulk_output --workers 2
+    TTS_MODEL_BACKEND=stub python -m tts_service.bulk scripts.jsonl --workers 4
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import re
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+RESULTS_NAME = "results.jsonl"
+
+
+def file_stem(item_id: str) -> str:
+    """
+    条目输出文件名（不含扩展名）
+
+    id 中的非法字符替换为下划线；替换过的 id 再加上原 id 的短哈希，避免 "a/b" 和 "a_b" 写到同一个文件
+    """
+    stem = re.sub(r"[^\w-]", "_", item_id)
+    if stem != item_id:
+        stem += "_" + hashlib.sha1(item_id.encode("utf-8")).hexdigest()[:8]
+    return stem
+
+
+def load_items(input_path: str, default_gender: Optional[str] = None,
+               default_voice_label: Optional[str] = None) -> List[Dict[str, str]]:
+    """
+    读取输入文件，返回 [{"id", "text", "gender", "voice_label"}]
+
+    条目缺少 id 时用行号；缺少音色时使用命令行指定的默认音色。格式错误或两个条目的输出文件名相同时
+    抛出 ValueError 并指出行号
+    """
+    items = []
+    seen_ids = set()
+    stems: Dict[str, str] = {}
+    with open(input_path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                raw = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"第{line_number}行不是合法的JSON: {e}")
+            if not isinstance(raw, dict):
+                raise ValueError(f"第{line_number}行必须是JSON对象")
+            item = {
+                "id": str(raw.get("id") or line_number),
+                "text": raw.get("text"),
+                "gender": raw.get("gender") or default_gender,
+                "voice_label": raw.get("voice_label") or default_voice_label,
+            }
+            if not all(isinstance(item[key], str) and item[key].strip() for key in ("text", "gender", "voice_label")):
+                raise ValueError(f"第{line_number}行缺少 text、gender 或 voice_label")
+            if item["id"] in seen_ids:
+                raise ValueError(f"第{line_number}行的id重复: {item['id']}")
+            seen_ids.add(item["id"])
+            stem = file_stem(item["id"])
+            if stem in stems:
+                raise ValueError(f"第{line_number}行的id {item['id']} 与 {stems[stem]} 的输出文件名相同")
+            stems[stem] = item["id"]
+            items.append(item)
+    return items
+
+
+def load_checkpoint(results_path: str) -> Dict[str, Dict[str, Any]]:
+    """
+    读取已有的结果文件，返回 {条目id: 最后一次结果}
+
+    崩溃时最后一行可能只写了一半，解析失败的行直接忽略（该条目会重新合成）
+    """
+    results: Dict[str, Dict[str, Any]] = {}
+    if not os.path.exists(results_path):
+        return results
+    with open(results_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(record, dict) and "id" in record:
+                results[str(record["id"])] = record
+    return results
+
+
+def shard_by_voice(items: List[Dict[str, str]], workers: int) -> List[List[Dict[str, str]]]:
+    """
+    按音色分组后把各组分配给进程，使每个进程的总字数尽量接近
+
+    单个音色的字数超过平均负载时拆成多块，避免一个大音色拖住整体进度；分块仍然按音色连续执行
+    """
+    groups: Dict[Tuple[str, str], List[Dict[str, str]]] = {}
+    for item in items:
+        groups.setdefault((item["gender"], item["voice_label"]), []).append(item)
+
+    target = sum(len(item["text"]) for item in items) / max(workers, 1)
+    chunks: List[List[Dict[str, str]]] = []
+    for group in groups.values():
+        chunk: List[Dict[str, str]] = []
+        chunk_chars = 0
+        for item in group:
+            if chunk and chunk_chars + len(item["text"]) > target:
+                chunks.append(chunk)
+                chunk, chunk_chars = [], 0
+            chunk.append(item)
+            chunk_chars += len(item["text"])
+        chunks.append(chunk)
+
+    # 最长处理时间优先：大块先分给当前负载最小的进程
+    shards: List[List[Dict[str, str]]] = [[] for _ in range(workers)]
+    loads = [0] * workers
+    for chunk in sorted(chunks, key=lambda c: -sum(len(item["text"]) for item in c)):
+        index = loads.index(min(loads))
+        shards[index].extend(chunk)
+        loads[index] += sum(len(item["text"]) for item in chunk)
+    return [shard for shard in shards if shard]
+
+
+def _synthesize_item(tts, item: Dict[str, str], output_dir: str) -> Dict[str, Any]:
+    """合成单个条目，输出先写临时文件再改名，崩溃时不会留下看似完整的文件"""
+    from tts_service.metrics import StageTimer
+
+    timings: Dict[str, Any] = {}
+    timer = StageTimer(timings)
+    started_at = time.time()
+    stem = file_stem(item["id"])
+    part_paths = []
+    try:
+        with timer.stage("prompt_load"):
+            voice_path, text_path = tts.get_voice_path(item["gender"], item["voice_label"])
+            prompt_speech_16k, prompt_text = tts.PROMPT_CACHE.get(voice_path, text_path)
+        with timer.stage("text_split"):
+            text_segments = tts.split_text_for(item["text"], "batch")
+        for i, segment in enumerate(text_segments):
+            part_path = os.path.join(output_dir, f"{stem}_part{i}.wav")
+            tts.render_segment(timer, segment, voice_path, prompt_text, prompt_speech_16k, part_path)
+            part_paths.append(part_path)
+        temp_wav_path = os.path.join(output_dir, f"{stem}.partial.wav")
+        with timer.stage("concatenate"):
+            tts.concatenate_audio(part_paths, temp_wav_path)
+        with timer.stage("encode"):
+            temp_mp3_path = tts.convert_wav_to_mp3(temp_wav_path)
+        wav_path = os.path.join(output_dir, f"{stem}.wav")
+        mp3_path = os.path.join(output_dir, f"{stem}.mp3")
+        os.replace(temp_mp3_path, mp3_path)
+        os.replace(temp_wav_path, wav_path)
+        return {
+            "id": item["id"],
+            "status": "completed",
+            "wav": os.path.basename(wav_path),
+            "mp3": os.path.basename(mp3_path),
+            "audio_seconds": round(timer.audio_seconds, 3),
+            "seconds": round(time.time() - started_at, 3),
+            "real_time_factor": timings.get("real_time_factor"),
+        }
+    except Exception as e:
+        return {
+            "id": item["id"],
+            "status": "failed",
+            "error": getattr(e, "detail", None) or str(e),
+            "seconds": round(time.time() - started_at, 3),
+        }
+    finally:
+        for part_path in part_paths:
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+
+
+def _worker_main(worker_index: int, items: List[Dict[str, str]], output_dir: str,
+                 backend: str, device: Optional[str], results: "multiprocessing.Queue"):
+    """子进程入口：加载一次模型，然后按分配顺序合成，每条结果通过队列交给主进程写入"""
+    if device is not None:
+        # 必须在导入torch之前设置
+        os.environ["CUDA_VISIBLE_DEVICES"] = device
+    os.environ["TTS_MODEL_BACKEND"] = backend
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    # 复用服务的分段、提示缓存和推理代码；导入时不会加载模型
+    import app as tts
+    from tts_service.engine import load_model
+
+    started_at = time.time()
+    tts.cosyvoice = load_model(backend, tts.COSYVOICE_PATH)
+    print(f"[进程{worker_index}] 模型加载完成，耗时{time.time() - started_at:.1f}秒，待合成{len(items)}条")
+    for item in items:
+        record = _synthesize_item(tts, item, output_dir)
+        record.update({"gender": item["gender"], "voice_label": item["voice_label"], "worker": worker_index})
+        results.put(record)
+
+
+def run_bulk(input_path: str, output_dir: str, workers: int, backend: str,
+             devices: Optional[List[str]] = None, default_gender: Optional[str] = None,
+             default_voice_label: Optional[str] = None) -> Dict[str, Any]:
+    """
+    执行离线批量合成，返回本次运行的汇总
+
+    Args:
+        input_path: 输入JSONL文件
+        output_dir: 输出目录（音频文件和 results.jsonl）
+        workers: 进程数
+        backend: 模型后端（cosyvoice / stub）
+        devices: 各进程轮流使用的GPU编号，None 表示不指定
+        default_gender / default_voice_label: 条目未指定音色时使用的默认值
+    """
+    items = load_items(input_path, default_gender, default_voice_label)
+    os.makedirs(output_dir, exist_ok=True)
+    results_path = os.path.join(output_dir, RESULTS_NAME)
+    finished = {item_id for item_id, record in load_checkpoint(results_path).items()
+                if record.get("status") == "completed"}
+    pending = [item for item in items if item["id"] not in finished]
+    summary: Dict[str, Any] = {"total": len(items), "skipped": len(items) - len(pending),
+                               "completed": 0, "failed": 0, "unfinished": 0}
+    print(f"共{len(items)}条，已完成{summary['skipped']}条，本次合成{len(pending)}条")
+    if not pending:
+        return summary
+
+    shards = shard_by_voice(pending, max(1, min(workers, len(pending))))
+    # spawn: 子进程从干净的解释器启动，各自初始化torch/CUDA
+    context = multiprocessing.get_context("spawn")
+    result_queue = context.Queue()
+    processes = []
+    for index, shard in enumerate(shards):
+        device = devices[index % len(devices)] if devices else None
+        process = context.Process(
+            target=_worker_main,
+            args=(index, shard, os.path.abspath(output_dir), backend, device, result_queue),
+            daemon=True,
+        )
+        process.start()
+        processes.append(process)
+
+    started_at = time.time()
+    received = 0
+    # 结果文件只由主进程追加写入，每条写完立即落盘作为检查点
+    with open(results_path, "a", encoding="utf-8") as results_file:
+        while received < len(pending):
+            try:
+                record = result_queue.get(timeout=1.0)
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    break
+                continue
+            received += 1
+            summary[record["status"]] += 1
+            results_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            results_file.flush()
+            os.fsync(results_file.fileno())
+            detail = f"{record['seconds']}秒" if record["status"] == "completed" else record.get("error")
+            print(f"[{received}/{len(pending)}] {record['id']} {record['status']} {detail}")
+
+    for process in processes:
+        process.join(timeout=5)
+        if process.exitcode not in (0, None):
+            print(f"进程异常退出，退出码: {process.exitcode}")
+    summary["unfinished"] = len(pending) - received
+    summary["seconds"] = round(time.time() - started_at, 3)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线批量语音合成（可断点续跑）")
+    parser.add_argument("input", help="输入JSONL文件，每行一个条目")
+    parser.add_argument("--output-dir", default="bulk_output", help="输出目录，包含音频文件和 results.jsonl")
+    parser.add_argument("--workers", type=int, default=1, help="合成进程数，每个进程各加载一份模型")
+    parser.add_argument("--backend", default=os.environ.get("TTS_MODEL_BACKEND", "cosyvoice"),
+                        help="模型后端: cosyvoice 或 stub")
+    parser.add_argument("--devices", default=None, help="各进程轮流使用的GPU编号，如 0,1")
+    parser.add_argument("--gender", default=None, help="条目未指定时使用的性别")
+    parser.add_argument("--voice-label", default=None, help="条目未指定时使用的声音标签")
+    args = parser.parse_args()
+
+    devices = [d.strip() for d in args.devices.split(",") if d.strip()] if args.devices else None
+    try:
+        summary = run_bulk(args.input, args.output_dir, args.workers, args.backend, devices,
+                           args.gender, args.voice_label)
+    except ValueError as e:
+        print(f"输入文件有误: {e}")
+        sys.exit(2)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    if summary["failed"] or summary["unfinished"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""
+语音合成服务的Python客户端，提供同步（TTSClient）和 asyncio（AsyncTTSClient）两套接口
+
+两者都复用长连接连接池；提交任务后用长轮询等待结果（服务端不支持长轮询时退化为指数退避轮询），
+遇到 429/503 时按 Retry-After 自动重试提交。
+
+用法:
+    with TTSClient("http://localhost:8080") as client:
+        result = client.synthesize("欢迎光临", "女声", "女声1大气磁性")
+        client.download(result["mp3_url"], "welcome.mp3")
+
+    async with AsyncTTSClient("http://localhost:8080") as client:
+        results = await client.synthesize_many(items, concurrency=8)
+"""
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+# 任务的结束状态
+FINAL_STATES = ("completed", "failed", "cancelled")
+# 单次长轮询请求的等待秒数（服务端还会按自己的上限截断）
+LONG_POLL_SECONDS = 20.0
+# 服务端返回太快（不支持长轮询）时的退避轮询间隔
+MIN_POLL_INTERVAL = 0.5
+MAX_POLL_INTERVAL = 5.0
+# 提交被限流或服务未就绪时的最大重试次数
+MAX_SUBMIT_RETRIES = 5
+
+
+class TTSClientError(Exception):
+    """
+    服务返回错误或任务失败
+
+    Args:
+        message: 错误信息
+        status_code: HTTP状态码（任务失败时为None）
+        task_id: 相关任务ID
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None, task_id: Optional[str] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.task_id = task_id
+
+
+def _error_detail(response: httpx.Response) -> str:
+    try:
+        return str(response.json().get("detail", response.text))
+    except ValueError:
+        return response.text
+
+
+def _retry_after(response: httpx.Response, attempt: int) -> Optional[float]:
+    """429/503 时返回重试前应等待的秒数，其他状态或重试次数用完时返回None"""
+    if response.status_code not in (429, 503) or attempt >= MAX_SUBMIT_RETRIES:
+        return None
+    try:
+        delay = float(response.headers.get("retry-after", ""))
+    except ValueError:
+        delay = MIN_POLL_INTERVAL * (2 ** attempt)
+    return delay + random.uniform(0, delay * 0.1)
+
+
+def _next_poll_interval(interval: float) -> float:
+    """指数退避并加入抖动，避免大量客户端同时轮询"""
+    return min(MAX_POLL_INTERVAL, interval * 2) * random.uniform(0.8, 1.0)
+
+
+def _task_result(task_id: str, task: Dict[str, Any]) -> Dict[str, Any]:
+    """从结束的任务状态中取结果，失败时抛出 TTSClientError"""
+    if task["status"] == "failed":
+        raise TTSClientError(f"合成任务失败: {task.get('error')}", task_id=task_id)
+    if task["status"] == "cancelled":
+        raise TTSClientError("合成任务已取消", task_id=task_id)
+    return {**task["result"], "task_id": task_id, "timings": task.get("timings")}
+
+
+def _headers(token: Optional[str]) -> Dict[str, str]:
+    return {"Authorization": f"Bearer {token}"} if token else {}
+
+
+def _synthesize_form(text: str, gender: str, voice_label: str, priority: Optional[str],
+                     mode: Optional[str]) -> Dict[str, str]:
+    data = {"text": text, "gender": gender, "voice_label": voice_label}
+    if priority:
+        data["priority"] = priority
+    if mode:
+        data["mode"] = mode
+    return data
+
+
+class TTSClient:
+    """
+    同步客户端（线程安全，可在多个线程间共享）
+
+    Args:
+        base_url: 服务地址，如 http://localhost:8080
+        token: 用户的JWT（可选，用于按用户限流和公平调度）
+        timeout: 单个HTTP请求的超时（秒），长轮询请求会自动加上等待时间
+        max_connections: 连接池大小
+    """
+
+    def __init__(self, base_url: str, token: Optional[str] = None, timeout: float = 30.0,
+                 max_connections: int = 16):
+        self.timeout = timeout
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._client = httpx.Client(base_url=base_url, headers=_headers(token), timeout=timeout, limits=limits)
+
+    def __enter__(self) -> "TTSClient":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._client.close()
+
+    def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """发送请求，限流或服务未就绪时按 Retry-After 重试，其他错误抛出 TTSClientError"""
+        attempt = 0
+        while True:
+            response = self._client.request(method, url, **kwargs)
+            delay = _retry_after(response, attempt)
+            if delay is None:
+                break
+            time.sleep(delay)
+            attempt += 1
+        if response.status_code >= 400:
+            raise TTSClientError(_error_detail(response), status_code=response.status_code)
+        return response
+
+    def voice_types(self) -> Dict[str, Any]:
+        return self._request("GET", "/voice_types").json()
+
+    def submit(self, text: str, gender: str, voice_label: str, priority: Optional[str] = None,
+               mode: Optional[str] = None) -> str:
+        """提交合成任务，返回任务ID"""
+        data = _synthesize_form(text, gender, voice_label, priority, mode)
+        return self._request("POST", "/synthesize", data=data).json()["task_id"]
+
+    def status(self, task_id: str, wait: float = 0.0) -> Dict[str, Any]:
+        """查询任务状态，wait 大于0时在服务端长轮询等待任务结束"""
+        params = {"wait": wait} if wait > 0 else None
+        return self._request("GET", f"/synthesis_tasks/{task_id}/status", params=params,
+                             timeout=self.timeout + wait).json()
+
+    def cancel(self, task_id: str) -> Dict[str, Any]:
+        """取消任务；执行中的任务返回 cancel_requested，在下一个分段边界停止"""
+        return self._request("DELETE", f"/synthesis_tasks/{task_id}").json()
+
+    def wait(self, task_id: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """等待任务结束并返回结果（wav_url、mp3_url 等），超时抛出 TimeoutError"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        interval = MIN_POLL_INTERVAL
+        while True:
+            remaining = LONG_POLL_SECONDS if deadline is None else deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"等待任务超时: {task_id}")
+            started = time.monotonic()
+            task = self.status(task_id, wait=min(remaining, LONG_POLL_SECONDS))
+            if task["status"] in FINAL_STATES:
+                return _task_result(task_id, task)
+            if time.monotonic() - started < MIN_POLL_INTERVAL:
+                # 服务端没有长轮询，退化为退避轮询
+                time.sleep(interval)
+                interval = _next_poll_interval(interval)
+
+    def synthesize(self, text: str, gender: str, voice_label: str, priority: Optional[str] = None,
+                   timeout: Optional[float] = None) -> Dict[str, Any]:
+        """提交合成任务并等待结果"""
+        return self.wait(self.submit(text, gender, voice_label, priority), timeout)
+
+    def confirm(self, text: str, gender: str, voice_label: str, user_id: Optional[str] = None,
+                session_id: Optional[str] = None, preview_task_id: Optional[str] = None,
+                wait_seconds: float = 30.0, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """确认脚本生成最终音频：服务端在 wait_seconds 内完成时直接返回，否则继续等待任务"""
+        payload = {"text": text, "gender": gender, "voice_label": voice_label, "user_id": user_id,
+                   "session_id": session_id, "preview_task_id": preview_task_id, "wait_seconds": wait_seconds}
+        response = self._request("POST", "/confirm_script", json=payload, timeout=self.timeout + wait_seconds)
+        body = response.json()
+        if response.status_code == 200:
+            return body
+        return self.wait(body["task_id"], timeout)
+
+    def download(self, url: str, path: str, format: Optional[str] = None) -> str:
+        """流式下载结果音频到本地文件，format 可指定转码格式（如 opus_24k）"""
+        params = {"format": format} if format else None
+        with self._client.stream("GET", url, params=params) as response:
+            if response.status_code >= 400:
+                response.read()
+                raise TTSClientError(_error_detail(response), status_code=response.status_code)
+            with open(path, "wb") as f:
+                for chunk in response.iter_bytes():
+                    f.write(chunk)
+        return path
+
+    def synthesize_many(self, items: List[Dict[str, str]], concurrency: int = 4,
+                        priority: Optional[str] = "batch", timeout: Optional[float] = None) -> List[Any]:
+        """
+        并发合成多条文案，最多同时有 concurrency 个任务在途
+
+        Args:
+            items: [{"text", "gender", "voice_label"}]
+            concurrency: 最大在途任务数
+
+        Returns:
+            List: 与 items 一一对应，成功为结果字典，失败为异常对象
+        """
+        def run(item: Dict[str, str]) -> Any:
+            try:
+                return self.synthesize(item["text"], item["gender"], item["voice_label"], priority, timeout)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(run, items))
+
+
+class AsyncTTSClient:
+    """
+    asyncio 客户端，参数与 TTSClient 相同
+    """
+
+    def __init__(self, base_url: str, token: Optional[str] = None, timeout: float = 30.0,
+                 max_connections: int = 16):
+        self.timeout = timeout
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._client = httpx.AsyncClient(base_url=base_url, headers=_headers(token), timeout=timeout, limits=limits)
+
+    async def __aenter__(self) -> "AsyncTTSClient":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        await self._client.aclose()
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        attempt = 0
+        while True:
+            response = await self._client.request(method, url, **kwargs)
+            delay = _retry_after(response, attempt)
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+            attempt += 1
+        if response.status_code >= 400:
+            raise TTSClientError(_error_detail(response), status_code=response.status_code)
+        return response
+
+    async def voice_types(self) -> Dict[str, Any]:
+        return (await self._request("GET", "/voice_types")).json()
+
+    async def submit(self, text: str, gender: str, voice_label: str, priority: Optional[str] = None,
+                     mode: Optional[str] = None) -> str:
+        data = _synthesize_form(text, gender, voice_label, priority, mode)
+        return (await self._request("POST", "/synthesize", data=data)).json()["task_id"]
+
+    async def status(self, task_id: str, wait: float = 0.0) -> Dict[str, Any]:
+        params = {"wait": wait} if wait > 0 else None
+        response = await self._request("GET", f"/synthesis_tasks/{task_id}/status", params=params,
+                                       timeout=self.timeout + wait)
+        return response.json()
+
+    async def cancel(self, task_id: str) -> Dict[str, Any]:
+        return (await self._request("DELETE", f"/synthesis_tasks/{task_id}")).json()
+
+    async def wait(self, task_id: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        interval = MIN_POLL_INTERVAL
+        while True:
+            remaining = LONG_POLL_SECONDS if deadline is None else deadline - loop.time()
+            if remaining <= 0:
+                raise TimeoutError(f"等待任务超时: {task_id}")
+            started = loop.time()
+            task = await self.status(task_id, wait=min(remaining, LONG_POLL_SECONDS))
+            if task["status"] in FINAL_STATES:
+                return _task_result(task_id, task)
+            if loop.time() - started < MIN_POLL_INTERVAL:
+                await asyncio.sleep(interval)
+                interval = _next_poll_interval(interval)
+
+    async def synthesize(self, text: str, gender: str, voice_label: str, priority: Optional[str] = None,
+                         timeout: Optional[float] = None) -> Dict[str, Any]:
+        return await self.wait(await self.submit(text, gender, voice_label, priority), timeout)
+
+    async def confirm(self, text: str, gender: str, voice_label: str, user_id: Optional[str] = None,
+                      session_id: Optional[str] = None, preview_task_id: Optional[str] = None,
+                      wait_seconds: float = 30.0, timeout: Optional[float] = None) -> Dict[str, Any]:
+        payload = {"text": text, "gender": gender, "voice_label": voice_label, "user_id": user_id,
+                   "session_id": session_id, "preview_task_id": preview_task_id, "wait_seconds": wait_seconds}
+        response = await self._request("POST", "/confirm_script", json=payload, timeout=self.timeout + wait_seconds)
+        body = response.json()
+        if response.status_code == 200:
+            return body
+        return await self.wait(body["task_id"], timeout)
+
+    async def download(self, url: str, path: str, format: Optional[str] = None) -> str:
+        params = {"format": format} if format else None
+        async with self._client.stream("GET", url, params=params) as response:
+            if response.status_code >= 400:
+                await response.aread()
+                raise TTSClientError(_error_detail(response), status_code=response.status_code)
+            # 文件写入放到线程中，不阻塞事件循环
+            f = await asyncio.to_thread(open, path, "wb")
+            try:
+                async for chunk in response.aiter_bytes():
+                    await asyncio.to_thread(f.write, chunk)
+            finally:
+                await asyncio.to_thread(f.close)
+        return path
+
+    async def synthesize_many(self, items: List[Dict[str, str]], concurrency: int = 8,
+                              priority: Optional[str] = "batch", timeout: Optional[float] = None) -> List[Any]:
+        """并发合成多条文案，返回值与 TTSClient.synthesize_many 相同"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(item: Dict[str, str]) -> Any:
+            async with semaphore:
+                return await self.synthesize(item["text"], item["gender"], item["voice_label"], priority, timeout)
+
+        return await asyncio.gather(*(run(item) for item in items), return_exceptions=True)
@@ -0,0 +1,120 @@
+import math
+import os
+import sys
+import time
+import zlib
+from typing import Any, Dict, Iterator, Protocol
+
+import torch
+import torchaudio
+
+
+class TTSModel(Protocol):
+    """
+    语音合成模型接口，与 CosyVoice2 的调用方式保持一致
+    """
+
+    sample_rate: int
+
+    def inference_zero_shot(
+        self,
+        tts_text: str,
+        prompt_text: str,
+        prompt_speech_16k: torch.Tensor,
+        zero_shot_spk_id: str = "",
+        stream: bool = False,
+    ) -> Iterator[Dict[str, Any]]:
+        ...
+
+
+def supports_speaker_cache(model: Any) -> bool:
+    """模型是否支持预先提取并缓存音色特征（CosyVoice2 的 add_zero_shot_spk）"""
+    return hasattr(model, "add_zero_shot_spk")
+
+
+class StubTTSModel:
+    """
+    用于压测和本地开发的确定性桩模型，不需要GPU和模型文件
+
+    输出长度与文本长度成正比，推理耗时 = 输出时长 × 实时率（RTF），
+    同样的文本总是得到同样的波形。未使用已注册音色时，每次调用额外耗费
+    prompt_seconds 模拟提示音频的特征提取。
+
+    Args:
+        rtf: 模拟的实时率，0.3 表示合成1秒音频耗时0.3秒
+        seconds_per_char: 每个字符对应的音频时长（秒）
+        sample_rate: 输出采样率
+        prompt_seconds: 每次提取提示特征的耗时（秒）
+        call_seconds: 每次调用的固定开销（秒），模拟提示条件化等与分段长度无关的耗时
+        rtf_per_char: 每个字符使实时率增加的比例，模拟长序列的额外代价（耗时随长度超线性增长）
+    """
+
+    def __init__(self, rtf: float = 0.3, seconds_per_char: float = 0.2, sample_rate: int = 24000,
+                 prompt_seconds: float = 0.0, call_seconds: float = 0.0, rtf_per_char: float = 0.0):
+        self.rtf = rtf
+        self.seconds_per_char = seconds_per_char
+        self.sample_rate = sample_rate
+        self.prompt_seconds = prompt_seconds
+        self.call_seconds = call_seconds
+        self.rtf_per_char = rtf_per_char
+        self.spk2info: Dict[str, str] = {}
+
+    def add_zero_shot_spk(self, prompt_text, prompt_speech_16k, zero_shot_spk_id):
+        time.sleep(self.prompt_seconds)
+        self.spk2info[zero_shot_spk_id] = prompt_text
+        return True
+
+    def inference_zero_shot(self, tts_text, prompt_text, prompt_speech_16k, zero_shot_spk_id="", stream=False):
+        if zero_shot_spk_id not in self.spk2info:
+            time.sleep(self.prompt_seconds)
+        duration = max(0.1, len(tts_text) * self.seconds_per_char)
+        num_samples = int(duration * self.sample_rate)
+        # 由文本决定音高，保证输出可复现
+        freq = 200 + zlib.crc32(tts_text.encode("utf-8")) % 400
+        t = torch.arange(num_samples, dtype=torch.float32) / self.sample_rate
+        speech = (0.1 * torch.sin(2 * math.pi * freq * t)).unsqueeze(0)
+        time.sleep(self.call_seconds + duration * self.rtf * (1 + self.rtf_per_char * len(tts_text)))
+        yield {"tts_speech": speech}
+
+
+def load_wav(wav_path: str, target_sr: int) -> torch.Tensor:
+    """
+    加载音频并转换为单声道、目标采样率（与 cosyvoice.utils.file_utils.load_wav 行为一致）
+    """
+    speech, sample_rate = torchaudio.load(wav_path)
+    speech = speech.mean(dim=0, keepdim=True)
+    if sample_rate != target_sr:
+        speech = torchaudio.transforms.Resample(orig_freq=sample_rate, new_freq=target_sr)(speech)
+    return speech
+
+
+def load_model(backend: str, cosyvoice_path: str) -> TTSModel:
+    """
+    按配置加载语音合成模型
+
+    Args:
+        backend: "cosyvoice" 加载 CosyVoice2-0.5B，"stub" 使用桩模型
+        cosyvoice_path: CosyVoice 源码目录
+
+    Returns:
+        TTSModel: 模型实例
+    """
+    if backend == "stub":
+        return StubTTSModel(
+            rtf=float(os.environ.get("TTS_STUB_RTF", "0.3")),
+            seconds_per_char=float(os.environ.get("TTS_STUB_SECONDS_PER_CHAR", "0.2")),
+            sample_rate=int(os.environ.get("TTS_STUB_SAMPLE_RATE", "24000")),
+            prompt_seconds=float(os.environ.get("TTS_STUB_PROMPT_SECONDS", "0")),
+            call_seconds=float(os.environ.get("TTS_STUB_CALL_SECONDS", "0")),
+            rtf_per_char=float(os.environ.get("TTS_STUB_RTF_PER_CHAR", "0")),
+        )
+    if backend != "cosyvoice":
+        raise ValueError(f"未知的模型后端: {backend}")
+
+    # 只有真正使用CosyVoice时才导入，桩模型无需安装其依赖
+    sys.path.append(cosyvoice_path)
+    sys.path.append(os.path.join(cosyvoice_path, "third_party/Matcha-TTS"))
+    from cosyvoice.cli.cosyvoice import CosyVoice2
+
+    model_path = os.path.join(cosyvoice_path, "pretrained_models/CosyVoice2-0.5B")
+    return CosyVoice2(model_path, load_jit=False, load_trt=False, fp16=False)
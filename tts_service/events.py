@@ -0,0 +1,90 @@
+"""
+任务状态推送：推理线程在任务状态变化、每段完成时发布快照，事件循环中的订阅者（SSE 连接、长轮询）立即收到
+"""
+import asyncio
+import json
+import threading
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set
+
+# 任务的结束状态，订阅者据此判断是否还会有后续事件
+FINAL_STATES = ("completed", "failed", "cancelled")
+
+
+class TaskEvent(NamedTuple):
+    task_id: str
+    kind: str  # status（状态变化）或 progress（分段进度）
+    status: str
+    data: str  # 任务快照的JSON，在发布线程中序列化，保证是一致的快照
+
+
+class Subscription:
+    """一个订阅者：关注一组任务ID，事件放入自己事件循环中的队列"""
+
+    def __init__(self, task_ids: Iterable[str]):
+        self.task_ids: List[str] = list(dict.fromkeys(task_ids))
+        self.loop = asyncio.get_running_loop()
+        self.queue: "asyncio.Queue[TaskEvent]" = asyncio.Queue()
+
+    async def get(self, timeout: float) -> Optional[TaskEvent]:
+        """等待下一个事件，超时返回None"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class TaskEventBus:
+    """
+    按任务ID分发事件的发布/订阅。publish 可在任意线程调用；没有订阅者时只做一次字典查找
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def subscribe(self, task_ids: Iterable[str]) -> Subscription:
+        """在事件循环中调用，返回订阅；用完必须 unsubscribe"""
+        subscription = Subscription(task_ids)
+        with self._lock:
+            for task_id in subscription.task_ids:
+                self._subscribers.setdefault(task_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            for task_id in subscription.task_ids:
+                subscribers = self._subscribers.get(task_id)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[task_id]
+
+    def has_subscribers(self, task_id: str) -> bool:
+        return task_id in self._subscribers
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len({s for subscribers in self._subscribers.values() for s in subscribers})
+
+    def publish(self, task_id: str, kind: str, snapshot: Dict[str, Any]):
+        """发布任务快照"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(task_id, ()))
+        if not subscribers:
+            return
+        status = str(getattr(snapshot.get("status"), "value", snapshot.get("status")))
+        event = TaskEvent(task_id, kind, status, json.dumps(snapshot, ensure_ascii=False, default=str))
+        self.published += 1
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.queue.put_nowait, event)
+            except RuntimeError:
+                # 订阅者的事件循环已关闭
+                pass
+
+
+def format_sse(event: str, data: str) -> str:
+    """编码为一条 server-sent event"""
+    return f"event: {event}\ndata: {data}\n\n"
@@ -0,0 +1,241 @@
+"""
+语音合成服务压测工具
+
+在CPU笔记本上压测时，先用桩模型启动服务（并放宽限流）:
+
+    TTS_MODEL_BACKEND=stub TTS_STUB_RTF=0.3 \\
+    TTS_RATE_LIMIT_IP_PER_MINUTE=100000 TTS_RATE_LIMIT_IP_BURST=10000 python app.py
+
+再运行压测:
+
+    python -m tts_service.loadtest --url http://localhost:8080 --mode mixed --concurrency 16 --requests 200
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from tts_service.events import FINAL_STATES
+from tts_service.monitoring import percentile
+
+# 典型的广告文案，长短不一
+SAMPLE_SCRIPTS = [
+    "好消息，好消息！魔声AI语音合成全面升级了！",
+    "全友家居年货节，家具买一万送8999元，定制衣柜、整体橱柜，沙发，床垫，软床，成品家具，一站式购齐。",
+    "锅圈食汇泉山湖店，双十二活动开始啦，活动一，消费一百二十八元送锅，二十厘米电火锅，二十六厘米煎烤盘，"
+    "露营烧烤炉，三十二厘米不锈钢鸳鸯锅以上四选一。注意，咱们一定要购入一张一点九九的抢锅券。活动二，"
+    "充值五百元享受九五折还能享受送锅。活动日期，十二月二号至十二月十八号，活动不累计参加，不参与银行活动。",
+    "Grand opening this weekend! Everything in store is forty percent off, and the first hundred customers get a free gift.",
+]
+
+
+# 请求类型对应的调度优先级类别
+KIND_CLASSES = {"synthesize": "interactive", "confirm_script": "final"}
+DEFAULT_SLOS = {"interactive": 10.0, "final": 120.0}
+
+
+class LoadResult:
+    """单个请求的结果"""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.ok = False
+        self.status_code: Optional[int] = None
+        self.latency = 0.0
+        self.queue_seconds: Optional[float] = None
+        self.compute_seconds: Optional[float] = None
+        self.error: Optional[str] = None
+
+
+async def _poll_task(client: httpx.AsyncClient, result: LoadResult, status_url: str,
+                     poll_interval: float, start: float) -> LoadResult:
+    """轮询任务状态直到完成，记录延迟和服务端计时"""
+    while True:
+        await asyncio.sleep(poll_interval)
+        task = (await client.get(status_url)).json()
+        if task["status"] in FINAL_STATES:
+            break
+    result.latency = time.perf_counter() - start
+    result.ok = task["status"] == "completed"
+    result.error = task.get("error") or (None if result.ok else task["status"])
+    timings = task.get("timings") or {}
+    result.queue_seconds = timings.get("queue_seconds")
+    result.compute_seconds = timings.get("compute_seconds")
+    return result
+
+
+async def run_synthesize(client: httpx.AsyncClient, text: str, gender: str, voice_label: str,
+                         poll_interval: float) -> LoadResult:
+    """提交 /synthesize 并轮询状态直到完成"""
+    result = LoadResult("synthesize")
+    start = time.perf_counter()
+    resp = await client.post("/synthesize", data={"text": text, "gender": gender, "voice_label": voice_label})
+    result.status_code = resp.status_code
+    if resp.status_code != 202:
+        result.error = resp.text[:200]
+        result.latency = time.perf_counter() - start
+        return result
+    return await _poll_task(client, result, resp.json()["status_url"], poll_interval, start)
+
+
+async def run_confirm(client: httpx.AsyncClient, text: str, gender: str, voice_label: str,
+                      poll_interval: float) -> LoadResult:
+    """提交 /confirm_script 并轮询状态直到最终音频完成"""
+    result = LoadResult("confirm_script")
+    start = time.perf_counter()
+    resp = await client.post("/confirm_script", json={"text": text, "gender": gender, "voice_label": voice_label})
+    result.status_code = resp.status_code
+    if resp.status_code == 200:
+        # 复用了已完成的试听音频，无需轮询
+        result.latency = time.perf_counter() - start
+        result.ok = True
+        timings = resp.json().get("timings") or {}
+        result.queue_seconds = timings.get("queue_seconds")
+        result.compute_seconds = timings.get("compute_seconds")
+        return result
+    if resp.status_code != 202:
+        result.error = resp.text[:200]
+        result.latency = time.perf_counter() - start
+        return result
+    return await _poll_task(client, result, resp.json()["status_url"], poll_interval, start)
+
+
+def summarize(results: List[LoadResult], elapsed: float, slos: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """汇总吞吐量、延迟分布和各优先级类别的SLO达成情况"""
+    slos = slos or {}
+    report: Dict[str, Any] = {"elapsed_seconds": round(elapsed, 3), "by_kind": {}}
+    for kind in sorted({r.kind for r in results}):
+        group = [r for r in results if r.kind == kind]
+        ok = [r for r in group if r.ok]
+        latencies = [r.latency for r in ok]
+        queue = [r.queue_seconds for r in ok if r.queue_seconds is not None]
+        compute = [r.compute_seconds for r in ok if r.compute_seconds is not None]
+        report["by_kind"][kind] = {
+            "requests": len(group),
+            "succeeded": len(ok),
+            "rate_limited": sum(1 for r in group if r.status_code == 429),
+            "failed": len(group) - len(ok),
+            "throughput_per_second": round(len(ok) / elapsed, 3) if elapsed else 0.0,
+            "latency_p50": round(percentile(latencies, 50), 3),
+            "latency_p95": round(percentile(latencies, 95), 3),
+            "latency_p99": round(percentile(latencies, 99), 3),
+            "queue_p50": round(percentile(queue, 50), 3),
+            "queue_p95": round(percentile(queue, 95), 3),
+            "compute_p50": round(percentile(compute, 50), 3),
+            "compute_p95": round(percentile(compute, 95), 3),
+        }
+        priority_class = KIND_CLASSES.get(kind)
+        slo = slos.get(priority_class)
+        if slo is not None:
+            report["by_kind"][kind].update({
+                "priority_class": priority_class,
+                "slo_seconds": slo,
+                "slo_attainment": round(sum(1 for x in latencies if x <= slo) / len(group), 4) if group else 0.0,
+                "slo_met_p95": percentile(latencies, 95) <= slo if latencies else False,
+            })
+    return report
+
+
+async def wait_until_ready(client: httpx.AsyncClient, timeout: float):
+    """等待服务 /ready 返回200"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if (await client.get("/ready")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"服务在{timeout}秒内未就绪")
+        await asyncio.sleep(0.5)
+
+
+async def run_load(args: argparse.Namespace) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        await wait_until_ready(client, args.ready_timeout)
+        voices = (await client.get("/voice_types")).json()["voice_types"]
+        choices = [(gender, label) for gender, labels in voices.items() for label in labels]
+        rng = random.Random(args.seed)
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for i in range(args.requests):
+            kind = args.mode
+            if kind == "mixed":
+                kind = "confirm" if rng.random() < args.confirm_ratio else "synthesize"
+            gender, label = rng.choice(choices)
+            text = rng.choice(SAMPLE_SCRIPTS)
+            if kind == "confirm" and args.final_chars:
+                # 模拟长篇最终成品
+                text = (text * (args.final_chars // len(text) + 1))[:args.final_chars]
+            if not args.duplicate_scripts:
+                # 相同的文案会被服务端合并为一次合成（single-flight）或直接复用试听音频，加编号让每个请求都真正合成
+                text = f"{text} {i + 1}"
+            queue.put_nowait((kind, text, gender, label))
+
+        results: List[LoadResult] = []
+
+        async def worker():
+            while not queue.empty():
+                kind, text, gender, label = queue.get_nowait()
+                try:
+                    if kind == "confirm":
+                        results.append(await run_confirm(client, text, gender, label, args.poll_interval))
+                    else:
+                        results.append(await run_synthesize(client, text, gender, label, args.poll_interval))
+                except httpx.HTTPError as e:
+                    failed = LoadResult(kind)
+                    failed.error = str(e)
+                    results.append(failed)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+
+        report = summarize(results, elapsed, args.slo)
+        # 服务端视角：事件循环延迟和队列情况
+        metrics = (await client.get("/queue_metrics")).json()
+        report["server_event_loop_lag"] = metrics.get("event_loop_lag")
+        report["server_queue_depth"] = metrics.get("queue_depth")
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="魔声AI语音合成服务压测")
+    parser.add_argument("--url", default="http://localhost:8080", help="TTS服务地址")
+    parser.add_argument("--mode", choices=["synthesize", "confirm", "mixed"], default="synthesize")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发客户端数")
+    parser.add_argument("--requests", type=int, default=100, help="总请求数")
+    parser.add_argument("--confirm-ratio", type=float, default=0.2, help="mixed 模式下 confirm_script 的比例")
+    parser.add_argument("--poll-interval", type=float, default=0.2, help="状态轮询间隔（秒）")
+    parser.add_argument("--timeout", type=float, default=600.0, help="单个HTTP请求超时（秒）")
+    parser.add_argument("--ready-timeout", type=float, default=300.0, help="等待服务就绪的最长时间（秒）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子，保证请求序列可复现")
+    parser.add_argument("--final-chars", type=int, default=0,
+                        help="confirm_script 使用的文本长度（0表示随机取样例文案）")
+    parser.add_argument("--duplicate-scripts", action="store_true",
+                        help="不给文案加编号，重复的文案会被服务端合并，用于测量合并的效果")
+    parser.add_argument("--slo", action="append", default=[], metavar="CLASS=SECONDS",
+                        help="优先级类别的延迟SLO，例如 --slo interactive=5 --slo final=60")
+    parser.add_argument("--output", help="把报告写入JSON文件")
+    args = parser.parse_args()
+
+    slos = dict(DEFAULT_SLOS)
+    for item in args.slo:
+        name, _, seconds = item.partition("=")
+        slos[name] = float(seconds)
+    args.slo = slos
+
+    report = asyncio.run(run_load(args))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""
+长文本（有声书级别）合成：每合成完一段立即追加到输出文件，不保留分段文件，也不把整篇音频放进内存，
+内存占用与文本长度无关。可选同时把音频送入 ffmpeg 增量编码为 MP3。
+
+每完成一段就把进度追加到输出文件旁的 .progress.jsonl，进程崩溃或中断后用同样的命令重新运行，
+从最后一个完成的分段继续。
+
+用法:
+    python -m tts_service.longform book.txt --output book.wav --gender 女声 --voice-label 女声1大气磁性
+    TTS_MODEL_BACKEND=stub python -m tts_service.longform book.txt --output book.wav --no-mp3
+"""
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import ffmpeg
+import torch
+
+# 32位浮点 WAV（与 torchaudio.save 保存浮点张量的格式一致）
+_WAVE_FORMAT_IEEE_FLOAT = 3
+_BYTES_PER_SAMPLE = 4
+# RIFF头(12) + fmt块(8+18) + fact块(8+4) + data块头(8)
+_HEADER_BYTES = 58
+# 续传时把已写入的音频重新送入编码器的分块大小
+_COPY_CHUNK_BYTES = 1 << 20
+
+
+class IncrementalWavWriter:
+    """
+    逐段追加写入的 WAV 文件，内存中只有当前写入的一段
+
+    Args:
+        path: 输出文件路径
+        sample_rate: 采样率
+        channels: 声道数
+        resume_frames: 续写已有文件时，保留的帧数（之后的内容会被截掉）；None 表示新建文件
+    """
+
+    def __init__(self, path: str, sample_rate: int, channels: int = 1, resume_frames: Optional[int] = None):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frame_bytes = channels * _BYTES_PER_SAMPLE
+        if resume_frames is None:
+            self.frames = 0
+            self.file = open(path, "w+b")
+            self._write_header()
+        else:
+            self.file = open(path, "r+b")
+            header = self.file.read(_HEADER_BYTES)
+            if len(header) < _HEADER_BYTES or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+                self.file.close()
+                raise ValueError(f"不是可续写的WAV文件: {path}")
+            format_tag, file_channels, file_rate = struct.unpack("<HHI", header[20:28])
+            if (format_tag, file_channels, file_rate) != (_WAVE_FORMAT_IEEE_FLOAT, channels, sample_rate):
+                self.file.close()
+                raise ValueError(f"WAV文件格式与续写参数不一致: {path}")
+            # 截掉最后一个检查点之后写入的不完整分段
+            self.frames = resume_frames
+            self.file.truncate(_HEADER_BYTES + resume_frames * self.frame_bytes)
+            self.file.seek(0, os.SEEK_END)
+
+    def _write_header(self):
+        data_bytes = self.frames * self.frame_bytes
+        self.file.seek(0)
+        self.file.write(b"RIFF" + struct.pack("<I", _HEADER_BYTES - 8 + data_bytes) + b"WAVE")
+        self.file.write(b"fmt " + struct.pack(
+            "<IHHIIHHH", 18, _WAVE_FORMAT_IEEE_FLOAT, self.channels, self.sample_rate,
+            self.sample_rate * self.frame_bytes, self.frame_bytes, _BYTES_PER_SAMPLE * 8, 0,
+        ))
+        self.file.write(b"fact" + struct.pack("<II", 4, self.frames))
+        self.file.write(b"data" + struct.pack("<I", data_bytes))
+        self.file.seek(0, os.SEEK_END)
+
+    def write(self, waveform: torch.Tensor) -> bytes:
+        """追加一段音频（形状为 [声道, 帧]），返回写入的字节（交错存放的32位浮点采样）"""
+        if waveform.shape[0] != self.channels:
+            raise ValueError(f"声道数不一致: {waveform.shape[0]} != {self.channels}")
+        data = waveform.detach().to(torch.float32).cpu().t().contiguous().numpy().tobytes()
+        self.file.write(data)
+        self.frames += waveform.shape[1]
+        return data
+
+    def flush(self):
+        """更新头部的长度字段并落盘，此后文件是完整合法的 WAV"""
+        self._write_header()
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self._write_header()
+        self.file.close()
+
+    def iter_data(self):
+        """按块读出已写入的音频数据（续传时重新送入编码器）"""
+        self.file.flush()
+        with open(self.path, "rb") as f:
+            f.seek(_HEADER_BYTES)
+            remaining = self.frames * self.frame_bytes
+            while remaining > 0:
+                chunk = f.read(min(_COPY_CHUNK_BYTES, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+
+class StreamingMp3Encoder:
+    """
+    ffmpeg 增量编码：音频边合成边送入编码进程，最后一段写完时 MP3 也编码完成
+
+    Args:
+        path: MP3 输出路径，编码完成前写入 path + ".partial"
+        sample_rate / channels: 输入音频参数（32位浮点交错采样）
+        bitrate: MP3 比特率
+    """
+
+    def __init__(self, path: str, sample_rate: int, channels: int = 1, bitrate: str = "256k"):
+        self.path = path
+        self.partial_path = path + ".partial"
+        self.process = (
+            ffmpeg
+            .input("pipe:", format="f32le", ac=channels, ar=sample_rate)
+            .output(self.partial_path, audio_bitrate=bitrate, format="mp3")
+            .global_args("-loglevel", "error", "-nostats")
+            .overwrite_output()
+            .run_async(pipe_stdin=True, pipe_stderr=True)
+        )
+
+    def write(self, data: bytes):
+        self.process.stdin.write(data)
+
+    def close(self):
+        self.process.stdin.close()
+        error = self.process.stderr.read().decode("utf-8", "replace")
+        if self.process.wait() != 0:
+            raise RuntimeError(f"MP3编码失败: {error.strip()}")
+        os.replace(self.partial_path, self.path)
+
+    def abort(self):
+        self.process.kill()
+        self.process.wait()
+        try:
+            os.remove(self.partial_path)
+        except OSError:
+            pass
+
+
+def _text_fingerprint(text: str, gender: str, voice_label: str) -> str:
+    return hashlib.sha256("\0".join((text, gender, voice_label)).encode("utf-8")).hexdigest()
+
+
+def load_progress(progress_path: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+    """
+    读取进度文件：第一行是任务头（文本指纹和分段边界），之后每行是一个完成的分段
+
+    Returns:
+        Optional[Dict]: {"boundaries", "segments_done", "frames"}；文件不存在或文本已变化时返回 None
+    """
+    if not os.path.exists(progress_path):
+        return None
+    progress = None
+    with open(progress_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break  # 崩溃时写了一半的行
+            if progress is None:
+                if record.get("fingerprint") != fingerprint:
+                    return None
+                progress = {"boundaries": record["boundaries"], "segments_done": 0, "frames": 0}
+            else:
+                progress["segments_done"] = record["segment"] + 1
+                progress["frames"] = record["frames"]
+    return progress
+
+
+def _append_progress(f, record: Dict[str, Any]):
+    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def synthesize_longform(tts, text: str, gender: str, voice_label: str, output_path: str,
+                        encode_mp3: bool = True, bitrate: str = "256k",
+                        on_segment: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+    """
+    合成长文本到 output_path（WAV），encode_mp3 时同时生成同名 MP3；已有同一文本的进度时从断点继续
+
+    Args:
+        tts: 已加载模型的服务模块（复用分段、提示缓存和推理代码）
+        on_segment: 每完成一段调用 on_segment(已完成段数, 总段数)
+
+    Returns:
+        Dict: 输出文件、分段数、音频时长、续传起点和耗时
+    """
+    started_at = time.time()
+    stem = output_path[:-4] if output_path.endswith(".wav") else output_path
+    wav_path, mp3_path = f"{stem}.wav", f"{stem}.mp3"
+    partial_path, progress_path = f"{stem}.partial.wav", f"{stem}.progress.jsonl"
+    fingerprint = _text_fingerprint(text, gender, voice_label)
+
+    voice_path, text_path = tts.get_voice_path(gender, voice_label)
+    prompt_speech_16k, prompt_text = tts.PROMPT_CACHE.get(voice_path, text_path)
+    sample_rate = tts.cosyvoice.sample_rate
+
+    progress = load_progress(progress_path, fingerprint) if os.path.exists(partial_path) else None
+    if progress is not None:
+        # 分段边界保存在进度文件里，续传时分段与中断前完全一致
+        boundaries: List[int] = progress["boundaries"]
+        writer = IncrementalWavWriter(partial_path, sample_rate, resume_frames=progress["frames"])
+        progress_file = open(progress_path, "a", encoding="utf-8")
+        start = progress["segments_done"]
+        print(f"从第{start + 1}/{len(boundaries) - 1}段继续（已有{progress['frames'] / sample_rate:.1f}秒音频）")
+    else:
+        segments = tts.split_text_for(text, "batch")
+        boundaries = [0]
+        for segment in segments:
+            boundaries.append(text.index(segment, boundaries[-1]) + len(segment))
+        writer = IncrementalWavWriter(partial_path, sample_rate)
+        writer.flush()
+        progress_file = open(progress_path, "w", encoding="utf-8")
+        _append_progress(progress_file, {"fingerprint": fingerprint, "boundaries": boundaries})
+        start = 0
+    total = len(boundaries) - 1
+
+    encoder = None
+    try:
+        if encode_mp3:
+            encoder = StreamingMp3Encoder(mp3_path, sample_rate, bitrate=bitrate)
+            # 续传时先把已写入的音频重新送入编码器
+            for chunk in writer.iter_data() if start else ():
+                encoder.write(chunk)
+        for i in range(start, total):
+            segment = text[boundaries[i]:boundaries[i + 1]].strip()
+            if segment:
+                speech = tts.synthesize_segment(segment, voice_path, prompt_text, prompt_speech_16k)
+                data = writer.write(speech)
+                del speech
+                if encoder is not None:
+                    encoder.write(data)
+            # 先让音频落盘，再记录进度：崩溃时进度只会落后于文件，续写时截掉多出的部分
+            writer.flush()
+            _append_progress(progress_file, {"segment": i, "frames": writer.frames})
+            if on_segment:
+                on_segment(i + 1, total)
+        writer.close()
+        if encoder is not None:
+            encoder.close()
+            encoder = None
+    except BaseException:
+        if encoder is not None:
+            encoder.abort()
+        writer.file.close()
+        raise
+    finally:
+        progress_file.close()
+
+    os.replace(partial_path, wav_path)
+    os.remove(progress_path)
+    return {
+        "wav": wav_path,
+        "mp3": mp3_path if encode_mp3 else None,
+        "segments": total,
+        "resumed_from_segment": start,
+        "audio_seconds": round(writer.frames / sample_rate, 3),
+        "seconds": round(time.time() - started_at, 3),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="长文本合成（内存占用固定，支持断点续传）")
+    parser.add_argument("input", help="UTF-8 文本文件")
+    parser.add_argument("--output", required=True, help="输出WAV路径，MP3写在同名 .mp3")
+    parser.add_argument("--gender", default="女声")
+    parser.add_argument("--voice-label", default="女声1大气磁性")
+    parser.add_argument("--no-mp3", action="store_true", help="不生成MP3")
+    parser.add_argument("--bitrate", default="256k")
+    parser.add_argument("--backend", default=os.environ.get("TTS_MODEL_BACKEND", "cosyvoice"))
+    args = parser.parse_args(argv)
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        text = f.read().strip()
+    if not text:
+        parser.error("输入文件为空")
+    if os.path.dirname(args.output):
+        os.makedirs(os.path.dirname(args.output), exist_ok=True)
+
+    os.environ["TTS_MODEL_BACKEND"] = args.backend
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    # 复用服务的分段、提示缓存和推理代码；导入时不会加载模型
+    import app as tts
+    from tts_service.engine import load_model
+
+    tts.cosyvoice = load_model(args.backend, tts.COSYVOICE_PATH)
+    last_report = [0.0]
+
+    def report(done: int, total: int):
+        if time.time() - last_report[0] >= 5 or done == total:
+            last_report[0] = time.time()
+            print(f"已完成 {done}/{total} 段")
+
+    summary = synthesize_longform(tts, text, args.gender, args.voice_label, args.output,
+                                  encode_mp3=not args.no_mp3, bitrate=args.bitrate, on_segment=report)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator
+
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# 合成各阶段耗时：提示加载、文本分割、单段推理、拼接、编码（写WAV与转MP3）、排队等待
+STAGE_SECONDS = Histogram(
+    "tts_stage_seconds",
+    "语音合成各阶段耗时（秒）",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+# 实时率 = 推理耗时 / 生成音频时长，小于1表示比实时快
+REAL_TIME_FACTOR = Histogram(
+    "tts_real_time_factor",
+    "单段推理的实时率",
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 3, 5),
+)
+TASKS_TOTAL = Counter(
+    "tts_tasks_total",
+    "按类型和状态统计的合成任务数",
+    ["kind", "state"],
+)
+# 任务被取消后不再合成的分段数
+CANCELLED_SEGMENTS = Counter(
+    "tts_cancelled_segments",
+    "因任务取消而省下的合成分段数",
+    ["kind"],
+)
+EVENT_STREAMS = Gauge(
+    "tts_event_streams",
+    "当前打开的任务状态推送连接数",
+)
+
+
+class StageTimer:
+    """
+    记录一个任务的分阶段耗时：同时写入 Prometheus 直方图和任务自己的 timings["stages"]（同名阶段累加）
+
+    Args:
+        timings: 任务的计时字典
+    """
+
+    def __init__(self, timings: Dict[str, Any]):
+        self.timings = timings
+        self.stages: Dict[str, float] = timings.setdefault("stages", {})
+        self.inference_seconds = 0.0
+        self.audio_seconds = 0.0
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name: str, seconds: float):
+        STAGE_SECONDS.labels(name).observe(seconds)
+        self.stages[name] = round(self.stages.get(name, 0.0) + seconds, 3)
+
+    def record_inference(self, seconds: float, audio_seconds: float):
+        """记录一段推理的耗时和生成的音频时长，更新任务整体实时率"""
+        self.record("segment_inference", seconds)
+        if audio_seconds <= 0:
+            return
+        REAL_TIME_FACTOR.observe(seconds / audio_seconds)
+        self.inference_seconds += seconds
+        self.audio_seconds += audio_seconds
+        self.timings["real_time_factor"] = round(self.inference_seconds / self.audio_seconds, 3)
+
+
+class ServiceCollector:
+    """
+    抓取时才读取的指标：缓存命中/未命中计数和队列深度、执行中任务数
+
+    Args:
+        cache_stats: 缓存名 -> 返回 {"hits": n, "misses": n} 的函数
+        queue_depths: 返回 {优先级类别: 排队任务数} 的函数
+        in_flight: 返回执行中任务数的函数
+    """
+
+    def __init__(
+        self,
+        cache_stats: Dict[str, Callable[[], Dict[str, int]]],
+        queue_depths: Callable[[], Dict[str, int]],
+        in_flight: Callable[[], int],
+    ):
+        self.cache_stats = cache_stats
+        self.queue_depths = queue_depths
+        self.in_flight = in_flight
+
+    def describe(self):
+        # 注册时只描述指标名，不读取数据（注册时各缓存可能还没创建）
+        yield CounterMetricFamily("tts_cache_hits", "缓存命中次数", labels=["cache"])
+        yield CounterMetricFamily("tts_cache_misses", "缓存未命中次数", labels=["cache"])
+        yield GaugeMetricFamily("tts_queue_depth", "按优先级类别统计的排队任务数", labels=["priority"])
+        yield GaugeMetricFamily("tts_in_flight_jobs", "正在执行的合成任务数", labels=[])
+
+    def collect(self):
+        hits = CounterMetricFamily("tts_cache_hits", "缓存命中次数", labels=["cache"])
+        misses = CounterMetricFamily("tts_cache_misses", "缓存未命中次数", labels=["cache"])
+        for name, stats in self.cache_stats.items():
+            values = stats()
+            hits.add_metric([name], values.get("hits", 0))
+            misses.add_metric([name], values.get("misses", 0))
+        yield hits
+        yield misses
+
+        depth = GaugeMetricFamily("tts_queue_depth", "按优先级类别统计的排队任务数", labels=["priority"])
+        for priority, count in self.queue_depths().items():
+            depth.add_metric([priority], count)
+        yield depth
+        yield GaugeMetricFamily("tts_in_flight_jobs", "正在执行的合成任务数", value=self.in_flight())
+
@@ -0,0 +1,66 @@
+import asyncio
+from collections import deque
+from typing import Deque, Dict, Optional, Sequence
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """
+    计算百分位数（线性插值）
+
+    Args:
+        values: 样本
+        q: 百分位，0-100
+
+    Returns:
+        float: 百分位数，样本为空时返回0
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q / 100.0
+    lower = int(pos)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (pos - lower)
+
+
+class EventLoopLagMonitor:
+    """
+    周期性测量事件循环延迟：sleep(interval) 实际多睡的时间就是事件循环被阻塞的时间
+
+    Args:
+        interval: 采样间隔（秒）
+        window: 保留的最近样本数
+    """
+
+    def __init__(self, interval: float = 0.1, window: int = 600):
+        self.interval = interval
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._max = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self._samples.append(lag)
+            self._max = max(self._max, lag)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def snapshot(self) -> Dict[str, float]:
+        samples = list(self._samples)
+        return {
+            "p50_ms": round(percentile(samples, 50) * 1000, 2),
+            "p99_ms": round(percentile(samples, 99) * 1000, 2),
+            "max_ms": round(self._max * 1000, 2),
+            "samples": len(samples),
+        }
@@ -0,0 +1,294 @@
+"""
+按需采样分析器：在运行中的服务上临时开启，按固定间隔采集所有线程的调用栈，
+输出 collapsed-stack（flamegraph.pl / speedscope 均可读取）或 speedscope JSON。
+
+只用 sys._current_frames 读取调用栈，不插桩、不影响被采样线程的执行，开销与采样频率成正比。
+"""
+import asyncio
+import hmac
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Request, Response
+
+# 单次分析的时长上限和采样间隔下限，避免在线上副本上误操作
+MAX_PROFILE_SECONDS = 120.0
+MIN_INTERVAL_SECONDS = 0.005
+MAX_STACK_DEPTH = 64
+MAX_TORCH_SEGMENTS = 5
+
+
+# 代码对象 -> 帧标签；采样线程持有GIL时被采样的服务线程都在等待，每帧只在第一次见到时拼接标签
+_FRAME_LABELS: Dict[Any, str] = {}
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    label = _FRAME_LABELS.get(code)
+    if label is None:
+        filename = code.co_filename
+        for prefix in sys.path:
+            if prefix and filename.startswith(prefix):
+                filename = os.path.relpath(filename, prefix)
+                break
+        label = _FRAME_LABELS[code] = f"{code.co_name} ({filename}:{code.co_firstlineno})"
+    return label
+
+
+class SamplingProfiler:
+    """
+    后台线程定时采集所有线程的调用栈并按 (线程名, 调用栈) 计数
+
+    Args:
+        interval: 采样间隔（秒）
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = max(interval, MIN_INTERVAL_SECONDS)
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.started_at is not None:
+            self.duration = time.monotonic() - self.started_at
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack: List[str] = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.reverse()
+                self.counts[(names.get(ident, str(ident)),) + tuple(stack)] += 1
+            self.samples += 1
+
+    def to_collapsed(self) -> str:
+        """collapsed-stack 格式：每行 "线程;外层函数;...;内层函数 次数" """
+        lines = [";".join(key) + f" {count}" for key, count in self.counts.most_common()]
+        return "\n".join(lines) + "\n"
+
+    def to_speedscope(self, name: str = "profile") -> Dict:
+        """speedscope 的 sampled 格式，每个线程一个 profile，权重单位为秒"""
+        frames: List[Dict[str, str]] = []
+        frame_index: Dict[str, int] = {}
+        by_thread: Dict[str, List[Tuple[List[int], int]]] = {}
+        for key, count in self.counts.items():
+            thread, stack = key[0], key[1:]
+            indexes = []
+            for label in stack:
+                if label not in frame_index:
+                    frame_index[label] = len(frames)
+                    frames.append({"name": label})
+                indexes.append(frame_index[label])
+            by_thread.setdefault(thread, []).append((indexes, count))
+
+        profiles = []
+        for thread, stacks in sorted(by_thread.items()):
+            weights = [count * self.interval for _, count in stacks]
+            profiles.append({
+                "type": "sampled",
+                "name": thread,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": [indexes for indexes, _ in stacks],
+                "weights": weights,
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+
+class ProfileSession:
+    """
+    一次分析会话：持续指定秒数，或者在指定数量的匹配路由请求完成后结束（以先到者为准）
+
+    Args:
+        seconds: 最长持续时间
+        interval: 采样间隔
+        route: 只统计路径以此开头的请求（为空时按时长结束）
+        requests: 匹配请求完成多少个后结束
+        torch_segments: 额外用 PyTorch profiler 记录的推理分段数
+    """
+
+    def __init__(self, seconds: float, interval: float, route: Optional[str] = None,
+                 requests: Optional[int] = None, torch_segments: int = 0):
+        self.seconds = min(seconds, MAX_PROFILE_SECONDS)
+        self.route = route
+        self.remaining_requests = requests if route else None
+        self.torch_segments = min(torch_segments, MAX_TORCH_SEGMENTS)
+        self.torch_traces: List[Tuple[str, bytes]] = []
+        self.profiler = SamplingProfiler(interval)
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+
+    def request_finished(self, path: str):
+        if self.remaining_requests is None or not path.startswith(self.route):
+            return
+        with self._lock:
+            self.remaining_requests -= 1
+            if self.remaining_requests <= 0:
+                self.done.set()
+
+    def take_torch_slot(self) -> bool:
+        with self._lock:
+            if self.done.is_set() or self.torch_segments <= 0:
+                return False
+            self.torch_segments -= 1
+            return True
+
+
+class ProfilerController:
+    """全局只允许一个分析会话，供接口、中间件和推理代码共用"""
+
+    def __init__(self):
+        self.session: Optional[ProfileSession] = None
+        self._lock = threading.Lock()
+
+    def run(self, session: ProfileSession) -> ProfileSession:
+        """执行一个分析会话，阻塞直到结束；已有会话在运行时抛出 RuntimeError"""
+        with self._lock:
+            if self.session is not None:
+                raise RuntimeError("已有分析会话在运行")
+            self.session = session
+        try:
+            session.profiler.start()
+            session.done.wait(session.seconds)
+            session.done.set()
+        finally:
+            session.profiler.stop()
+            with self._lock:
+                self.session = None
+        return session
+
+    def request_finished(self, path: str):
+        session = self.session
+        if session is not None:
+            session.request_finished(path)
+
+    @contextmanager
+    def torch_segment(self, label: str) -> Iterator[None]:
+        """包住一段推理；会话要求记录 PyTorch 轨迹时用 torch.profiler 记录这一段"""
+        session = self.session
+        if session is None or not session.take_torch_slot():
+            yield
+            return
+        import torch.profiler
+
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        with torch.profiler.profile(activities=activities, record_shapes=True) as prof:
+            yield
+        fd, trace_path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        try:
+            prof.export_chrome_trace(trace_path)
+            with open(trace_path, "rb") as f:
+                session.torch_traces.append((label, f.read()))
+        finally:
+            os.remove(trace_path)
+
+
+PROFILER = ProfilerController()
+
+
+def require_admin_token(request: Request, token_env: str):
+    """校验请求头 X-Admin-Token 与环境变量 token_env 配置的令牌一致；未配置令牌时接口不可用（404）"""
+    expected = os.environ.get(token_env)
+    if not expected:
+        raise HTTPException(status_code=404, detail="管理接口未启用")
+    if not hmac.compare_digest(request.headers.get("x-admin-token", ""), expected):
+        raise HTTPException(status_code=403, detail="无权访问管理接口")
+
+
+def create_profiler_router(token_env: str) -> APIRouter:
+    """
+    创建分析接口 POST /admin/profile，需要在请求头 X-Admin-Token 中携带环境变量 token_env 配置的令牌；
+    未配置令牌时接口不可用
+    """
+    router = APIRouter()
+
+    @router.post("/admin/profile")
+    async def run_profile(
+        request: Request,
+        seconds: float = 10.0,
+        interval_ms: float = 10.0,
+        route: Optional[str] = None,
+        requests: Optional[int] = None,
+        format: str = "speedscope",
+        torch_segments: int = 0,
+    ):
+        """
+        开启采样分析并在结束后返回结果文件
+
+        参数:
+        - seconds: 最长分析时间（秒，最多120）
+        - interval_ms: 采样间隔（毫秒，最小5）
+        - route / requests: 在路径以 route 开头的请求完成 requests 个后提前结束
+        - format: collapsed（collapsed-stack 文本）或 speedscope（JSON）
+        - torch_segments: 额外用 PyTorch profiler 记录的推理分段数，结果与采样文件一起打包为zip
+        """
+        require_admin_token(request, token_env)
+        if format not in ("collapsed", "speedscope"):
+            raise HTTPException(status_code=400, detail=f"不支持的输出格式: {format}")
+        if seconds <= 0 or (route and (not requests or requests < 1)):
+            raise HTTPException(status_code=400, detail="seconds 必须大于0，指定 route 时 requests 必须大于0")
+
+        session = ProfileSession(seconds, interval_ms / 1000.0, route, requests, torch_segments)
+        try:
+            await asyncio.to_thread(PROFILER.run, session)
+        except RuntimeError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+
+        profiler = session.profiler
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        if format == "collapsed":
+            content, filename, media_type = profiler.to_collapsed().encode("utf-8"), f"profile-{stamp}.txt", "text/plain"
+        else:
+            content = json.dumps(profiler.to_speedscope(f"profile-{stamp}")).encode("utf-8")
+            filename, media_type = f"profile-{stamp}.speedscope.json", "application/json"
+        headers = {
+            "X-Profile-Samples": str(profiler.samples),
+            "X-Profile-Seconds": f"{profiler.duration:.3f}",
+        }
+        if session.torch_traces:
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+                archive.writestr(filename, content)
+                for i, (label, trace) in enumerate(session.torch_traces):
+                    archive.writestr(f"torch-{i}-{label}.json", trace)
+            content, filename, media_type = buffer.getvalue(), f"profile-{stamp}.zip", "application/zip"
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return Response(content=content, media_type=media_type, headers=headers)
+
+    return router
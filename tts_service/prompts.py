@@ -0,0 +1,51 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Tuple
+
+
+class PromptCache:
+    """
+    音色提示（提示音频 + 提示文本）的LRU缓存，避免每个任务都重新读取和重采样提示音频
+
+    Args:
+        loader: 加载函数，参数为 (音频路径, 文本路径)，返回 (提示音频, 提示文本)
+        max_entries: 最多缓存的音色数
+    """
+
+    def __init__(self, loader: Callable[[str, str], Tuple[Any, str]], max_entries: int = 64):
+        self.loader = loader
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Any, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, voice_path: str, text_path: str) -> Tuple[Any, str]:
+        with self._lock:
+            entry = self._entries.get(voice_path)
+            if entry is not None:
+                self._entries.move_to_end(voice_path)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        # 在锁外加载，避免阻塞其他音色的命中
+        entry = self.loader(voice_path, text_path)
+        with self._lock:
+            self._entries[voice_path] = entry
+            self._entries.move_to_end(voice_path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def __contains__(self, voice_path: str) -> bool:
+        with self._lock:
+            return voice_path in self._entries
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "capacity": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,85 @@
+import threading
+import time
+from typing import Dict, Optional
+
+
+class TokenBucket:
+    """
+    令牌桶：以固定速率补充令牌，最多积累 capacity 个
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def wait_time(self, cost: float = 1.0, now: Optional[float] = None) -> float:
+        """返回获得 cost 个令牌还需等待的秒数（0表示可以立即获得）"""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def consume(self, cost: float = 1.0):
+        self.tokens -= cost
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class RateLimiter:
+    """
+    按键（用户ID或IP）区分的令牌桶限流器
+
+    Args:
+        rate: 每秒补充的令牌数
+        burst: 桶容量，即允许的突发请求数
+        max_keys: 最多保留的桶数量，超过后清理已经回满的空闲桶
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+        # 只记录被拒绝的总次数：按键计数会随客户端轮换IP无限增长，也会暴露具体的IP和用户
+        self.rejected = 0
+
+    def _bucket(self, key: str) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._prune()
+            bucket = TokenBucket(self.rate, self.burst)
+            self._buckets[key] = bucket
+        return bucket
+
+    def _prune(self):
+        now = time.monotonic()
+        for key in [k for k, b in self._buckets.items() if b.is_full(now)]:
+            del self._buckets[key]
+
+    def check(self, key: str, cost: float = 1.0) -> float:
+        """返回该键需要等待的秒数，不消耗令牌"""
+        with self._lock:
+            return self._bucket(key).wait_time(cost)
+
+    def consume(self, key: str, cost: float = 1.0):
+        with self._lock:
+            self._bucket(key).consume(cost)
+
+    def record_rejection(self):
+        with self._lock:
+            self.rejected += 1
@@ -0,0 +1,158 @@
+import os
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+
+class AudioFormat(NamedTuple):
+    """一种可下载的音频格式（编码 + 码率 + 封装）"""
+    extension: str
+    media_type: str
+    container: str
+    codec: Optional[str] = None
+    bitrate: Optional[str] = None
+    sample_rate: Optional[int] = None
+
+
+# 可按需转码的格式，wav 为原始文件不转码
+AUDIO_FORMATS: Dict[str, AudioFormat] = {
+    "wav": AudioFormat("wav", "audio/wav", "wav"),
+    "mp3_64k": AudioFormat("mp3", "audio/mpeg", "mp3", "libmp3lame", "64k"),
+    "mp3_128k": AudioFormat("mp3", "audio/mpeg", "mp3", "libmp3lame", "128k"),
+    "mp3_256k": AudioFormat("mp3", "audio/mpeg", "mp3", "libmp3lame", "256k"),
+    "aac_64k": AudioFormat("m4a", "audio/mp4", "ipod", "aac", "64k"),
+    "aac_128k": AudioFormat("m4a", "audio/mp4", "ipod", "aac", "128k"),
+    # Opus 只支持 48k 等固定采样率
+    "opus_24k": AudioFormat("opus", "audio/ogg", "ogg", "libopus", "24k", 48000),
+    "opus_48k": AudioFormat("opus", "audio/ogg", "ogg", "libopus", "48k", 48000),
+}
+
+# format=auto 时按 Accept 头协商，同等权重下按此顺序优先（体积从小到大）
+NEGOTIATION_ORDER: List[Tuple[str, Tuple[str, ...]]] = [
+    ("opus_48k", ("audio/ogg", "audio/opus")),
+    ("aac_128k", ("audio/mp4", "audio/aac", "audio/x-m4a")),
+    ("mp3_128k", ("audio/mpeg", "audio/mp3")),
+    ("wav", ("audio/wav", "audio/x-wav", "audio/wave")),
+]
+# 只接受通配类型时使用兼容性最好的格式
+DEFAULT_NEGOTIATED_FORMAT = "mp3_128k"
+
+
+def negotiate_format(accept: str) -> str:
+    """
+    根据 Accept 头选择音频格式
+
+    Args:
+        accept: 请求的 Accept 头
+
+    Returns:
+        str: AUDIO_FORMATS 中的格式名
+    """
+    weights: Dict[str, float] = {}
+    for part in accept.split(","):
+        fields = [f.strip() for f in part.split(";")]
+        media_type = fields[0].lower()
+        if not media_type:
+            continue
+        q = 1.0
+        for param in fields[1:]:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        weights[media_type] = max(q, weights.get(media_type, 0.0))
+
+    best_name, best_q = None, 0.0
+    for name, media_types in NEGOTIATION_ORDER:
+        q = max((weights.get(t, 0.0) for t in media_types), default=0.0)
+        if q > best_q:
+            best_name, best_q = name, q
+    if best_name:
+        return best_name
+    return DEFAULT_NEGOTIATED_FORMAT
+
+
+def parse_byte_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单个区间的 Range 头（bytes=a-b、bytes=a-、bytes=-n）
+
+    Args:
+        header: 请求的 Range 头
+        size: 文件大小
+
+    Returns:
+        Optional[Tuple[int, int]]: 闭区间 (起始, 结束)；没有 Range、格式错误或请求多个区间时返回 None，按整个文件返回
+
+    Raises:
+        ValueError: 区间超出文件范围，应返回 416
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = (part.strip() for part in spec.partition("-"))
+    if not sep or not (first or last) or not all(part.isdigit() for part in (first, last) if part):
+        return None
+    if not first:
+        # 后缀区间：最后 n 个字节
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError("区间超出文件范围")
+        return max(0, size - length), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError("区间超出文件范围")
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+class RenditionCache:
+    """
+    音频格式转换缓存：每种格式只转码一次，结果保存在原文件旁边（<原文件名>.<格式名>.<扩展名>）
+
+    Args:
+        transcode: 转码函数，参数为 (源文件路径, 目标文件路径, 格式)
+    """
+
+    def __init__(self, transcode: Callable[[str, str, AudioFormat], None]):
+        self.transcode = transcode
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+        self.hits = 0
+        self.transcodes = 0
+
+    @staticmethod
+    def path_for(source_path: str, format_name: str) -> str:
+        stem = os.path.splitext(source_path)[0]
+        return f"{stem}.{format_name}.{AUDIO_FORMATS[format_name].extension}"
+
+    def get(self, source_path: str, format_name: str) -> str:
+        """返回指定格式的文件路径，不存在时转码生成；同一文件的并发请求只转码一次"""
+        target = self.path_for(source_path, format_name)
+        if os.path.exists(target):
+            self.hits += 1
+            return target
+        with self._guard:
+            lock = self._locks.setdefault(target, threading.Lock())
+        try:
+            with lock:
+                if os.path.exists(target):
+                    self.hits += 1
+                    return target
+                # 先写临时文件再改名，避免其他请求读到写了一半的文件
+                temp_path = f"{os.path.splitext(target)[0]}.tmp.{AUDIO_FORMATS[format_name].extension}"
+                try:
+                    self.transcode(source_path, temp_path, AUDIO_FORMATS[format_name])
+                    os.replace(temp_path, target)
+                finally:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+                self.transcodes += 1
+            return target
+        finally:
+            # 转码失败时也要移除，否则每个失败的目标文件都会留下一个锁
+            with self._guard:
+                self._locks.pop(target, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "transcodes": self.transcodes}
@@ -0,0 +1,506 @@
+"""
+多个TTS副本前的音色亲和路由
+
+同一音色的请求尽量落在同一个副本上，让该副本的提示缓存保持命中：
+
+    python -m tts_service.router --port 8090 \\
+        --replica http://10.0.0.1:8080 --replica http://10.0.0.2:8080
+
+副本需要设置 TTS_TRUST_FORWARDED_FOR=1，以便按真实客户端IP限流。路由只向副本传递一个客户端地址：
+对端本身，或对端是 --trusted-proxy 时由它传来的地址。增删副本的管理接口需要 TTS_ROUTER_ADMIN_TOKEN。
+"""
+import argparse
+import asyncio
+import bisect
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+
+from tts_service.profiler import require_admin_token
+
+# 转发时不能原样透传的逐跳头
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade", "host", "content-length",
+}
+# 下载音频时转发给副本的请求头：区间请求、条件请求和按 Accept 协商格式
+FILE_REQUEST_HEADERS = ("range", "if-range", "if-none-match", "if-modified-since", "accept")
+
+
+def client_address(request: Request, trusted_proxies: Set[str]) -> str:
+    """
+    请求的真实客户端地址
+
+    对端不是可信代理时就是对端地址；是可信代理（如后端网关）时从右往左跳过 X-Forwarded-For 中的可信代理，
+    第一个不可信的地址即客户端。客户端自己写在最左边的值永远不会被采用
+    """
+    peer = request.client.host if request.client else ""
+    if peer not in trusted_proxies:
+        return peer
+    hops = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if hop not in trusted_proxies:
+            return hop
+    return peer
+
+
+def _hash(key: str) -> int:
+    return int(hashlib.md5(key.encode("utf-8")).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """
+    一致性哈希环，每个节点放置 vnodes 个虚拟节点；节点加入或离开时只有约 1/N 的键需要迁移
+    """
+
+    def __init__(self, nodes: Optional[List[str]] = None, vnodes: int = 100):
+        self.vnodes = vnodes
+        self._ring: List[int] = []
+        self._owners: Dict[int, str] = {}
+        for node in nodes or []:
+            self.add(node)
+
+    def add(self, node: str):
+        for i in range(self.vnodes):
+            point = _hash(f"{node}#{i}")
+            if point not in self._owners:
+                bisect.insort(self._ring, point)
+                self._owners[point] = node
+
+    def remove(self, node: str):
+        points = [p for p, owner in self._owners.items() if owner == node]
+        for point in points:
+            del self._owners[point]
+            self._ring.pop(bisect.bisect_left(self._ring, point))
+
+    def preference(self, key: str) -> Iterator[str]:
+        """按哈希环顺序依次给出不同的节点，第一个为首选节点"""
+        if not self._ring:
+            return
+        start = bisect.bisect(self._ring, _hash(key))
+        seen = set()
+        for i in range(len(self._ring)):
+            node = self._owners[self._ring[(start + i) % len(self._ring)]]
+            if node not in seen:
+                seen.add(node)
+                yield node
+
+
+class Replica:
+    """一个TTS副本的状态"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.healthy = False
+        self.ready = False
+        self.queue_depth = 0
+        # 上次探测之后本路由新派发的任务数，用于在两次探测之间估计负载
+        self.dispatched_since_probe = 0
+        self.prompt_cache: Dict[str, int] = {}
+        self.routed = 0
+        self.affinity_routed = 0
+        self.spilled_in = 0
+        self.last_probe: Optional[float] = None
+
+    @property
+    def load(self) -> int:
+        return self.queue_depth + self.dispatched_since_probe
+
+    def snapshot(self) -> Dict[str, Any]:
+        hits = self.prompt_cache.get("hits", 0)
+        misses = self.prompt_cache.get("misses", 0)
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "ready": self.ready,
+            "queue_depth": self.queue_depth,
+            "estimated_load": self.load,
+            "routed": self.routed,
+            "affinity_routed": self.affinity_routed,
+            "spilled_in": self.spilled_in,
+            "prompt_cache": self.prompt_cache,
+            "prompt_cache_hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+        }
+
+
+class ReplicaPool:
+    """
+    副本池：健康的副本组成一致性哈希环，按 (性别, 音色) 选择副本
+
+    Args:
+        urls: 副本地址
+        max_queue: 副本排队任务数达到该值视为饱和，溢出到负载最低的副本
+        vnodes: 每个副本的虚拟节点数
+    """
+
+    def __init__(self, urls: List[str], max_queue: int = 8, vnodes: int = 100):
+        self.max_queue = max_queue
+        self.replicas: Dict[str, Replica] = {}
+        self.ring = HashRing(vnodes=vnodes)
+        for url in urls:
+            self.add(url)
+
+    def add(self, url: str) -> Replica:
+        replica = self.replicas.get(url.rstrip("/"))
+        if replica is None:
+            replica = Replica(url)
+            self.replicas[replica.url] = replica
+        return replica
+
+    def remove(self, url: str):
+        replica = self.replicas.pop(url.rstrip("/"), None)
+        if replica is not None and replica.ready:
+            self.ring.remove(replica.url)
+
+    def set_ready(self, replica: Replica, ready: bool):
+        """副本就绪状态变化时加入或移出哈希环（即重新平衡）"""
+        if ready and not replica.ready:
+            self.ring.add(replica.url)
+        elif not ready and replica.ready:
+            self.ring.remove(replica.url)
+        replica.ready = ready
+
+    def choose(self, gender: str, voice_label: str) -> Replica:
+        """首选哈希环上的副本；首选副本饱和时改用负载最低的就绪副本"""
+        candidates = [self.replicas[url] for url in self.ring.preference(f"{gender}/{voice_label}")]
+        if not candidates:
+            raise HTTPException(status_code=503, detail="没有可用的TTS副本", headers={"Retry-After": "5"})
+        preferred = candidates[0]
+        if preferred.load < self.max_queue:
+            replica = preferred
+            replica.affinity_routed += 1
+        else:
+            replica = min(candidates, key=lambda r: r.load)
+            if replica is preferred:
+                replica.affinity_routed += 1
+            else:
+                replica.spilled_in += 1
+        replica.routed += 1
+        replica.dispatched_since_probe += 1
+        return replica
+
+    def any_ready(self) -> Replica:
+        ready = [r for r in self.replicas.values() if r.ready] or [r for r in self.replicas.values() if r.healthy]
+        if not ready:
+            raise HTTPException(status_code=503, detail="没有可用的TTS副本", headers={"Retry-After": "5"})
+        return min(ready, key=lambda r: r.load)
+
+
+class BoundedMap(OrderedDict):
+    """只保留最近 max_size 项的映射，用于记住任务和文件所在的副本"""
+
+    def __init__(self, max_size: int = 100000):
+        super().__init__()
+        self.max_size = max_size
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.max_size:
+            self.popitem(last=False)
+
+
+def create_router_app(replica_urls: List[str], max_queue: int = 8, probe_interval: float = 1.0,
+                      trusted_proxies: Optional[Set[str]] = None) -> FastAPI:
+    """创建路由服务，trusted_proxies 为可以代为传递客户端地址的上游代理地址"""
+    trusted_proxies = trusted_proxies or set()
+    pool = ReplicaPool(replica_urls, max_queue=max_queue)
+    task_routes = BoundedMap()
+    file_routes = BoundedMap()
+    client = httpx.AsyncClient(
+        timeout=httpx.Timeout(600.0, connect=3.0),
+        limits=httpx.Limits(max_connections=200, max_keepalive_connections=50),
+    )
+
+    async def probe(replica: Replica):
+        """探测副本的就绪状态、队列深度和提示缓存命中率"""
+        try:
+            ready_resp = await client.get(f"{replica.url}/ready", timeout=2.0)
+            ready_data = ready_resp.json()
+            metrics = (await client.get(f"{replica.url}/queue_metrics", timeout=2.0)).json()
+            replica.healthy = True
+            replica.queue_depth = int(metrics.get("queue_depth", 0))
+            replica.prompt_cache = (ready_data.get("warm_cache") or {}).get("prompt_cache", {})
+            pool.set_ready(replica, ready_resp.status_code == 200)
+        except (httpx.HTTPError, ValueError):
+            replica.healthy = False
+            pool.set_ready(replica, False)
+        replica.dispatched_since_probe = 0
+        replica.last_probe = time.time()
+
+    async def probe_loop():
+        while True:
+            await asyncio.gather(*(probe(r) for r in list(pool.replicas.values())))
+            await asyncio.sleep(probe_interval)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        prober = asyncio.create_task(probe_loop())
+        yield
+        prober.cancel()
+        await client.aclose()
+
+    app = FastAPI(title="魔声AI语音合成路由", lifespan=lifespan)
+
+    def remember_files(replica: Replica, payload: Any):
+        """记录结果文件所在的副本，后续下载请求直接转发过去"""
+        if isinstance(payload, dict):
+            for key, value in payload.items():
+                if key.endswith("_url") and isinstance(value, str) and value.startswith("/"):
+                    file_routes[value.split("?")[0]] = replica
+                elif isinstance(value, (dict, list)):
+                    remember_files(replica, value)
+        elif isinstance(payload, list):
+            for item in payload:
+                remember_files(replica, item)
+
+    async def forward(replica: Replica, request: Request, body: bytes) -> httpx.Response:
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+        # 副本按 X-Forwarded-For 限流，只传一个解析出的客户端地址，不沿用客户端自带的值（可伪造）
+        headers["x-forwarded-for"] = client_address(request, trusted_proxies)
+        url = f"{replica.url}{request.url.path}"
+        if request.url.query:
+            url += f"?{request.url.query}"
+        try:
+            return await client.request(request.method, url, content=body, headers=headers)
+        except httpx.TransportError as e:
+            replica.healthy = False
+            pool.set_ready(replica, False)
+            raise HTTPException(status_code=502, detail=f"TTS副本不可用: {str(e)}")
+
+    def to_response(resp: httpx.Response) -> Response:
+        headers = {k: v for k, v in resp.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+        return Response(content=resp.content, status_code=resp.status_code, headers=headers)
+
+    async def voice_of(request: Request, body: bytes) -> tuple:
+        """从JSON或表单请求体中取出 (性别, 音色)"""
+        if "application/json" in request.headers.get("content-type", ""):
+            try:
+                data = json.loads(body or b"{}")
+            except ValueError:
+                raise HTTPException(status_code=400, detail="请求体不是有效的JSON")
+            return str(data.get("gender", "")), str(data.get("voice_label", ""))
+        form = await request.form()
+        return str(form.get("gender", "")), str(form.get("voice_label", ""))
+
+    @app.post("/synthesize")
+    @app.post("/confirm_script")
+    async def route_synthesis(request: Request):
+        body = await request.body()
+        gender, voice_label = await voice_of(request, body)
+        replica = pool.choose(gender, voice_label)
+        resp = await forward(replica, request, body)
+        if resp.headers.get("content-type", "").startswith("application/json"):
+            data = resp.json()
+            if data.get("task_id"):
+                task_routes[data["task_id"]] = replica
+            remember_files(replica, data)
+        return to_response(resp)
+
+    @app.post("/synthesis_batches")
+    async def route_batch(request: Request):
+        body = await request.body()
+        gender, voice_label = "", ""
+        if "application/json" in request.headers.get("content-type", ""):
+            # 批量任务整体发往第一个条目音色所在的副本
+            try:
+                items = json.loads(body or b"{}").get("items") or [{}]
+                gender, voice_label = str(items[0].get("gender", "")), str(items[0].get("voice_label", ""))
+            except (ValueError, AttributeError, TypeError):
+                pass
+        replica = pool.choose(gender, voice_label)
+        resp = await forward(replica, request, body)
+        if resp.headers.get("content-type", "").startswith("application/json"):
+            data = resp.json()
+            if data.get("batch_id"):
+                task_routes[data["batch_id"]] = replica
+        return to_response(resp)
+
+    @app.api_route("/synthesis_batches/{batch_id}", methods=["GET", "DELETE"])
+    async def route_batch_status(batch_id: str, request: Request):
+        replica = task_routes.get(batch_id)
+        if replica is None:
+            raise HTTPException(status_code=404, detail="批量任务不存在")
+        resp = await forward(replica, request, await request.body())
+        if resp.headers.get("content-type", "").startswith("application/json"):
+            remember_files(replica, resp.json())
+        return to_response(resp)
+
+    @app.get("/synthesis_tasks/events")
+    async def route_task_events(task_ids: str):
+        """按任务所在副本拆分订阅，各副本的事件流合并后转发"""
+        by_replica: Dict[str, List[str]] = {}
+        replicas: Dict[str, Replica] = {}
+        missing = []
+        for task_id in dict.fromkeys(t.strip() for t in task_ids.split(",") if t.strip()):
+            replica = task_routes.get(task_id)
+            if replica is None:
+                missing.append(task_id)
+            else:
+                by_replica.setdefault(replica.url, []).append(task_id)
+                replicas[replica.url] = replica
+        if not by_replica:
+            raise HTTPException(status_code=404, detail="任务不存在")
+
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def pump(replica: Replica, ids: List[str]):
+            """逐条读取副本的事件（以空行分隔），放入合并队列"""
+            try:
+                request = client.build_request("GET", f"{replica.url}/synthesis_tasks/events",
+                                               params={"task_ids": ",".join(ids)})
+                upstream = await client.send(request, stream=True)
+                try:
+                    block = ""
+                    async for line in upstream.aiter_lines():
+                        if line.startswith("data: "):
+                            try:
+                                remember_files(replica, json.loads(line[6:]))
+                            except ValueError:
+                                pass
+                        block += line + "\n"
+                        if not line:
+                            await queue.put(block)
+                            block = ""
+                finally:
+                    await upstream.aclose()
+            except httpx.HTTPError as e:
+                await queue.put(f"event: error\ndata: {json.dumps({'task_ids': ids, 'detail': str(e)})}\n\n")
+            finally:
+                await queue.put(None)
+
+        async def merged():
+            for task_id in missing:
+                yield f"event: missing\ndata: {json.dumps({'task_id': task_id})}\n\n"
+            pumps = [asyncio.create_task(pump(replicas[url], ids)) for url, ids in by_replica.items()]
+            remaining = len(pumps)
+            try:
+                while remaining:
+                    block = await queue.get()
+                    if block is None:
+                        remaining -= 1
+                    else:
+                        yield block
+            finally:
+                for task in pumps:
+                    task.cancel()
+
+        return StreamingResponse(merged(), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    @app.delete("/synthesis_tasks/{task_id}")
+    @app.api_route("/synthesis_tasks/{task_id}/{rest:path}", methods=["GET", "DELETE", "POST"])
+    async def route_task(task_id: str, request: Request, rest: str = ""):
+        replica = task_routes.get(task_id)
+        if replica is None:
+            raise HTTPException(status_code=404, detail="任务不存在")
+        resp = await forward(replica, request, await request.body())
+        if resp.headers.get("content-type", "").startswith("application/json"):
+            remember_files(replica, resp.json())
+        return to_response(resp)
+
+    @app.api_route("/output/{path:path}", methods=["GET", "HEAD"])
+    @app.api_route("/client_output/{path:path}", methods=["GET", "HEAD"])
+    async def route_file(path: str, request: Request):
+        replica = file_routes.get(request.url.path)
+        if replica is None:
+            # 路由重启后不知道文件在哪个副本上，逐个询问
+            for candidate in [r for r in pool.replicas.values() if r.healthy]:
+                try:
+                    if (await client.head(f"{candidate.url}{request.url.path}", timeout=2.0)).status_code == 200:
+                        replica = file_routes[request.url.path] = candidate
+                        break
+                except httpx.HTTPError:
+                    continue
+        if replica is None:
+            raise HTTPException(status_code=404, detail="文件不存在")
+        headers = {k: v for k, v in request.headers.items() if k.lower() in FILE_REQUEST_HEADERS}
+        url = f"{replica.url}{request.url.path}"
+        if request.url.query:
+            url += f"?{request.url.query}"
+        try:
+            upstream = await client.send(client.build_request(request.method, url, headers=headers), stream=True)
+        except httpx.TransportError as e:
+            replica.healthy = False
+            pool.set_ready(replica, False)
+            raise HTTPException(status_code=502, detail=f"TTS副本不可用: {str(e)}")
+        response_headers = {k: v for k, v in upstream.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+        return StreamingResponse(upstream.aiter_raw(), status_code=upstream.status_code, headers=response_headers,
+                                 background=BackgroundTask(upstream.aclose))
+
+    @app.get("/router/replicas")
+    async def list_replicas():
+        """各副本的状态、负载、亲和命中和提示缓存命中率"""
+        return JSONResponse({
+            "success": True,
+            "max_queue": pool.max_queue,
+            "replicas": [r.snapshot() for r in pool.replicas.values()],
+        })
+
+    @app.post("/router/replicas")
+    async def add_replica(url: str, request: Request):
+        """加入新副本，探测就绪后进入哈希环（需要 TTS_ROUTER_ADMIN_TOKEN）"""
+        require_admin_token(request, "TTS_ROUTER_ADMIN_TOKEN")
+        replica = pool.add(url)
+        await probe(replica)
+        return JSONResponse({"success": True, "replica": replica.snapshot()})
+
+    @app.delete("/router/replicas")
+    async def remove_replica(url: str, request: Request):
+        """移除副本，它负责的音色会重新分配给其他副本（需要 TTS_ROUTER_ADMIN_TOKEN）"""
+        require_admin_token(request, "TTS_ROUTER_ADMIN_TOKEN")
+        pool.remove(url)
+        return JSONResponse({"success": True})
+
+    @app.get("/health")
+    async def health_check():
+        return JSONResponse({"status": "ok", "message": "TTS路由正常运行"})
+
+    @app.get("/ready")
+    async def readiness_check():
+        ready = any(r.ready for r in pool.replicas.values())
+        return JSONResponse({"ready": ready}, status_code=200 if ready else 503)
+
+    @app.api_route("/{path:path}", methods=["GET"])
+    async def route_any(path: str, request: Request):
+        """音色列表、已保存音频等无状态请求转发给任一就绪副本"""
+        replica = pool.any_ready()
+        return to_response(await forward(replica, request, b""))
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="魔声AI语音合成音色亲和路由")
+    parser.add_argument("--replica", action="append", default=[],
+                        help="TTS副本地址，可重复；也可用逗号分隔写在 TTS_REPLICAS 环境变量中")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--max-queue", type=int, default=int(os.environ.get("TTS_ROUTER_MAX_QUEUE", "8")),
+                        help="副本排队任务数达到该值时溢出到其他副本")
+    parser.add_argument("--probe-interval", type=float, default=1.0, help="探测副本状态的间隔（秒）")
+    parser.add_argument("--trusted-proxy", action="append", default=[],
+                        help="可信的上游代理地址（如后端网关），可重复；也可用逗号分隔写在 TTS_ROUTER_TRUSTED_PROXIES 中")
+    args = parser.parse_args()
+
+    replicas = args.replica or [u for u in os.environ.get("TTS_REPLICAS", "").split(",") if u]
+    if not replicas:
+        parser.error("至少需要一个 --replica")
+
+    import uvicorn
+    trusted = set(args.trusted_proxy or [u for u in os.environ.get("TTS_ROUTER_TRUSTED_PROXIES", "").split(",") if u])
+    uvicorn.run(create_router_app(replicas, args.max_queue, args.probe_interval, trusted),
+                host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
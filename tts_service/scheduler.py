@@ -0,0 +1,396 @@
+import heapq
+import itertools
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+# 优先级类别，从高到低：交互试听、最终成品、批量任务、预测性预合成
+PRIORITY_CLASSES = ("interactive", "final", "batch", "speculative")
+PRIORITY_RANK = {name: rank for rank, name in enumerate(PRIORITY_CLASSES)}
+
+_sequence = itertools.count()
+_local = threading.local()
+
+
+def current_job() -> Optional["Job"]:
+    """当前推理线程正在执行的任务"""
+    return getattr(_local, "job", None)
+
+
+class JobCancelled(BaseException):
+    """
+    任务已被取消。与 asyncio.CancelledError 一样继承 BaseException，
+    不会被合成代码里通用的 except Exception 当作普通失败吞掉
+    """
+
+
+def raise_if_cancelled():
+    """当前任务已被请求取消时抛出 JobCancelled，在分段边界调用"""
+    job = current_job()
+    if job is not None and job.cancel_requested:
+        raise JobCancelled(job.job_id)
+
+
+class Job:
+    """
+    一个排队等待推理的合成任务
+
+    Args:
+        job_id: 任务ID
+        tenant: 租户标识（用户ID或客户端IP），用于公平调度
+        cost: 任务代价，按文本分段数计算，同一类别内短任务优先
+        fn: 实际执行合成的函数，在推理线程中调用
+        priority: 优先级类别，见 PRIORITY_CLASSES
+    """
+
+    def __init__(self, job_id: str, tenant: str, cost: int, fn: Callable[[], Any], priority: str = "interactive"):
+        if priority not in PRIORITY_RANK:
+            raise ValueError(f"未知的优先级类别: {priority}")
+        self.job_id = job_id
+        self.tenant = tenant
+        self.cost = max(1, int(cost))
+        self.fn = fn
+        self.priority = priority
+        self.seq = next(_sequence)
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # 被更高优先级任务插队的次数和时间
+        self.preemptions = 0
+        self.preempted_seconds = 0.0
+        # 执行中被取消时置位，任务在下一个分段边界停止
+        self.cancel_requested = False
+        self.future: Future = Future()
+
+    @property
+    def rank(self) -> int:
+        return PRIORITY_RANK[self.priority]
+
+    def run(self):
+        """在推理线程中执行任务，并把结果或异常写入 future"""
+        if not self.future.set_running_or_notify_cancel():
+            return
+        previous = current_job()
+        _local.job = self
+        self.started_at = time.monotonic()
+        try:
+            result = self.fn()
+        except BaseException as e:
+            self.finished_at = time.monotonic()
+            self.future.set_exception(e)
+        else:
+            self.finished_at = time.monotonic()
+            self.future.set_result(result)
+        finally:
+            _local.job = previous
+
+    def timings(self) -> dict:
+        """排队时间、计算时间（不含被插队的时间）与被插队时间（秒）"""
+        timings = {}
+        if self.started_at is not None:
+            timings["queue_seconds"] = round(self.started_at - self.enqueued_at, 3)
+            if self.finished_at is not None:
+                compute = self.finished_at - self.started_at - self.preempted_seconds
+                timings["compute_seconds"] = round(compute, 3)
+            if self.preemptions:
+                timings["preempted_seconds"] = round(self.preempted_seconds, 3)
+        return timings
+
+
+class _ClassQueue:
+    """
+    单个优先级类别内的队列：租户之间做赤字轮询（Deficit Round Robin），
+    同一租户内按分段数短任务优先（SJF）
+    """
+
+    def __init__(self, quantum: int):
+        self.quantum = quantum
+        self.heaps: Dict[str, List[Tuple[int, int, Job]]] = {}
+        self.deficit: Dict[str, int] = {}
+        self.active: Deque[str] = deque()
+        self.visiting = False
+
+    def push(self, job: Job):
+        heap = self.heaps.get(job.tenant)
+        if heap is None:
+            heap = self.heaps[job.tenant] = []
+            self.deficit[job.tenant] = 0
+            self.active.append(job.tenant)
+        heapq.heappush(heap, (job.cost, job.seq, job))
+
+    def pop(self) -> Optional[Job]:
+        while self.active:
+            tenant = self.active[0]
+            heap = self.heaps[tenant]
+            if not self.visiting:
+                self.deficit[tenant] += self.quantum
+                self.visiting = True
+            if heap and heap[0][0] <= self.deficit[tenant]:
+                _, _, job = heapq.heappop(heap)
+                self.deficit[tenant] -= job.cost
+                if not heap:
+                    # 队列空了，租户离开轮询，额度清零
+                    self.active.popleft()
+                    del self.heaps[tenant]
+                    del self.deficit[tenant]
+                    self.visiting = False
+                return job
+            # 本轮额度用完，轮到下一个租户
+            self.active.rotate(-1)
+            self.visiting = False
+        return None
+
+    def jobs(self) -> List[Job]:
+        return [job for heap in self.heaps.values() for _, _, job in heap]
+
+    def remove(self, match: Callable[[Job], bool]) -> List[Job]:
+        """移除所有满足条件的排队任务，返回被移除的任务"""
+        removed = []
+        for tenant in list(self.heaps):
+            heap = self.heaps[tenant]
+            kept = [entry for entry in heap if not match(entry[2])]
+            if len(kept) == len(heap):
+                continue
+            removed.extend(entry[2] for entry in heap if match(entry[2]))
+            if kept:
+                heapq.heapify(kept)
+                self.heaps[tenant] = kept
+            else:
+                # 租户没有排队任务了，离开轮询
+                if self.active and self.active[0] == tenant:
+                    self.visiting = False
+                self.active.remove(tenant)
+                del self.heaps[tenant]
+                del self.deficit[tenant]
+        return removed
+
+    def __len__(self) -> int:
+        return sum(len(heap) for heap in self.heaps.values())
+
+
+class FairShareQueue:
+    """
+    带优先级类别的公平调度队列
+
+    类别之间按优先级严格排序：交互试听 > 最终成品 > 批量 > 预测性预合成。
+    每个类别内部，租户之间做赤字轮询，每轮给一个租户 quantum 个分段的额度，
+    这样批量提交长文本的用户不会饿死其他用户；同一租户的任务短的优先。
+    除预测性任务外，低优先级任务等待超过 starvation_seconds 后会被优先服务一次，防止饿死。
+
+    Args:
+        quantum: 每轮分配给一个租户的额度（分段数）
+        starvation_seconds: 低优先级任务的最长等待时间，None 表示严格优先级
+    """
+
+    def __init__(self, quantum: int = 4, starvation_seconds: Optional[float] = 60.0):
+        self.quantum = quantum
+        self.starvation_seconds = starvation_seconds
+        self._classes: Dict[str, _ClassQueue] = {name: _ClassQueue(quantum) for name in PRIORITY_CLASSES}
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._running: Dict[int, Job] = {}
+
+    def put(self, job: Job):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("任务队列已关闭")
+            self._classes[job.priority].push(job)
+            stats = self._tenant_stats(job.tenant)
+            stats["submitted"] += 1
+            self._cond.notify()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Job]:
+        """取出下一个任务；队列关闭或超时返回 None"""
+        with self._cond:
+            while True:
+                job = self._pop_locked()
+                if job is not None:
+                    self._record_dispatch(job)
+                    return job
+                if self._closed:
+                    return None
+                if not self._cond.wait(timeout) and timeout is not None:
+                    return None
+
+    def _pop_locked(self, above_rank: Optional[int] = None) -> Optional[Job]:
+        if above_rank is None and self.starvation_seconds is not None:
+            now = time.monotonic()
+            for name in PRIORITY_CLASSES[1:-1]:
+                jobs = self._classes[name].jobs()
+                if jobs and now - min(job.enqueued_at for job in jobs) > self.starvation_seconds:
+                    return self._classes[name].pop()
+        for rank, name in enumerate(PRIORITY_CLASSES):
+            if above_rank is not None and rank >= above_rank:
+                return None
+            job = self._classes[name].pop()
+            if job is not None:
+                return job
+        return None
+
+    def _record_dispatch(self, job: Job):
+        stats = self._tenant_stats(job.tenant)
+        stats["dispatched"] += 1
+        stats["wait_seconds_total"] += time.monotonic() - job.enqueued_at
+        self._running[job.seq] = job
+        job.future.add_done_callback(lambda _, job=job: self._job_done(job))
+
+    def _job_done(self, job: Job):
+        with self._cond:
+            self._running.pop(job.seq, None)
+
+    def cancel(self, task_id: str) -> Dict[str, List[Job]]:
+        """
+        取消任务：排队中的作业直接移出队列（future 以 JobCancelled 结束），执行中的作业标记取消，
+        由其在下一个分段边界停止。作业ID为 task_id 或以 "task_id:" 开头（如试听续合成）的都算
+
+        Returns:
+            Dict: {"queued": 移出队列的作业, "running": 已标记取消的执行中作业}
+        """
+        def match(job: Job) -> bool:
+            return job.job_id == task_id or job.job_id.startswith(f"{task_id}:")
+
+        with self._cond:
+            queued = [job for queue in self._classes.values() for job in queue.remove(match)]
+            running = [job for job in self._running.values() if match(job)]
+            for job in running:
+                job.cancel_requested = True
+        for job in queued:
+            job.future.set_exception(JobCancelled(job.job_id))
+        return {"queued": queued, "running": running}
+
+    def promote(self, job: Job, priority: str) -> bool:
+        """
+        把仍在排队的作业提升到更高的优先级类别（如预合成任务被交互请求合并时）
+
+        Returns:
+            bool: 是否提升；作业已开始执行或优先级不更高时返回 False
+        """
+        if PRIORITY_RANK[priority] >= job.rank:
+            return False
+        with self._cond:
+            if not self._classes[job.priority].remove(lambda queued: queued is job):
+                return False
+            job.priority = priority
+            self._classes[priority].push(job)
+            self._cond.notify()
+        return True
+
+    def preempt_point(self) -> float:
+        """
+        在分段边界调用：如果有比当前任务优先级更高的任务在排队，先在当前线程执行它们，
+        当前任务随后从下一段继续
+
+        当前任务已被取消时抛出 JobCancelled
+
+        Returns:
+            float: 执行插队任务花费的秒数
+        """
+        raise_if_cancelled()
+        job = current_job()
+        if job is None or job.rank == 0:
+            return 0.0
+        spent = 0.0
+        while True:
+            with self._cond:
+                higher = self._pop_locked(above_rank=job.rank)
+                if higher is None:
+                    break
+                self._record_dispatch(higher)
+            started = time.monotonic()
+            try:
+                higher.run()
+            except Exception:
+                traceback.print_exc()
+            spent += time.monotonic() - started
+            job.preemptions += 1
+        job.preempted_seconds += spent
+        # 插队期间可能收到了取消请求
+        raise_if_cancelled()
+        return spent
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _tenant_stats(self, tenant: str) -> Dict[str, float]:
+        stats = self._stats.get(tenant)
+        if stats is None:
+            stats = self._stats[tenant] = {
+                "submitted": 0,
+                "dispatched": 0,
+                "wait_seconds_total": 0.0,
+            }
+        return stats
+
+    def depth(self) -> int:
+        with self._cond:
+            return sum(len(queue) for queue in self._classes.values())
+
+    def in_flight(self) -> int:
+        """已取出、正在执行的任务数（包括插队执行的任务）"""
+        with self._cond:
+            return len(self._running)
+
+    def class_snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """按优先级类别汇总的队列指标"""
+        now = time.monotonic()
+        with self._cond:
+            classes = {}
+            for name, queue in self._classes.items():
+                jobs = queue.jobs()
+                classes[name] = {
+                    "queued_jobs": len(jobs),
+                    "queued_segments": sum(job.cost for job in jobs),
+                    "oldest_wait_seconds": round(now - min(job.enqueued_at for job in jobs), 3) if jobs else 0.0,
+                }
+            return classes
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """按租户汇总的队列指标"""
+        now = time.monotonic()
+        with self._cond:
+            queued: Dict[str, List[Job]] = {}
+            for queue in self._classes.values():
+                for job in queue.jobs():
+                    queued.setdefault(job.tenant, []).append(job)
+            tenants: Dict[str, Dict[str, Any]] = {}
+            for tenant, stats in self._stats.items():
+                jobs = queued.get(tenant, [])
+                dispatched = stats["dispatched"]
+                tenants[tenant] = {
+                    "queued_jobs": len(jobs),
+                    "queued_segments": sum(job.cost for job in jobs),
+                    "oldest_wait_seconds": round(now - min(job.enqueued_at for job in jobs), 3) if jobs else 0.0,
+                    "submitted": int(stats["submitted"]),
+                    "dispatched": int(dispatched),
+                    "avg_wait_seconds": round(stats["wait_seconds_total"] / dispatched, 3) if dispatched else 0.0,
+                }
+            return tenants
+
+
+def start_workers(queue: FairShareQueue, count: int, name: str = "tts-worker") -> List[threading.Thread]:
+    """
+    启动推理线程，每个线程循环从队列取任务执行，直到队列关闭
+    """
+
+    def worker():
+        while True:
+            job = queue.get()
+            if job is None:
+                return
+            try:
+                job.run()
+            except Exception:
+                traceback.print_exc()
+
+    threads = []
+    for i in range(count):
+        thread = threading.Thread(target=worker, name=f"{name}-{i}", daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
@@ -0,0 +1,109 @@
+"""
+相同请求合并（single-flight）：新提交的任务与排队中或执行中的任务完全相同时，不再另起一次推理，
+而是挂到已有作业上共享结果。按订阅者引用计数，只有最后一个订阅者取消时才真正取消作业
+"""
+import threading
+from typing import Any, Dict, Hashable, List, Optional
+
+
+class Flight:
+    """
+    一次正在进行的合成
+
+    Args:
+        key: 合并键，如 (任务类型, 文本, 性别, 声音标签)
+        leader: 实际执行作业的任务ID
+        job: 调度队列中的作业
+        source: 作业写入状态和结果的任务字典，订阅者的状态从这里同步
+    """
+
+    def __init__(self, key: Hashable, leader: str, job: Any, source: Dict[str, Any]):
+        self.key = key
+        self.leader = leader
+        self.job = job
+        self.source = source
+        # 仍在等待结果的任务ID（含 leader），按加入顺序
+        self.subscribers: List[str] = [leader]
+        # 最后一个订阅者取消后关闭，不再接受新的订阅者
+        self.closed = False
+
+    def followers(self) -> List[str]:
+        return [task_id for task_id in self.subscribers if task_id != self.leader]
+
+
+class SingleFlight:
+    """按合并键登记进行中的作业，所有方法线程安全"""
+
+    def __init__(self):
+        self._open: Dict[Hashable, Flight] = {}
+        self._by_task: Dict[str, Flight] = {}
+        self._lock = threading.Lock()
+        self.started = 0
+        self.coalesced = 0
+
+    def join(self, key: Hashable, task_id: str) -> Optional[Flight]:
+        """有相同的进行中作业时把任务挂上去并返回该 Flight，否则返回 None（调用方应调用 start）"""
+        with self._lock:
+            flight = self._open.get(key)
+            if flight is None:
+                return None
+            flight.subscribers.append(task_id)
+            self._by_task[task_id] = flight
+            self.coalesced += 1
+            return flight
+
+    def start(self, key: Hashable, leader: str, job: Any, source: Dict[str, Any]) -> Flight:
+        """登记新作业，须在作业放入队列之前调用"""
+        flight = Flight(key, leader, job, source)
+        with self._lock:
+            self._open[key] = flight
+            self._by_task[leader] = flight
+            self.started += 1
+        return flight
+
+    def flight_of(self, task_id: str) -> Optional[Flight]:
+        return self._by_task.get(task_id)
+
+    def led_by(self, task_id: str) -> Optional[Flight]:
+        """task_id 作为 leader 执行的 Flight"""
+        flight = self._by_task.get(task_id)
+        return flight if flight is not None and flight.leader == task_id else None
+
+    def detach(self, task_id: str) -> bool:
+        """
+        订阅者取消
+
+        Returns:
+            bool: 还有其他订阅者时移除该任务并返回 True，作业继续执行；
+                  它是最后一个订阅者时返回 False，Flight 不再接受新订阅者，由调用方取消作业
+        """
+        with self._lock:
+            flight = self._by_task.get(task_id)
+            if flight is None or task_id not in flight.subscribers:
+                return False
+            if len(flight.subscribers) > 1:
+                flight.subscribers.remove(task_id)
+                if task_id != flight.leader:
+                    del self._by_task[task_id]
+                return True
+            flight.closed = True
+            if self._open.get(flight.key) is flight:
+                del self._open[flight.key]
+            return False
+
+    def finish(self, flight: Flight):
+        """作业结束（完成、失败或取消）后注销"""
+        with self._lock:
+            if self._open.get(flight.key) is flight:
+                del self._open[flight.key]
+            for task_id in [flight.leader, *flight.subscribers]:
+                if self._by_task.get(task_id) is flight:
+                    del self._by_task[task_id]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "in_flight": len(self._open),
+                "started": self.started,
+                "coalesced": self.coalesced,
+            }
@@ -0,0 +1,139 @@
+"""
+音色试听样本构建：把音色库中的提示音频截取成短小、响度统一的低码率片段，文件名带内容哈希以便长期缓存
+
+用法:
+    python -m tts_service.voice_samples --voice-dir prompt_voice --output-dir voice_samples
+"""
+import argparse
+import hashlib
+import json
+import os
+import wave
+from typing import Any, Dict, Optional
+
+import ffmpeg
+
+# 样本时长上限（秒）、响度目标（LUFS）与编码参数；修改后哈希变化，会重新生成全部样本
+SAMPLE_SECONDS = 8.0
+LOUDNESS_TARGET = -16
+SAMPLE_FORMATS = {
+    "mp3": {"acodec": "libmp3lame", "audio_bitrate": "64k", "ar": 24000, "format": "mp3"},
+    "opus": {"acodec": "libopus", "audio_bitrate": "32k", "ar": 48000, "format": "ogg"},
+}
+MANIFEST_NAME = "manifest.json"
+GENDER_DIRS = {"male": "男声", "female": "女声"}
+
+
+def _content_hash(path: str) -> str:
+    """源音频内容与构建参数共同决定的哈希"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([SAMPLE_SECONDS, LOUDNESS_TARGET, SAMPLE_FORMATS], sort_keys=True).encode("utf-8"))
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def _encode_sample(source_path: str, target_path: str, options: Dict[str, Any]):
+    """截取开头部分、做响度归一化并编码为单声道低码率片段"""
+    temp_path = f"{target_path}.tmp"
+    (
+        ffmpeg
+        .input(source_path, t=SAMPLE_SECONDS)
+        .filter("loudnorm", I=LOUDNESS_TARGET, TP=-1.5, LRA=11)
+        .output(temp_path, ac=1, **options)
+        .run(quiet=True, overwrite_output=True)
+    )
+    os.replace(temp_path, target_path)
+
+
+def _duration(source_path: str) -> float:
+    """样本时长：源音频时长与截取上限中较小的一个"""
+    if source_path.endswith(".wav"):
+        with wave.open(source_path, "rb") as f:
+            seconds = f.getnframes() / float(f.getframerate())
+    else:
+        seconds = float(ffmpeg.probe(source_path)["format"]["duration"])
+    return round(min(seconds, SAMPLE_SECONDS), 2)
+
+
+def build_voice_samples(voice_dir: str, output_dir: str) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """
+    为音色库中的每个音色生成试听样本，已存在的样本（哈希相同）直接复用，并写入清单文件
+
+    Args:
+        voice_dir: 音色库目录（包含 male/female 子目录）
+        output_dir: 样本输出目录
+
+    Returns:
+        Dict: {性别: {声音标签: {"mp3": 相对路径, "opus": 相对路径, "duration": 秒数}}}
+    """
+    previous = load_manifest(output_dir) or {}
+    manifest: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    built = 0
+    for gender_dir, gender_cn in GENDER_DIRS.items():
+        source_dir = os.path.join(voice_dir, gender_dir)
+        if not os.path.isdir(source_dir):
+            continue
+        os.makedirs(os.path.join(output_dir, gender_dir), exist_ok=True)
+        manifest[gender_cn] = {}
+        for file in sorted(os.listdir(source_dir)):
+            if not (file.endswith(".wav") or file.endswith(".mp3")):
+                continue
+            voice_label = os.path.splitext(file)[0]
+            source_path = os.path.join(source_dir, file)
+            content_hash = _content_hash(source_path)
+            entry: Dict[str, Any] = {}
+            for name, options in SAMPLE_FORMATS.items():
+                extension = "opus" if name == "opus" else name
+                relative_path = f"{gender_dir}/{voice_label}.{content_hash}.{extension}"
+                target_path = os.path.join(output_dir, relative_path)
+                if not os.path.exists(target_path):
+                    _encode_sample(source_path, target_path, options)
+                    built += 1
+                entry[name] = relative_path
+            old_entry = previous.get(gender_cn, {}).get(voice_label)
+            if old_entry and old_entry.get("mp3") == entry["mp3"] and "duration" in old_entry:
+                entry["duration"] = old_entry["duration"]
+            else:
+                entry["duration"] = _duration(source_path)
+            manifest[gender_cn][voice_label] = entry
+
+    # 删除已不在清单中的旧样本
+    current = {path for voices in manifest.values() for entry in voices.values()
+               for key, path in entry.items() if key in SAMPLE_FORMATS}
+    for gender_dir in GENDER_DIRS:
+        sample_dir = os.path.join(output_dir, gender_dir)
+        if not os.path.isdir(sample_dir):
+            continue
+        for file in os.listdir(sample_dir):
+            if f"{gender_dir}/{file}" not in current:
+                os.remove(os.path.join(sample_dir, file))
+
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(f"{manifest_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+    print(f"音色试听样本构建完成，新生成{built}个文件")
+    return manifest
+
+
+def load_manifest(output_dir: str) -> Optional[Dict[str, Dict[str, Dict[str, Any]]]]:
+    """读取样本清单，不存在时返回None"""
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="构建音色试听样本")
+    parser.add_argument("--voice-dir", default="prompt_voice", help="音色库目录")
+    parser.add_argument("--output-dir", default="voice_samples", help="样本输出目录")
+    args = parser.parse_args()
+    build_voice_samples(args.voice_dir, args.output_dir)
+
+
+if __name__ == "__main__":
+    main()